@@ -1,10 +1,17 @@
 import pandas as pd
 import numpy as np
+import os
 import re
+import time
+import threading
+import itertools
+import json
+import hashlib
 import spacy
+from spacy.pipeline import Sentencizer
 import nltk
 from nltk.corpus import stopwords
-from collections import Counter
+from collections import Counter, OrderedDict
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sentence_transformers import SentenceTransformer
@@ -22,19 +29,129 @@ except Exception as e:
     print(f"Advertencia al descargar recursos NLTK: {e}")
 
 
+# Componentes de spaCy que necesita cada tarea. Las oraciones del resumen salen de un
+# Sentencizer (reglas de puntuación) en lugar del parser de dependencias.
+PERFILES_SPACY = {
+    'tokens': set(),
+    'entidades': {'ner'},
+    'temas': {'morphologizer', 'tagger', 'attribute_ruler', 'lemmatizer'},
+    'resumen': {'sentencizer'},
+    'completo': None        # pipeline completo (incluye el parser)
+}
+
+# Tareas de procesar_texto_largo / procesar_lote (todo menos el parser)
+TAREAS_DOCUMENTO = ('entidades', 'temas', 'resumen')
+
+# Subir cuando cambie la lógica de extracción, para invalidar resultados guardados en caché
+VERSION_RESULTADOS = 1
+
+
+def _memoria_rss_mb() -> float:
+    """Memoria residente (RSS) actual del proceso en MB (0.0 si no se puede medir)"""
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except Exception:
+            return 0.0
+
+
+class RegistroModelos:
+    """
+    Registro de modelos de PLN compartido por todo el proceso.
+
+    Cada modelo se carga una sola vez, la primera vez que se pide, y se
+    reutiliza en todas las instancias de PLN. Si la aplicación se lanza con
+    `gunicorn --preload` y PLN_PRECARGAR=true, los modelos se cargan antes del
+    fork y los workers los comparten por copy-on-write.
+    """
+    _modelos: Dict[str, object] = {}
+    _estadisticas: Dict[str, Dict] = {}
+    _lock = threading.RLock()
+
+    @staticmethod
+    def _clave_embeddings(nombre: str) -> str:
+        """Normaliza el nombre del modelo de embeddings ('sentence-transformers/x' == 'x')"""
+        return nombre.split('sentence-transformers/', 1)[-1]
+
+    @classmethod
+    def _obtener(cls, clave: str, cargador):
+        """Retorna el modelo registrado bajo `clave`, cargándolo si aún no existe"""
+        modelo = cls._modelos.get(clave)
+        if modelo is not None:
+            return modelo
+
+        with cls._lock:
+            if clave in cls._modelos:
+                return cls._modelos[clave]
+
+            memoria_antes = _memoria_rss_mb()
+            inicio = time.perf_counter()
+            modelo = cargador()             # si falla, la excepción llega al llamador
+            segundos = time.perf_counter() - inicio
+            memoria_mb = max(_memoria_rss_mb() - memoria_antes, 0.0)
+
+            cls._modelos[clave] = modelo
+            cls._estadisticas[clave] = {
+                'modelo': clave,
+                'segundos_carga': round(segundos, 2),
+                'memoria_mb': round(memoria_mb, 1),
+                'pid': os.getpid(),
+                'fecha_carga': datetime.now().isoformat()
+            }
+            print(f"[MODELOS] '{clave}' cargado en {segundos:.1f} s (+{memoria_mb:.0f} MB)")
+            return modelo
+
+    @classmethod
+    def obtener_spacy(cls, nombre: str):
+        """Retorna el pipeline de spaCy `nombre` (cargado una sola vez por proceso)"""
+        def cargar():
+            nlp = spacy.load(nombre)
+            nlp.max_length = 3_000_000  # permite textos largos
+            return nlp
+        return cls._obtener(f"spacy:{nombre}", cargar)
+
+    @classmethod
+    def obtener_embeddings(cls, nombre: str):
+        """Retorna el SentenceTransformer `nombre` (cargado una sola vez por proceso)"""
+        clave = cls._clave_embeddings(nombre)
+        return cls._obtener(f"embeddings:{clave}", lambda: SentenceTransformer(clave))
+
+    @classmethod
+    def estadisticas(cls) -> List[Dict]:
+        """Tiempo de carga y memoria de cada modelo cargado en este proceso"""
+        return list(cls._estadisticas.values())
+
+    @classmethod
+    def limpiar(cls):
+        """Descarga todos los modelos del registro"""
+        with cls._lock:
+            cls._modelos.clear()
+            cls._estadisticas.clear()
+
+
 class PLN:
     """Clase para procesamiento de lenguaje natural en español"""
     
     def __init__(self, modelo_spacy: str = 'es_core_news_lg', 
                  modelo_embeddings: str = 'paraphrase-multilingual-MiniLM-L12-v2',
-                 cargar_modelos: bool = True):
+                 cargar_modelos: bool = True, max_docs_cache: int = 0,
+                 max_caracteres_cache: int = 100_000):
         """
         Inicializa la clase PLN con los modelos necesarios
         
         Args:
             modelo_spacy: Nombre del modelo de spaCy a cargar
             modelo_embeddings: Nombre del modelo de SentenceTransformer
-            cargar_modelos: Si True, carga los modelos al inicializar (puede tardar)
+            cargar_modelos: Si True, obtiene los modelos del RegistroModelos
+                (solo la primera instancia del proceso paga el tiempo de carga)
+            max_docs_cache: Docs de spaCy que `analizar` guarda para reutilizarlos entre
+                extractores del mismo texto (0 = sin caché; cada Doc ocupa mucha memoria)
+            max_caracteres_cache: Solo se guardan en caché Docs de textos hasta este largo
         """
         self.modelo_spacy_nombre = modelo_spacy
         self.modelo_embeddings_nombre = modelo_embeddings
@@ -43,30 +160,37 @@ class PLN:
         self.stopwords_es = None
         self.ner_legal = None
         self.embedder = None
+
+        self.sentencizer = Sentencizer()
+
+        # Docs de spaCy ya analizados (texto -> (Doc, tareas)); opcional y solo para textos cortos
+        self.max_docs_cache = max_docs_cache
+        self.max_caracteres_cache = max_caracteres_cache
+        self._docs_cache = OrderedDict()
+        self._lock_docs = threading.Lock()
         
         if cargar_modelos:
             self._cargar_modelos()
     
     def _cargar_modelos(self):
-        """Carga los modelos de PLN necesarios"""
+        """Obtiene los modelos de PLN necesarios desde el registro del proceso"""
         try:
             print("Cargando modelo de spaCy...")
-            self.nlp = spacy.load(self.modelo_spacy_nombre)
-            self.nlp.max_length = 3_000_000  # permite textos largos
+            self.nlp = RegistroModelos.obtener_spacy(self.modelo_spacy_nombre)
             print(f"Modelo spaCy '{self.modelo_spacy_nombre}' cargado correctamente")
         except OSError:
             print(f"Error: Modelo '{self.modelo_spacy_nombre}' no encontrado.")
             print(f"Ejecuta: python -m spacy download {self.modelo_spacy_nombre}")
             print("Usando modelo básico de spaCy...")
             try:
-                self.nlp = spacy.load('es_core_news_sm')
+                self.nlp = RegistroModelos.obtener_spacy('es_core_news_sm')
             except OSError:
                 print("Error: No se pudo cargar ningún modelo de spaCy")
                 self.nlp = None
         
         try:
             print("Cargando modelo de embeddings...")
-            self.model_embeddings = SentenceTransformer(self.modelo_embeddings_nombre)
+            self.model_embeddings = RegistroModelos.obtener_embeddings(self.modelo_embeddings_nombre)
             print(f"Modelo de embeddings '{self.modelo_embeddings_nombre}' cargado correctamente")
         except Exception as e:
             print(f"Error al cargar modelo de embeddings: {e}")
@@ -78,13 +202,92 @@ class PLN:
             nltk.download('stopwords', quiet=True)
             self.stopwords_es = set(stopwords.words('spanish'))
 
-        # Embeddings para encabezado
+        # Embeddings para encabezado (mismo modelo, se reutiliza desde el registro)
         try:
-            self.embedder = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+            self.embedder = RegistroModelos.obtener_embeddings("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
         except:
             print("Error cargando embedder para encabezado")
             self.embedder = None
     
+    def _componentes_deshabilitados(self, tareas) -> List[str]:
+        """
+        Componentes del pipeline de spaCy que no hacen falta para las tareas dadas.
+
+        Args:
+            tareas: Nombres de perfiles de PERFILES_SPACY
+
+        Returns:
+            Lista de componentes a pasar como `disable` a nlp() / nlp.pipe()
+        """
+        if 'completo' in tareas:
+            return []
+
+        necesarios = set()
+        for tarea in tareas:
+            necesarios |= PERFILES_SPACY[tarea]
+
+        # tok2vec solo si alguno de los componentes necesarios lo escucha
+        necesarios &= set(self.nlp.pipe_names)
+        if necesarios and 'tok2vec' in self.nlp.pipe_names:
+            oyentes = getattr(self.nlp.get_pipe('tok2vec'), 'listening_components', None)
+            if oyentes is None or necesarios & set(oyentes):
+                necesarios.add('tok2vec')
+
+        return [nombre for nombre in self.nlp.pipe_names if nombre not in necesarios]
+
+    def _usa_sentencizer(self, tareas) -> bool:
+        """True si las oraciones deben salir del Sentencizer (el parser no se ejecuta)"""
+        return 'resumen' in tareas and 'completo' not in tareas
+
+    def analizar(self, texto: str, tareas=('completo',)):
+        """
+        Analiza el texto con spaCy una sola vez y retorna el Doc.
+
+        Solo se ejecutan los componentes que necesitan las `tareas` (ver PERFILES_SPACY).
+        Con `max_docs_cache` > 0, el Doc de textos de hasta `max_caracteres_cache`
+        caracteres queda en una caché pequeña, de modo que entidades, temas y resumen
+        de un mismo texto salen del mismo análisis. Por defecto no se guarda nada: la
+        instancia es de larga vida y cada Doc retiene el texto y sus vectores.
+
+        Args:
+            texto: Texto a analizar
+            tareas: Perfiles de PERFILES_SPACY que se van a usar sobre el Doc
+
+        Returns:
+            Doc de spaCy
+        """
+        if not self.nlp:
+            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
+
+        tareas = frozenset(tareas)
+        usar_cache = self.max_docs_cache > 0 and len(texto) <= self.max_caracteres_cache
+        if usar_cache:
+            with self._lock_docs:
+                en_cache = self._docs_cache.get(texto)
+                if en_cache is not None:
+                    doc, tareas_doc = en_cache
+                    if 'completo' in tareas_doc or tareas <= tareas_doc:
+                        self._docs_cache.move_to_end(texto)
+                        return doc
+
+        # spaCy se ejecuta fuera del lock; la instancia se comparte entre hilos
+        doc = self.nlp(texto, disable=self._componentes_deshabilitados(tareas))
+        if self._usa_sentencizer(tareas):
+            doc = self.sentencizer(doc)
+
+        if usar_cache:
+            with self._lock_docs:
+                self._docs_cache[texto] = (doc, tareas)
+                self._docs_cache.move_to_end(texto)
+                while len(self._docs_cache) > self.max_docs_cache:
+                    self._docs_cache.popitem(last=False)
+        return doc
+
+    def limpiar_cache(self):
+        """Libera los Docs de spaCy guardados en caché"""
+        with self._lock_docs:
+            self._docs_cache.clear()
+
     def extraer_entidades(self, texto: str) -> Dict[str, List[str]]:
         """
         Extrae entidades nombradas del texto usando spaCy.
@@ -95,11 +298,10 @@ class PLN:
         Returns:
             Diccionario con entidades clasificadas por tipo
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
-        
+        return self._entidades_de_doc(self.analizar(texto, ('entidades',)))
+
+    def _entidades_de_doc(self, doc) -> Dict[str, List[str]]:
+        """Clasifica por tipo las entidades de un Doc ya analizado"""
         entidades = {
             'personas': [],
             'lugares': [],
@@ -140,15 +342,14 @@ class PLN:
         Returns:
             Lista de tuplas (palabra, relevancia)
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
-        
+        return self._temas_de_tokens(self.analizar(texto, ('temas',)), top_n)
+
+    def _temas_de_tokens(self, tokens, top_n: int = 10) -> List[Tuple[str, float]]:
+        """Calcula los temas a partir de tokens ya analizados (un Doc o un subconjunto)"""
         # Filtrar stopwords y tokens no relevantes
         palabras_relevantes = []
         
-        for token in doc:
+        for token in tokens:
             if (not token.is_stop and
                 not token.is_punct and
                 not token.is_space and
@@ -180,10 +381,11 @@ class PLN:
         Returns:
             Resumen del texto
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
+        return self._resumen_de_doc(self.analizar(texto, ('resumen',)), num_oraciones)
+
+    def _resumen_de_doc(self, doc, num_oraciones: int = 3) -> str:
+        """Genera el resumen extractivo a partir de las oraciones de un Doc ya analizado"""
+        texto = doc.text
         oraciones = [sent.text.strip() for sent in doc.sents if len(sent.text.strip()) > 20]
         
         if len(oraciones) <= num_oraciones:
@@ -261,10 +463,7 @@ class PLN:
         Returns:
             Texto preprocesado
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
+        doc = self.analizar(texto, ('temas',))
         palabras_procesadas = []
         
         for token in doc:
@@ -332,10 +531,7 @@ class PLN:
         Returns:
             Lista de nombres propios encontrados
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
+        doc = self.analizar(texto, ('temas',))
         nombres_propios = []
         
         for token in doc:
@@ -356,10 +552,7 @@ class PLN:
         Returns:
             Número de palabras
         """
-        if not self.nlp:
-            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
-        
-        doc = self.nlp(texto)
+        doc = self.analizar(texto, ('tokens',))
         palabras = [token.text.lower() for token in doc 
                    if not token.is_punct and not token.is_space and not token.is_stop]
         
@@ -381,18 +574,43 @@ class PLN:
         return chunks
     
     def procesar_texto_largo(self, texto: str) -> Dict:
-        """Procesa textos largos dividiéndolos en chunks."""
+        """
+        Procesa textos largos dividiéndolos en chunks.
+
+        Cada chunk se analiza con spaCy una sola vez; entidades, temas y resumen
+        se obtienen del mismo Doc.
+        """
         if len(texto) <= 900000:
             # No requiere chunking
-            return {
-                "entidades": self.extraer_entidades(texto),
-                "temas": self.extraer_temas(texto),
-                "resumen": self.generar_resumen(texto)
-            }
+            return self._resultado_de_docs([self.analizar(texto, TAREAS_DOCUMENTO)])
 
         print(f" → Texto demasiado largo ({len(texto)} chars). Dividiendo en chunks…")
         chunks = self.dividir_en_chunks(texto)
 
+        def docs_chunks():
+            for i, parte in enumerate(chunks):
+                print(f"   → Procesando chunk {i+1}/{len(chunks)}")
+                yield self.analizar(parte, TAREAS_DOCUMENTO)
+
+        return self._resultado_de_docs(docs_chunks(), en_chunks=True)
+
+    def _resultado_de_docs(self, docs, en_chunks: bool = False) -> Dict:
+        """
+        Construye el resultado de procesar_texto_largo a partir de los Docs de un texto.
+
+        Args:
+            docs: Docs del texto (uno solo, o uno por chunk en orden)
+            en_chunks: Si True, el texto se dividió en chunks (resumen de 2 oraciones
+                por chunk y temas solo sobre los primeros 500.000 caracteres)
+        """
+        if not en_chunks:
+            doc = next(iter(docs))
+            return {
+                "entidades": self._entidades_de_doc(doc),
+                "temas": self._temas_de_tokens(doc),
+                "resumen": self._resumen_de_doc(doc)
+            }
+
         entidades_total = {
             "personas": [],
             "lugares": [],
@@ -402,17 +620,20 @@ class PLN:
             "otros": []
         }
         resumen_total = ""
+        temas = []
 
-        for i, parte in enumerate(chunks):
-            print(f"   → Procesando chunk {i+1}/{len(chunks)}")
-
+        for i, doc in enumerate(docs):
             # ENTIDADES
-            ents = self.extraer_entidades(parte)
+            ents = self._entidades_de_doc(doc)
             for key in entidades_total:
                 entidades_total[key].extend(ents[key])
 
+            # TEMAS solo sobre la parte inicial (primer chunk, hasta 500.000 caracteres)
+            if i == 0:
+                temas = self._temas_de_tokens(t for t in doc if t.idx < 500000)
+
             # RESUMEN (simple pero funcional)
-            resumen_total += self.generar_resumen(parte, num_oraciones=2) + "\n"
+            resumen_total += self._resumen_de_doc(doc, num_oraciones=2) + "\n"
 
         # Eliminar duplicados de entidades
         for key in entidades_total:
@@ -420,10 +641,117 @@ class PLN:
 
         return {
             "entidades": entidades_total,
-            "temas": self.extraer_temas(texto[:500000]),  # temas solo sobre parte inicial
+            "temas": temas,
             "resumen": resumen_total.strip()
         }
+
+    def procesar_lote(self, textos: List[str], batch_size: int = 8, n_process: int = 1,
+                      incluir_metadatos: bool = True,
+                      incluir_embeddings: bool = False,
+                      batch_size_embeddings: int = 32) -> List[Dict]:
+        """
+        Procesa varios textos en lote con `nlp.pipe`, usando varios procesos si se indica.
+
+        Los textos largos se dividen en chunks igual que en procesar_texto_largo; todos
+        los chunks pasan por un único `nlp.pipe` y se reagrupan por texto.
+
+        Args:
+            textos: Lista de textos a procesar
+            batch_size: Número de textos (chunks) por lote de spaCy
+            n_process: Número de procesos de spaCy (-1 usa todos los núcleos); spaCy los crea con
+                el método de inicio por defecto, que con hilos corriendo no debe ser fork
+                (ver Funciones.contexto_procesos)
+            incluir_metadatos: Si True, agrega 'metadatos' (extraer_metadatos_norma)
+            incluir_embeddings: Si True, agrega 'embedding' del resumen de cada texto
+            batch_size_embeddings: Tamaño de lote para el modelo de embeddings
+
+        Returns:
+            Lista de resultados (mismo formato que procesar_texto_largo), en el
+            mismo orden que `textos`
+        """
+        if not self.nlp:
+            raise ValueError("Modelo de spaCy no está cargado. Llama a _cargar_modelos() primero.")
+
+        if n_process == -1:
+            n_process = os.cpu_count() or 1
+
+        # Chunks de todos los textos, en orden, y cuántos chunks tiene cada texto
+        chunks_por_texto = [self.dividir_en_chunks(t) if len(t) > 900000 else [t] for t in textos]
+        todos_chunks = (c for chunks in chunks_por_texto for c in chunks)
+
+        print(f" → Procesando lote de {len(textos)} textos (batch_size={batch_size}, n_process={n_process})")
+        docs = self.nlp.pipe(todos_chunks, batch_size=batch_size, n_process=n_process,
+                             disable=self._componentes_deshabilitados(TAREAS_DOCUMENTO))
+        docs = (self.sentencizer(doc) for doc in docs)
+
+        resultados = []
+        for i, (texto, chunks) in enumerate(zip(textos, chunks_por_texto), start=1):
+            docs_texto = list(itertools.islice(docs, len(chunks)))
+            resultado = self._resultado_de_docs(docs_texto, en_chunks=len(chunks) > 1)
+            if incluir_metadatos:
+                resultado["metadatos"] = self.extraer_metadatos_norma(texto)
+            resultados.append(resultado)
+            print(f"   → Texto [{i} / {len(textos)}] procesado")
+
+        if incluir_embeddings:
+            embeddings = self.generar_embeddings([r["resumen"] for r in resultados],
+                                                 batch_size=batch_size_embeddings)
+            for resultado, embedding in zip(resultados, embeddings):
+                resultado["embedding"] = embedding.tolist()
+
+        return resultados
+
+    def version_modelos(self) -> str:
+        """Identifica los modelos cargados (nombre y versión) para las claves de caché"""
+        if self.nlp:
+            meta = self.nlp.meta
+            spacy_id = f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"
+        else:
+            spacy_id = "sin_spacy"
+        return f"{spacy_id}|{self.modelo_embeddings_nombre}|resultados-v{VERSION_RESULTADOS}"
+
+    def clave_resultado(self, hash_archivo: str, **parametros) -> str:
+        """
+        Clave de caché del resultado de PLN de un documento.
+
+        Combina el hash del archivo, los modelos (nombre y versión) y los parámetros
+        del procesamiento, de modo que un cambio en cualquiera de ellos da otra clave.
+
+        Args:
+            hash_archivo: Hash del archivo ('sha256:<valor>')
+            **parametros: Parámetros del procesamiento (p. ej. incluir_metadatos=True)
+        """
+        parametros['tareas'] = list(TAREAS_DOCUMENTO)
+        firma = json.dumps({'modelos': self.version_modelos(), 'parametros': parametros}, sort_keys=True)
+        return f"{hash_archivo}|{hashlib.sha256(firma.encode('utf-8')).hexdigest()[:16]}"
+
+    def generar_embeddings(self, textos: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Genera embeddings de varios textos en lotes.
+
+        Args:
+            textos: Lista de textos
+            batch_size: Número de textos por lote
+
+        Returns:
+            Matriz (n_textos x dimensión) en el mismo orden que `textos`
+        """
+        if not self.model_embeddings:
+            raise ValueError("Modelo de embeddings no está cargado. Llama a _cargar_modelos() primero.")
+
+        return self.model_embeddings.encode(textos, batch_size=batch_size, show_progress_bar=False)
     
+    def _entidades_encabezado(self, encabezado: str) -> List[Tuple[str, str]]:
+        """
+        Retorna (etiqueta, texto) de las entidades del encabezado de una norma.
+
+        El encabezado llega en mayúsculas, como en el análisis original; por eso
+        no se reutiliza el Doc del texto completo (distinto uso de mayúsculas da
+        otras entidades) y se analiza solo el encabezado con los componentes de NER.
+        """
+        doc = self.analizar(encabezado, ('entidades',))
+        return [(ent.label_, ent.text) for ent in doc.ents]
+
     def normalizar_fecha(self, texto):
         if not texto:
             return None
@@ -482,8 +810,7 @@ class PLN:
         }
 
         # NER spaCy
-        doc = self.nlp(encabezado)
-        ents = [(ent.label_, ent.text) for ent in doc.ents]
+        ents = self._entidades_encabezado(encabezado)
 
         # ENTIDAD EMISORA
         for label, val in ents:
@@ -3,5 +3,11 @@ from .funciones import Funciones
 from .elastic import ElasticSearch
 #from .webScraping import WebScraping
 from .webScrapingMinAgricultura import WebScrapingMinAgricultura
-from .PLN import PLN
-__all__ = ['MongoDB', 'Funciones', 'ElasticSearch', 'WebScraping', 'PLN', 'WebScrapingMinAgricultura']
\ No newline at end of file
+from .PLN import PLN, RegistroModelos
+from .cacheDisco import CacheDisco
+from .ingesta import PipelineIngesta
+from .bloqueoRecursos import BloqueoRecursos
+from .rastreador import RastreadorBFS, PuntoControlRastreo, RegistroEnlaces
+from .descargas import DescargadorPDF, ManifiestoDescargas
+from .trabajos import GestorTrabajos, ContextoTrabajo, TrabajoCancelado
+__all__ = ['MongoDB', 'Funciones', 'ElasticSearch', 'WebScraping', 'PLN', 'RegistroModelos', 'WebScrapingMinAgricultura', 'CacheDisco', 'PipelineIngesta', 'GestorTrabajos', 'ContextoTrabajo', 'TrabajoCancelado', 'DescargadorPDF', 'ManifiestoDescargas', 'BloqueoRecursos', 'RastreadorBFS', 'PuntoControlRastreo', 'RegistroEnlaces']
\ No newline at end of file
@@ -0,0 +1,86 @@
+from urllib.parse import urlparse
+from typing import Iterable, Dict
+
+
+class BloqueoRecursos:
+    """
+    Modo ligero para Playwright: aborta las peticiones que no hacen falta para leer
+    los enlaces de una página (imágenes, multimedia, fuentes, hojas de estilo y
+    scripts de otros dominios).
+
+    Se aplica a un contexto del navegador con `aplicar` (API síncrona) o
+    `aplicar_async` (API asíncrona). El documento principal y los scripts/XHR del
+    propio sitio siempre se cargan, porque el contenido dinámico depende de ellos.
+    """
+
+    TIPOS_PESADOS = ('image', 'media', 'font', 'stylesheet')
+
+    def __init__(self, url_base: str, tipos: Iterable[str] = TIPOS_PESADOS,
+                 bloquear_scripts_terceros: bool = True, dominios_permitidos: Iterable[str] = ()):
+        """
+        Configura qué se bloquea
+
+        Args:
+            url_base: URL del sitio que se recorre (define qué es "de terceros")
+            tipos: Tipos de recurso de Playwright a bloquear (image, media, font, stylesheet...)
+            bloquear_scripts_terceros: Bloquear también scripts de otros dominios
+            dominios_permitidos: Dominios de terceros cuyos scripts sí se cargan (ej: un CDN necesario)
+        """
+        self.host_base = self._host(url_base)
+        self.tipos = set(tipos or ())
+        self.bloquear_scripts_terceros = bloquear_scripts_terceros
+        self.dominios_permitidos = {self._host(d) if '//' in d else d.lower() for d in dominios_permitidos}
+        self.bloqueadas = 0
+        self.permitidas = 0
+
+    @staticmethod
+    def _host(url: str) -> str:
+        """Host de una URL, sin 'www.'"""
+        host = urlparse(url).netloc.lower().split(':')[0]
+        return host[4:] if host.startswith('www.') else host
+
+    def _mismo_sitio(self, host: str) -> bool:
+        """True si `host` es el sitio base, un subdominio suyo o un dominio permitido"""
+        for dominio in (self.host_base, *self.dominios_permitidos):
+            # Un dominio padre (p. ej. 'gov.co') no es el mismo sitio: lo comparten terceros
+            if host == dominio or host.endswith('.' + dominio):
+                return True
+        return False
+
+    def debe_bloquear(self, tipo_recurso: str, url: str) -> bool:
+        """Decide si se aborta una petición según su tipo de recurso y su URL"""
+        if tipo_recurso in self.tipos:
+            return True
+        if self.bloquear_scripts_terceros and tipo_recurso == 'script':
+            return not self._mismo_sitio(self._host(url))
+        return False
+
+    def _manejar(self, route):
+        """Manejador de rutas para la API síncrona"""
+        if self.debe_bloquear(route.request.resource_type, route.request.url):
+            self.bloqueadas += 1
+            route.abort()
+        else:
+            self.permitidas += 1
+            route.continue_()
+
+    async def _manejar_async(self, route):
+        """Manejador de rutas para la API asíncrona"""
+        if self.debe_bloquear(route.request.resource_type, route.request.url):
+            self.bloqueadas += 1
+            await route.abort()
+        else:
+            self.permitidas += 1
+            await route.continue_()
+
+    def aplicar(self, context):
+        """Instala el bloqueo en un contexto (o página) de la API síncrona"""
+        context.route("**/*", self._manejar)
+
+    async def aplicar_async(self, context):
+        """Instala el bloqueo en un contexto (o página) de la API asíncrona"""
+        await context.route("**/*", self._manejar_async)
+
+    def estadisticas(self) -> Dict:
+        """Peticiones bloqueadas y permitidas desde que se creó"""
+        return {'bloqueadas': self.bloqueadas, 'permitidas': self.permitidas}
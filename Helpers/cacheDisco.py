@@ -0,0 +1,212 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+import weakref
+from typing import Dict, Optional
+
+
+# Cachés creadas en este proceso; tras un fork el hijo descarta sus conexiones heredadas
+_instancias = weakref.WeakSet()
+
+
+def _reiniciar_en_hijo():
+    for cache in list(_instancias):
+        cache._reiniciar_proceso()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+class CacheDisco:
+    """
+    Caché persistente clave -> texto en SQLite, con el texto comprimido (zlib).
+
+    Cuando el tamaño comprimido total supera `max_mb`, se eliminan las entradas
+    usadas hace más tiempo. Lleva contadores de aciertos y fallos del proceso.
+
+    La conexión SQLite se abre en el primer uso y es propia de cada proceso: un
+    proceso hijo (fork) abre la suya en lugar de usar la heredada. El tamaño total
+    se lleva en memoria y se recalcula con SUM() solo al abrir, cada
+    `escrituras_sincronizar` escrituras (otros procesos escriben en el mismo
+    archivo) y antes de desalojar.
+    """
+
+    def __init__(self, ruta_db: str, max_mb: int = 1024, nivel_compresion: int = 6,
+                 escrituras_sincronizar: int = 256, refresco_acceso: float = 300.0):
+        """
+        Inicializa (o abre) la caché
+
+        Args:
+            ruta_db: Ruta del archivo SQLite
+            max_mb: Tamaño máximo (comprimido) antes de desalojar entradas
+            nivel_compresion: Nivel de zlib (1 = rápido, 9 = máximo)
+            escrituras_sincronizar: Cada cuántas escrituras se recalcula el tamaño total
+            refresco_acceso: Un acierto solo actualiza `ultimo_acceso` si tiene más de estos
+                             segundos (las lecturas no escriben en la base en cada acierto)
+        """
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta_db = ruta_db
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.nivel_compresion = nivel_compresion
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojados = 0
+        self.escrituras_sincronizar = max(1, escrituras_sincronizar)
+        self.refresco_acceso = refresco_acceso
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total = 0
+        self._escrituras = 0
+        _instancias.add(self)
+
+    def _reiniciar_proceso(self):
+        """En el hijo de un fork: nuevo lock y sin conexión (se abre otra en el primer uso)"""
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Conexión de este proceso; se abre (y crea la tabla) en el primer uso. Llamar con el lock tomado."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.ruta_db, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    clave TEXT PRIMARY KEY,
+                    valor BLOB NOT NULL,
+                    tamano INTEGER NOT NULL,
+                    ultimo_acceso REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_acceso ON cache (ultimo_acceso)")
+            conn.commit()
+            self._conn = conn
+            self._sincronizar_total()
+        return self._conn
+
+    def _sincronizar_total(self):
+        """Recalcula el tamaño total comprimido desde la tabla"""
+        self._total = self._conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM cache").fetchone()[0]
+        self._escrituras = 0
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """Retorna el texto guardado bajo `clave`, o None si no está en caché"""
+        try:
+            with self._lock:
+                fila = self.conn.execute("SELECT valor, ultimo_acceso FROM cache WHERE clave = ?",
+                                         (clave,)).fetchone()
+                if fila is None:
+                    self.fallos += 1
+                    return None
+
+                # El orden de desalojo no necesita precisión de segundos: refrescar solo si es antiguo
+                ahora = time.time()
+                if ahora - fila[1] >= self.refresco_acceso:
+                    self.conn.execute("UPDATE cache SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+                    self.conn.commit()
+                self.aciertos += 1
+            return zlib.decompress(fila[0]).decode('utf-8')
+        except Exception as e:
+            print(f"Error leyendo caché {self.ruta_db}: {e}")
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave: str, texto: str) -> bool:
+        """Guarda `texto` bajo `clave` y desaloja entradas antiguas si se supera el tamaño máximo"""
+        try:
+            valor = zlib.compress(texto.encode('utf-8'), self.nivel_compresion)
+            with self._lock:
+                anterior = self.conn.execute("SELECT tamano FROM cache WHERE clave = ?", (clave,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache (clave, valor, tamano, ultimo_acceso) VALUES (?, ?, ?, ?)",
+                    (clave, valor, len(valor), time.time())
+                )
+                self._total += len(valor) - (anterior[0] if anterior else 0)
+                self._escrituras += 1
+                if self._escrituras >= self.escrituras_sincronizar:
+                    self._sincronizar_total()
+                if self._total > self.max_bytes:
+                    self._desalojar()
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error guardando en caché {self.ruta_db}: {e}")
+            return False
+
+    def _desalojar(self):
+        """Elimina las entradas menos usadas hasta quedar por debajo del 90% del máximo"""
+        # El total en memoria no ve las escrituras de otros procesos: confirmar antes de borrar
+        self._sincronizar_total()
+        total = self._total
+        if total <= self.max_bytes:
+            return
+
+        objetivo = int(self.max_bytes * 0.9)
+        filas = self.conn.execute("SELECT clave, tamano FROM cache ORDER BY ultimo_acceso").fetchall()
+        borrar = []
+        for clave, tamano in filas:
+            if total <= objetivo:
+                break
+            borrar.append((clave,))
+            total -= tamano
+
+        self.conn.executemany("DELETE FROM cache WHERE clave = ?", borrar)
+        self.desalojados += len(borrar)
+        self._total = total
+
+    def eliminar(self, clave: str) -> bool:
+        """Elimina una entrada de la caché"""
+        try:
+            with self._lock:
+                fila = self.conn.execute("SELECT tamano FROM cache WHERE clave = ?", (clave,)).fetchone()
+                self.conn.execute("DELETE FROM cache WHERE clave = ?", (clave,))
+                self.conn.commit()
+                if fila:
+                    self._total -= fila[0]
+            return True
+        except Exception as e:
+            print(f"Error eliminando de caché {self.ruta_db}: {e}")
+            return False
+
+    def limpiar(self) -> bool:
+        """Elimina todas las entradas de la caché"""
+        try:
+            with self._lock:
+                self.conn.execute("DELETE FROM cache")
+                self.conn.commit()
+                self._total = 0
+            return True
+        except Exception as e:
+            print(f"Error limpiando caché {self.ruta_db}: {e}")
+            return False
+
+    def estadisticas(self) -> Dict:
+        """Aciertos, fallos, entradas y tamaño de la caché"""
+        with self._lock:
+            entradas, tamano = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM cache"
+            ).fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            'ruta': self.ruta_db,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else 0.0,
+            'desalojados': self.desalojados,
+            'entradas': entradas,
+            'tamano_mb': round(tamano / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2)
+        }
+
+    def close(self):
+        """Cierra la conexión de este proceso (se vuelve a abrir si la caché se usa otra vez)"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,498 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Callable
+
+from .funciones import Funciones
+
+
+class DescargaFallida(Exception):
+    """Error de una descarga; `reintentable` indica si vale la pena intentarla de nuevo"""
+
+    def __init__(self, mensaje: str, reintentable: bool = True, espera: float = None):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+        self.espera = espera
+
+
+class ManifiestoDescargas:
+    """
+    Registro persistente (SQLite) de los archivos descargados: URL, ruta local,
+    ETag, Last-Modified, tamaño y sha256.
+
+    Permite pedir cada archivo de nuevo de forma condicional (If-None-Match /
+    If-Modified-Since) y no volver a transferir los que no cambiaron.
+
+    También guarda el ETag / Last-Modified de cada `.part` en curso, para reanudarlo
+    en otra ejecución con `If-Range` sin mezclar versiones distintas del archivo.
+    """
+
+    def __init__(self, ruta_db: str):
+        """
+        Inicializa (o abre) el manifiesto
+
+        Args:
+            ruta_db: Ruta del archivo SQLite
+        """
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta_db = ruta_db
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(ruta_db, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS descargas (
+                url TEXT PRIMARY KEY,
+                ruta TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                tamano INTEGER NOT NULL,
+                sha256 TEXT,
+                descargado REAL NOT NULL,
+                verificado REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS partes (
+                url TEXT PRIMARY KEY,
+                ruta TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                actualizado REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def obtener(self, url: str) -> Optional[Dict]:
+        """Retorna la entrada de una URL, o None si nunca se descargó"""
+        with self._lock:
+            fila = self.conn.execute("SELECT * FROM descargas WHERE url = ?", (url,)).fetchone()
+        return dict(fila) if fila else None
+
+    def guardar(self, url: str, ruta: str, etag: str, last_modified: str, tamano: int, sha256: str):
+        """Registra (o reemplaza) la descarga de una URL"""
+        ahora = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO descargas (url, ruta, etag, last_modified, tamano, sha256, descargado, verificado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, ruta, etag, last_modified, tamano, sha256, ahora, ahora)
+            )
+            self.conn.commit()
+
+    def marcar_verificado(self, url: str):
+        """Registra que el servidor confirmó que la URL no cambió"""
+        with self._lock:
+            self.conn.execute("UPDATE descargas SET verificado = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def eliminar(self, url: str):
+        """Elimina la entrada de una URL"""
+        with self._lock:
+            self.conn.execute("DELETE FROM descargas WHERE url = ?", (url,))
+            self.conn.commit()
+
+    def obtener_parte(self, url: str) -> Optional[Dict]:
+        """Validadores del `.part` en curso de una URL, o None si no hay"""
+        with self._lock:
+            fila = self.conn.execute("SELECT * FROM partes WHERE url = ?", (url,)).fetchone()
+        return dict(fila) if fila else None
+
+    def guardar_parte(self, url: str, ruta: str, etag: str, last_modified: str):
+        """Registra los validadores de la versión que se está escribiendo en el `.part`"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO partes (url, ruta, etag, last_modified, actualizado) VALUES (?, ?, ?, ?, ?)",
+                (url, ruta, etag, last_modified, time.time())
+            )
+            self.conn.commit()
+
+    def eliminar_parte(self, url: str):
+        """Elimina el registro del `.part` de una URL (terminado o descartado)"""
+        with self._lock:
+            self.conn.execute("DELETE FROM partes WHERE url = ?", (url,))
+            self.conn.commit()
+
+    def close(self):
+        """Cierra la conexión"""
+        self.conn.close()
+
+
+class DescargadorPDF:
+    """
+    Descarga concurrente de PDF sobre una sola `requests.Session`.
+
+    - Un pool de hilos descarga varios archivos a la vez, reutilizando las
+      conexiones (keep-alive) del pool de la sesión.
+    - Un semáforo por host limita las descargas simultáneas contra un mismo servidor.
+    - Los errores de red, los HTTP 429/5xx y los archivos truncados se reintentan
+      con espera exponencial (con algo de azar para no sincronizar los hilos).
+    - Cada archivo se escribe en un `.part` que se reanuda con `Range` si la conexión
+      se corta, y solo se renombra al nombre final cuando está completo.
+    - Cada PDF se valida como antes: tamaño mínimo y marcador `%%EOF` al final.
+    - Con un `ManifiestoDescargas`, los archivos ya descargados se piden de forma
+      condicional y se omiten si el servidor responde 304 (o si llega el mismo sha256).
+    """
+
+    CODIGOS_REINTENTABLES = {408, 425, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_workers: int = 8, max_por_host: int = 4, reintentos: int = 4,
+                 backoff_inicial: float = 1.0, backoff_max: float = 30.0,
+                 timeout_conexion: float = 10, timeout_lectura: float = 180,
+                 tamano_minimo: int = 5000, chunk_size: int = 64 * 1024, rechazar_html: bool = False,
+                 manifiesto: ManifiestoDescargas = None):
+        """
+        Inicializa el descargador
+
+        Args:
+            max_workers: Descargas simultáneas en total
+            max_por_host: Descargas simultáneas contra un mismo host
+            reintentos: Reintentos por archivo después del primer intento
+            backoff_inicial: Segundos de espera antes del primer reintento (se duplica en cada uno)
+            backoff_max: Espera máxima entre reintentos
+            timeout_conexion: Segundos para establecer la conexión
+            timeout_lectura: Segundos máximos sin recibir datos
+            tamano_minimo: Bytes mínimos para considerar válido un PDF
+            chunk_size: Tamaño de los bloques de escritura
+            rechazar_html: Tratar como error las respuestas HTML (páginas de error servidas con 200)
+            manifiesto: Registro de descargas anteriores para hacer peticiones condicionales
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_por_host = max(1, max_por_host)
+        self.reintentos = max(0, reintentos)
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+        self.timeout = (timeout_conexion, timeout_lectura)
+        self.tamano_minimo = tamano_minimo
+        self.chunk_size = chunk_size
+        self.rechazar_html = rechazar_html
+        self.manifiesto = manifiesto
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+
+        self._semaforos: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+
+    def _semaforo_host(self, url: str) -> threading.BoundedSemaphore:
+        """Semáforo que limita las descargas simultáneas al host de `url`"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaforos:
+                self._semaforos[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._semaforos[host]
+
+    @staticmethod
+    def nombre_archivo(url: str) -> str:
+        """Nombre local del archivo de una URL"""
+        return url.split("/")[-1].replace("%20", "_")
+
+    @staticmethod
+    def validar_pdf(ruta: str, tamano_minimo: int = 5000) -> Optional[str]:
+        """
+        Verifica que un PDF descargado esté completo
+
+        Returns:
+            None si es válido, o el motivo por el que no lo es
+        """
+        tamaño = os.path.getsize(ruta)
+        if tamaño < tamano_minimo:
+            return f"Archivo demasiado pequeño ({tamaño} bytes). Posible descarga incompleta."
+
+        with open(ruta, "rb") as f:
+            f.seek(-min(2048, tamaño), os.SEEK_END)   # Leer últimos 2KB
+            final = f.read()
+        if b"%%EOF" not in final:
+            return "Archivo sin marcador EOF → descarga truncada."
+        return None
+
+    def _espera_reintento(self, intento: int) -> float:
+        """Espera exponencial con azar para el reintento número `intento` (desde 0)"""
+        espera = min(self.backoff_max, self.backoff_inicial * (2 ** intento))
+        return espera * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _total_content_range(valor: str) -> Optional[int]:
+        """Tamaño total del archivo según un encabezado `Content-Range: bytes a-b/total`"""
+        try:
+            total = valor.rsplit('/', 1)[1]
+            return int(total) if total != '*' else None
+        except (IndexError, ValueError):
+            return None
+
+    def _descargar_una_vez(self, url: str, ruta_destino: str, validadores: Dict, previo: Dict = None) -> Optional[int]:
+        """
+        Descarga `url` en `ruta_destino` y la valida; retorna el tamaño, None si el
+        servidor confirma que no cambió (304), o lanza DescargaFallida.
+
+        Escribe en `ruta_destino + '.part'`: si ya existe una parte (de un intento o una
+        ejecución anterior), pide solo lo que falta con `Range` + `If-Range`. Una parte
+        sin validadores conocidos (ETag / Last-Modified de esta ejecución o guardados en
+        el manifiesto) se descarta, porque no hay forma de saber si el archivo del
+        servidor cambió desde entonces. Al terminar verifica
+        el tamaño contra `Content-Length`/`Content-Range` y el marcador EOF, y solo
+        entonces renombra la parte al nombre final (de forma atómica), así que un
+        archivo con el nombre final siempre está completo.
+
+        Args:
+            validadores: ETag / Last-Modified de la versión escrita en la parte,
+                         para que `If-Range` no mezcle partes de versiones distintas
+            previo: Entrada del manifiesto si la copia local está intacta (petición condicional)
+        """
+        ruta_parte = ruta_destino + '.part'
+        inicio = os.path.getsize(ruta_parte) if os.path.exists(ruta_parte) else 0
+
+        if inicio and not (validadores.get('etag') or validadores.get('last_modified')):
+            # Parte de una ejecución anterior: solo se reanuda con sus validadores guardados
+            parte = self.manifiesto.obtener_parte(url) if self.manifiesto else None
+            if parte and parte['ruta'] == ruta_destino and (parte['etag'] or parte['last_modified']):
+                validadores.update(etag=parte['etag'], last_modified=parte['last_modified'])
+            else:
+                self._descartar_parte(url, ruta_parte)
+                inicio = 0
+
+        headers = {}
+        if previo and not inicio:
+            if previo.get('etag'):
+                headers['If-None-Match'] = previo['etag']
+            if previo.get('last_modified'):
+                headers['If-Modified-Since'] = previo['last_modified']
+        if inicio:
+            headers['Range'] = f'bytes={inicio}-'
+            if validadores.get('etag') or validadores.get('last_modified'):
+                headers['If-Range'] = validadores.get('etag') or validadores.get('last_modified')
+
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as r:
+                if r.status_code == 304 and previo:
+                    return None
+
+                if r.status_code == 416:
+                    # La parte guardada no corresponde al archivo del servidor: empezar de cero
+                    self._descartar_parte(url, ruta_parte)
+                    validadores.clear()
+                    raise DescargaFallida("Rango no válido, se reinicia la descarga")
+
+                if r.status_code not in (200, 206):
+                    espera = None
+                    if r.status_code == 429 and r.headers.get('Retry-After', '').isdigit():
+                        espera = float(r.headers['Retry-After'])
+                    raise DescargaFallida(f"ERROR HTTP {r.status_code}",
+                                          reintentable=r.status_code in self.CODIGOS_REINTENTABLES,
+                                          espera=espera)
+
+                content_type = r.headers.get('Content-Type', '').lower()
+                if self.rechazar_html and 'text/html' in content_type:
+                    raise DescargaFallida(f"URL no es PDF o archivo esperado (Content-Type: {content_type})",
+                                          reintentable=False)
+
+                if r.status_code == 200 or not (validadores.get('etag') or validadores.get('last_modified')):
+                    # Respuesta completa: la parte se reescribe con esta versión del archivo
+                    validadores.update(etag=r.headers.get('ETag'), last_modified=r.headers.get('Last-Modified'))
+                    if self.manifiesto:
+                        self.manifiesto.guardar_parte(url, ruta_destino, validadores['etag'],
+                                                      validadores['last_modified'])
+
+                if r.status_code == 206:
+                    content_range = r.headers.get('Content-Range', '')
+                    if not content_range.startswith(f'bytes {inicio}-'):
+                        self._descartar_parte(url, ruta_parte)
+                        validadores.clear()
+                        raise DescargaFallida(f"Rango inesperado ({content_range}), se reinicia la descarga")
+                    esperado = self._total_content_range(content_range)
+                    modo = "ab"
+                else:
+                    # El servidor ignoró el Range (o no había parte): se descarga completo
+                    esperado = int(r.headers['Content-Length']) if r.headers.get('Content-Length', '').isdigit() else None
+                    if 'gzip' in r.headers.get('Content-Encoding', '') or 'deflate' in r.headers.get('Content-Encoding', ''):
+                        esperado = None      # Content-Length es del contenido comprimido
+                    modo = "wb"
+
+                with open(ruta_parte, modo) as f:
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        if self._detener.is_set():
+                            raise DescargaFallida("Descarga cancelada", reintentable=False)
+                        if chunk:
+                            f.write(chunk)
+        except requests.RequestException as e:
+            # La parte descargada se conserva: el siguiente intento continúa desde ahí
+            raise DescargaFallida(f"ERROR DE RED: {e}")
+
+        tamaño = os.path.getsize(ruta_parte)
+        if esperado is not None and tamaño < esperado:
+            raise DescargaFallida(f"Descarga incompleta ({tamaño} de {esperado} bytes)")
+        if esperado is not None and tamaño > esperado:
+            self._descartar_parte(url, ruta_parte)
+            validadores.clear()
+            raise DescargaFallida(f"Tamaño inesperado ({tamaño} de {esperado} bytes), se reinicia la descarga")
+
+        if ruta_destino.lower().endswith('.pdf') or 'pdf' in content_type:
+            error = self.validar_pdf(ruta_parte, self.tamano_minimo)
+            if error:
+                self._descartar_parte(url, ruta_parte)
+                validadores.clear()
+                # Un archivo pequeño suele ser una página de error. Sin EOF y con el tamaño
+                # completo, el archivo del servidor está dañado; sin tamaño conocido, puede
+                # ser una conexión cortada y vale la pena reintentar
+                raise DescargaFallida(error, reintentable='EOF' in error and esperado is None)
+
+        os.replace(ruta_parte, ruta_destino)
+        if self.manifiesto:
+            self.manifiesto.eliminar_parte(url)
+        return tamaño
+
+    def _descartar_parte(self, url: str, ruta_parte: str):
+        """Borra un `.part` (y su registro en el manifiesto) para descargar desde cero"""
+        if os.path.exists(ruta_parte):
+            os.remove(ruta_parte)
+        if self.manifiesto:
+            self.manifiesto.eliminar_parte(url)
+
+    def descargar(self, url: str, ruta_destino: str) -> Dict:
+        """
+        Descarga un archivo con reintentos, respetando el límite por host
+
+        Returns:
+            {'url', 'ruta', 'ok', 'sin_cambios', 'tamano', 'sha256', 'intentos', 'error'}
+        """
+        resultado = {'url': url, 'ruta': ruta_destino, 'ok': False, 'sin_cambios': False,
+                     'tamano': 0, 'sha256': None, 'intentos': 0, 'error': None}
+        semaforo = self._semaforo_host(url)
+        validadores = {}
+        previo = self._copia_vigente(url, ruta_destino)
+
+        for intento in range(self.reintentos + 1):
+            if self._detener.is_set():
+                resultado['error'] = "Descarga cancelada"
+                break
+
+            resultado['intentos'] = intento + 1
+            try:
+                with semaforo:
+                    tamaño = self._descargar_una_vez(url, ruta_destino, validadores, previo)
+                resultado['ok'] = True
+                resultado['error'] = None
+                self._registrar(resultado, previo, tamaño, validadores)
+                break
+            except DescargaFallida as e:
+                resultado['error'] = str(e)
+                if not e.reintentable or intento == self.reintentos:
+                    break
+                espera = e.espera if e.espera is not None else self._espera_reintento(intento)
+                print(f"   ↻ {url}: {e} — reintento {intento + 1}/{self.reintentos} en {espera:.1f}s")
+                self._detener.wait(espera)
+            except Exception as e:
+                resultado['error'] = f"ERROR EXCEPCIÓN: {e}"
+                break
+
+        return resultado
+
+    def _copia_vigente(self, url: str, ruta_destino: str) -> Optional[Dict]:
+        """Entrada del manifiesto de `url` si la copia local sigue ahí con el mismo tamaño"""
+        if not self.manifiesto:
+            return None
+        previo = self.manifiesto.obtener(url)
+        if (previo and previo['ruta'] == ruta_destino and os.path.exists(ruta_destino)
+                and os.path.getsize(ruta_destino) == previo['tamano']):
+            return previo
+        return None
+
+    def _registrar(self, resultado: Dict, previo: Optional[Dict], tamaño: Optional[int], validadores: Dict):
+        """Completa el resultado de una descarga exitosa y la registra en el manifiesto"""
+        if tamaño is None:
+            # 304: la copia local sigue vigente
+            resultado.update(sin_cambios=True, tamano=previo['tamano'], sha256=previo['sha256'])
+            self.manifiesto.marcar_verificado(resultado['url'])
+            return
+
+        resultado['tamano'] = tamaño
+        resultado['sha256'] = Funciones.calcular_hash_archivo(resultado['ruta'])
+        resultado['sin_cambios'] = bool(previo and previo['sha256'] == resultado['sha256'])
+        if self.manifiesto:
+            self.manifiesto.guardar(resultado['url'], resultado['ruta'], validadores.get('etag'),
+                                    validadores.get('last_modified'), tamaño, resultado['sha256'])
+
+    def descargar_todos(self, enlaces: List[str], upload_dir: str,
+                        progreso: Callable[[Dict], None] = None) -> Dict:
+        """
+        Descarga en paralelo una lista de URLs en `upload_dir`
+
+        Args:
+            enlaces: Lista de URLs
+            upload_dir: Carpeta destino
+            progreso: Función opcional llamada al inicio, tras cada archivo y al final con
+                      {'procesados', 'total', 'descargados', 'sin_cambios', 'errores'}; si lanza
+                      una excepción, se cancelan las descargas pendientes y se propaga
+
+        Returns:
+            {'total', 'descargados', 'sin_cambios', 'errores', 'archivos': [resultado de cada descarga]}
+            (`descargados` cuenta solo los archivos nuevos o modificados)
+        """
+        total = len(enlaces)
+        os.makedirs(upload_dir, exist_ok=True)
+
+        # Un solo destino por nombre de archivo (dos hilos no deben escribir el mismo archivo)
+        destinos, rutas = {}, set()
+        for url in dict.fromkeys(enlaces):
+            ruta_destino = os.path.join(upload_dir, self.nombre_archivo(url))
+            if ruta_destino in rutas:
+                print(f" ⚠ Se omite {url}: otro enlace se guarda con el mismo nombre")
+                continue
+            destinos[url] = ruta_destino
+            rutas.add(ruta_destino)
+
+        contadores = {"procesados": total - len(destinos), "total": total,
+                      "descargados": 0, "sin_cambios": 0, "errores": 0}
+        archivos = []
+        if progreso:
+            progreso(dict(contadores))
+
+        self._detener.clear()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='descarga')
+        try:
+            futuros = {pool.submit(self.descargar, url, ruta): url for url, ruta in destinos.items()}
+            for futuro in as_completed(futuros):
+                resultado = futuro.result()
+                archivos.append(resultado)
+                contadores["procesados"] += 1
+                if resultado['ok'] and resultado['sin_cambios']:
+                    contadores["sin_cambios"] += 1
+                    print(f"[{contadores['procesados']} / {total}] = SIN CAMBIOS: {resultado['url']}")
+                elif resultado['ok']:
+                    contadores["descargados"] += 1
+                    print(f"[{contadores['procesados']} / {total}] ✔ DESCARGADO ({resultado['tamano']} bytes): {resultado['url']}")
+                else:
+                    contadores["errores"] += 1
+                    print(f"[{contadores['procesados']} / {total}] ✖ {resultado['error']}: {resultado['url']}")
+                if progreso:
+                    progreso(dict(contadores))
+        except BaseException:
+            # Cancelación (o error) desde el llamador: detener las descargas en curso y no iniciar más
+            self._detener.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+        return {
+            "total": total,
+            "descargados": contadores["descargados"],
+            "sin_cambios": contadores["sin_cambios"],
+            "errores": contadores["errores"],
+            "archivos": archivos
+        }
+
+    def close(self):
+        """Cierra la sesión HTTP"""
+        self.session.close()
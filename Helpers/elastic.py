@@ -1,5 +1,5 @@
-from elasticsearch import Elasticsearch
-from typing import Dict, List, Optional, Any
+from elasticsearch import Elasticsearch, NotFoundError
+from typing import Dict, List, Optional, Any, Iterable, Set, Callable
 import json
 
 class ElasticSearch:
@@ -164,13 +164,18 @@ class ElasticSearch:
             print(f"Error al indexar documento: {e}")
             return False
     
-    def indexar_bulk(self, index: str, documentos: List[Dict]) -> Dict:
+    def indexar_bulk(self, index: str, documentos: List[Dict], campo_id: str = None,
+                     op_type: str = 'index') -> Dict:
         """
         Indexa múltiples documentos de forma masiva
         
         Args:
             index: Nombre del índice
             documentos: Lista de documentos a indexar
+            campo_id: Campo del documento usado como `_id` (p. ej. 'hash_archivo');
+                si es None, Elastic genera los ids
+            op_type: 'index' (crea o reemplaza) o 'create' (solo crea; los ids que ya
+                existen se cuentan como duplicados y no se modifican)
             
         Returns:
             Diccionario con estadísticas de indexación
@@ -179,29 +184,124 @@ class ElasticSearch:
         
         try:
             # Preparar acciones para bulk
-            acciones = []
-            for doc in documentos:
-                accion = {
-                    '_index': index,
-                    '_source': doc
-                }
-                #print("--- Documento enviado a bulk ---", accion)
-                acciones.append(accion)
+            acciones = [self._accion_bulk(index, doc, campo_id, op_type) for doc in documentos]
             
             # Ejecutar bulk
             success, failed = bulk(self.client, acciones, raise_on_error=False)
+            errores, duplicados = self._separar_duplicados(failed or [])
             
             return {
                 'success': True,
                 'indexados': success,
-                'fallidos': len(failed) if failed else 0,
-                'errores': failed if failed else []
+                'duplicados': duplicados,
+                'fallidos': len(errores),
+                'errores': errores
             }
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
+
+    def indexar_streaming(self, index: str, documentos: Iterable[Dict], campo_id: str = None,
+                          op_type: str = 'index', chunk_size: int = 500,
+                          max_chunk_bytes: int = 10 * 1024 * 1024, max_retries: int = 5,
+                          initial_backoff: float = 2, max_backoff: float = 60,
+                          progreso: Callable[[Dict], None] = None) -> Dict:
+        """
+        Indexa documentos de un iterable/generador con `streaming_bulk`, sin cargarlos
+        todos en memoria.
+
+        Las peticiones se cortan por número de documentos (`chunk_size`) o por tamaño
+        (`max_chunk_bytes`), lo que ocurra primero. Los rechazos 429 se reintentan con
+        backoff exponencial (`initial_backoff` * 2^n, hasta `max_backoff`).
+
+        Args:
+            index: Nombre del índice
+            documentos: Iterable o generador de documentos
+            campo_id: Campo del documento usado como `_id` (ver indexar_bulk)
+            op_type: 'index' o 'create' (ver indexar_bulk)
+            chunk_size: Documentos máximos por petición bulk
+            max_chunk_bytes: Bytes máximos por petición bulk
+            max_retries: Reintentos por documento ante 429
+            initial_backoff: Segundos de espera del primer reintento
+            max_backoff: Segundos máximos de espera entre reintentos
+            progreso: Función llamada con las estadísticas acumuladas cada vez que se
+                cruzan otros `chunk_size` documentos procesados, y al final
+
+        Returns:
+            Diccionario con estadísticas de indexación (solo guarda los primeros 100 errores)
+        """
+        from elasticsearch.helpers import streaming_bulk
+
+        estadisticas = {'procesados': 0, 'indexados': 0, 'duplicados': 0, 'fallidos': 0}
+        errores = []
+        proximo_aviso = chunk_size
+        ultimo_aviso = None
+        try:
+            acciones = (self._accion_bulk(index, doc, campo_id, op_type) for doc in documentos)
+            for ok, item in streaming_bulk(self.client, acciones,
+                                           chunk_size=chunk_size,
+                                           max_chunk_bytes=max_chunk_bytes,
+                                           max_retries=max_retries,
+                                           initial_backoff=initial_backoff,
+                                           max_backoff=max_backoff,
+                                           raise_on_error=False,
+                                           raise_on_exception=False):
+                estadisticas['procesados'] += 1
+                if ok:
+                    estadisticas['indexados'] += 1
+                else:
+                    # Quitar el documento original del error (puede pesar varios MB)
+                    next(iter(item.values()), {}).pop('data', None)
+                    error, duplicado = self._separar_duplicados([item])
+                    estadisticas['duplicados'] += duplicado
+                    estadisticas['fallidos'] += len(error)
+                    if error and len(errores) < 100:
+                        errores.extend(error)
+
+                if progreso and estadisticas['procesados'] >= proximo_aviso:
+                    progreso(dict(estadisticas))
+                    ultimo_aviso = estadisticas['procesados']
+                    while proximo_aviso <= ultimo_aviso:
+                        proximo_aviso += chunk_size
+
+            # Aviso final, salvo que el último ya se haya dado con este mismo total
+            if progreso and ultimo_aviso != estadisticas['procesados']:
+                progreso(dict(estadisticas))
+
+            return {'success': True, **estadisticas, 'errores': errores}
+        except Exception as e:
+            return {'success': False, 'error': str(e), **estadisticas}
+
+    @staticmethod
+    def _accion_bulk(index: str, doc: Dict, campo_id: str = None, op_type: str = 'index') -> Dict:
+        """Construye la acción de bulk de un documento (con `_id` determinístico si hay campo_id)"""
+        if op_type not in ('index', 'create'):
+            raise ValueError(f"op_type no soportado: {op_type}")
+
+        accion = {
+            '_op_type': op_type,
+            '_index': index,
+            '_source': doc
+        }
+        if campo_id and doc.get(campo_id):
+            accion['_id'] = str(doc[campo_id])
+        #print("--- Documento enviado a bulk ---", accion)
+        return accion
+
+    @staticmethod
+    def _separar_duplicados(fallidos: List[Dict]):
+        """Separa los conflictos de versión (409, id ya existente con op 'create') del resto de errores"""
+        errores = []
+        duplicados = 0
+        for item in fallidos:
+            detalle = next(iter(item.values()), {}) if isinstance(item, dict) else {}
+            if detalle.get('status') == 409:
+                duplicados += 1
+            else:
+                errores.append(item)
+        return errores, duplicados
     
     def buscar(self, index: str, query: Dict, aggs=None, size: int = 10) -> Dict:
         """
@@ -433,4 +533,58 @@ class ElasticSearch:
 
         except Exception as e:
             print(f"Error verificando hash en Elasticsearch: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def existen_hashes(self, hashes: Iterable[str], index: str, tamano_lote: int = 1000) -> Set[str]:
+        """
+        Verifica en bloque qué hashes ya están indexados en Elasticsearch.
+
+        Primero consulta por `_id` con `mget` (documentos indexados con el hash como id)
+        y luego, para los restantes, una consulta `terms` sobre `hash_archivo` (o
+        `hash_archivo.keyword` si el campo quedó mapeado como texto) por cada lote de
+        `tamano_lote` hashes. No depende de agregaciones ni de doc_values.
+
+        Un índice que aún no existe no tiene hashes; cualquier otro error se propaga,
+        para que el llamador no tome por nuevos documentos que quizá ya estén indexados.
+
+        Args:
+            hashes: Hashes 'sha256:<valor>' a verificar
+            index: Nombre del índice
+            tamano_lote: Número máximo de hashes por petición
+
+        Returns:
+            Conjunto de hashes que ya existen en el índice
+
+        Raises:
+            Exception: Si Elasticsearch falla (salvo índice inexistente)
+        """
+        pendientes = list(dict.fromkeys(h for h in hashes if h))
+        existentes = set()
+
+        for i in range(0, len(pendientes), tamano_lote):
+            lote = pendientes[i:i + tamano_lote]
+
+            # 1. Por _id (una sola petición mget por lote)
+            try:
+                respuesta = self.client.mget(index=index, ids=lote, source=False)
+            except NotFoundError:
+                return existentes
+            existentes.update(doc['_id'] for doc in respuesta['docs'] if doc.get('found'))
+
+            # 2. Por campo hash_archivo (documentos indexados con id generado por Elastic)
+            restantes = [h for h in lote if h not in existentes]
+            if not restantes:
+                continue
+            respuesta = self.client.search(
+                index=index,
+                size=len(restantes),
+                source=['hash_archivo'],
+                query={"bool": {"should": [{"terms": {"hash_archivo": restantes}},
+                                           {"terms": {"hash_archivo.keyword": restantes}}],
+                                "minimum_should_match": 1}}
+            )
+            buscados = set(restantes)
+            existentes.update(hit['_source'].get('hash_archivo') for hit in respuesta['hits']['hits']
+                              if hit.get('_source', {}).get('hash_archivo') in buscados)
+
+        return existentes
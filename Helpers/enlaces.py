@@ -0,0 +1,239 @@
+import re
+import requests
+from bs4 import BeautifulSoup
+from typing import Dict, Iterable, List, Optional, Union
+
+# Recolecta en el navegador, en una sola llamada, el href de todos los enlaces que
+# cumplen `selector` y si cada uno está dentro de `contenedor`
+JS_RECOLECTAR_ENLACES = """
+([selector, contenedor]) => {
+    const hayContenedor = contenedor ? document.querySelector(contenedor) !== null : false;
+    const enlaces = [];
+    for (const a of document.querySelectorAll(selector)) {
+        const href = a.getAttribute('href');
+        if (!href) continue;
+        enlaces.push({href: href, en_contenedor: contenedor ? a.closest(contenedor) !== null : true});
+    }
+    return {contenedor: hayContenedor, enlaces: enlaces};
+}
+"""
+
+
+def recolectar_enlaces(pagina, selector: str = "a[href]", selector_contenedor: Optional[str] = None) -> Dict:
+    """
+    Obtiene todos los enlaces de una página de Playwright (API síncrona) con un
+    `evaluate` por frame, en lugar de una llamada al navegador por elemento.
+
+    Si se indica `selector_contenedor` y no está en la página principal, se busca
+    en los iframes y se usan los enlaces del primero que lo tenga.
+
+    Args:
+        pagina: Page de Playwright
+        selector: Selector CSS de los enlaces
+        selector_contenedor: Selector CSS opcional del contenedor de interés
+
+    Returns:
+        {'contenedor': bool, 'enlaces': [{'href', 'en_contenedor'}]}
+    """
+    resultado = pagina.evaluate(JS_RECOLECTAR_ENLACES, [selector, selector_contenedor])
+    if not selector_contenedor or resultado['contenedor']:
+        return resultado
+
+    for frame in pagina.frames:
+        if frame == pagina.main_frame:
+            continue
+        try:
+            en_frame = frame.evaluate(JS_RECOLECTAR_ENLACES, [selector, selector_contenedor])
+        except Exception:
+            continue
+        if en_frame['contenedor']:
+            return en_frame
+    return resultado
+
+
+async def recolectar_enlaces_async(pagina, selector: str = "a[href]",
+                                   selector_contenedor: Optional[str] = None) -> Dict:
+    """Igual que `recolectar_enlaces`, para la API asíncrona de Playwright"""
+    resultado = await pagina.evaluate(JS_RECOLECTAR_ENLACES, [selector, selector_contenedor])
+    if not selector_contenedor or resultado['contenedor']:
+        return resultado
+
+    for frame in pagina.frames:
+        if frame == pagina.main_frame:
+            continue
+        try:
+            en_frame = await frame.evaluate(JS_RECOLECTAR_ENLACES, [selector, selector_contenedor])
+        except Exception:
+            continue
+        if en_frame['contenedor']:
+            return en_frame
+    return resultado
+
+
+def hrefs(resultado: Dict, solo_contenedor: bool = False) -> List[str]:
+    """Lista de hrefs de un resultado de `recolectar_enlaces`"""
+    return [e['href'] for e in resultado['enlaces'] if e['en_contenedor'] or not solo_contenedor]
+
+
+def recolectar_enlaces_html(html: Union[str, bytes, BeautifulSoup], selector: str = "a[href]",
+                            selector_contenedor: Optional[str] = None) -> Dict:
+    """
+    Igual que `recolectar_enlaces`, pero sobre HTML estático (sin navegador),
+    analizado con lxml
+
+    Args:
+        html: Contenido HTML (o una sopa ya analizada)
+        selector: Selector CSS de los enlaces
+        selector_contenedor: Selector CSS opcional del contenedor de interés
+
+    Returns:
+        {'contenedor': bool, 'enlaces': [{'href', 'en_contenedor'}]}
+    """
+    sopa = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, 'lxml')
+    contenedores = {id(c) for c in sopa.select(selector_contenedor)} if selector_contenedor else set()
+
+    enlaces = []
+    for a in sopa.select(selector):
+        href = a.get('href')
+        if not href:
+            continue
+        en_contenedor = True
+        if selector_contenedor:
+            en_contenedor = id(a) in contenedores or any(id(p) in contenedores for p in a.parents)
+        enlaces.append({'href': href, 'en_contenedor': en_contenedor})
+    return {'contenedor': bool(contenedores), 'enlaces': enlaces}
+
+
+class LectorHTML:
+    """
+    Vía rápida sin navegador: descarga la página con un GET plano y extrae los
+    enlaces del HTML con lxml.
+
+    Si la respuesta no es HTML, o el selector esperado no está en el HTML
+    estático (el contenido lo genera JavaScript), `leer` retorna None y el
+    llamador debe cargar la página con Playwright. Sin selector esperado
+    tampoco se confía en el HTML estático: que traiga algún enlace (menús,
+    pie de página) no indica que el contenido ya esté.
+    """
+
+    def __init__(self, timeout: int = 15, user_agent: str = "Mozilla/5.0"):
+        """
+        Args:
+            timeout: Segundos máximos por petición
+            user_agent: User-Agent de las peticiones
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent})
+        self.estaticas = 0
+        self.con_navegador = 0
+
+    def leer(self, url: str, selector: str = "a[href]", selector_contenedor: Optional[str] = None,
+             selector_esperado: Optional[str] = None) -> Optional[Dict]:
+        """
+        Intenta obtener los enlaces de `url` sin navegador
+
+        Args:
+            url: Página a leer
+            selector: Selector CSS de los enlaces
+            selector_contenedor: Selector CSS opcional del contenedor de interés
+            selector_esperado: Selector que debe estar en el HTML estático para confiar
+                               en él (por defecto el contenedor; sin ninguno de los dos,
+                               siempre se usa el navegador)
+
+        Returns:
+            Mismo formato que `recolectar_enlaces` (más 'url' final), o None si hace falta el navegador
+        """
+        esperado = selector_esperado or selector_contenedor
+        if not esperado:
+            self.con_navegador += 1
+            return None
+
+        try:
+            respuesta = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"[HTML] GET falló en {url}: {e}. Se usará el navegador.")
+            self.con_navegador += 1
+            return None
+
+        tipo = respuesta.headers.get('Content-Type', '').lower()
+        if respuesta.status_code != 200 or 'html' not in tipo:
+            self.con_navegador += 1
+            return None
+
+        sopa = BeautifulSoup(respuesta.content, 'lxml')
+        if sopa.select_one(esperado) is None:
+            self.con_navegador += 1
+            return None
+        resultado = recolectar_enlaces_html(sopa, selector, selector_contenedor)
+
+        self.estaticas += 1
+        resultado['url'] = respuesta.url
+        return resultado
+
+    def estadisticas(self) -> Dict:
+        """Páginas resueltas con HTML estático y páginas que necesitaron navegador"""
+        return {'estaticas': self.estaticas, 'con_navegador': self.con_navegador}
+
+
+class FiltroEnlaces:
+    """
+    Filtro de relevancia de URLs por palabras clave, compilado una sola vez.
+
+    Las palabras de inclusión y de exclusión se pasan a minúsculas y se compilan
+    cada grupo en una sola expresión regular con forma de árbol de prefijos
+    (las palabras que comparten prefijo lo evalúan una sola vez), así que cada URL
+    se revisa con una búsqueda por grupo sin importar cuántas palabras haya.
+
+    Una URL es relevante si contiene alguna palabra incluida (o si no hay palabras
+    incluidas) y ninguna excluida. La comparación no distingue mayúsculas.
+    """
+
+    def __init__(self, incluir: Iterable[str] = (), excluir: Iterable[str] = ()):
+        """
+        Args:
+            incluir: Palabras de las que la URL debe contener al menos una (vacío = todas pasan)
+            excluir: Palabras que descartan la URL
+        """
+        self.incluir = sorted({p.lower() for p in incluir if p})
+        self.excluir = sorted({p.lower() for p in excluir if p})
+        self._incluir = self._compilar(self.incluir)
+        self._excluir = self._compilar(self.excluir)
+
+    @staticmethod
+    def _compilar(palabras: List[str]):
+        """Compila las palabras en una expresión regular con forma de árbol de prefijos"""
+        if not palabras:
+            return None
+        arbol = {}
+        for palabra in palabras:
+            nodo = arbol
+            for caracter in palabra:
+                nodo = nodo.setdefault(caracter, {})
+            nodo[''] = {}
+
+        def patron(nodo):
+            # Si una palabra termina aquí, basta con haber llegado: las más largas sobran
+            if '' in nodo:
+                return ''
+            ramas = [re.escape(c) + patron(hijo) for c, hijo in sorted(nodo.items())]
+            return ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+
+        return re.compile(patron(arbol))
+
+    def es_relevante(self, url: str, normalizada: bool = False) -> bool:
+        """
+        Indica si la URL pasa el filtro
+
+        Args:
+            url: URL a revisar
+            normalizada: True si la URL ya está en minúsculas (evita convertirla otra vez)
+        """
+        texto = url if normalizada else url.lower()
+        if self._excluir is not None and self._excluir.search(texto):
+            return False
+        return self._incluir is None or self._incluir.search(texto) is not None
+
+    def filtrar(self, urls: Iterable[str]) -> List[str]:
+        """URLs que pasan el filtro, en el mismo orden"""
+        return [u for u in urls if self.es_relevante(u)]
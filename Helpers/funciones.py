@@ -3,13 +3,18 @@ import re
 import zipfile
 import requests
 import json
+import signal
+import math
+import time
 import PyPDF2
 from PIL import Image
 import pytesseract
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import hashlib
+import multiprocessing
 
 MESES_ES = {
     "enero": 1, "febrero": 2, "marzo": 3, "abril": 4,
@@ -18,6 +23,56 @@ MESES_ES = {
     "octubre": 10, "noviembre": 11, "diciembre": 12
 }
 
+def _tarea_extraer_paginas(ruta_pdf: str, inicio: int = 0, fin: int = None,
+                           limite: float = None) -> Tuple[List[str], int]:
+    """
+    Extrae el texto de las páginas [inicio, fin) de un PDF (se ejecuta en un proceso del pool).
+
+    Si se indica `limite` (instante time.time() en que vence el plazo del archivo completo),
+    la extracción se interrumpe con TimeoutError al llegar a él.
+
+    Returns:
+        Tupla (texto de cada página, total de páginas del PDF)
+    """
+    usar_alarma = limite is not None and hasattr(signal, 'SIGALRM')
+    if usar_alarma:
+        restante = limite - time.time()
+        if restante <= 0:
+            raise TimeoutError(f"Extracción de {ruta_pdf} superó el tiempo máximo")
+
+        def _expirar(signum, frame):
+            raise TimeoutError(f"Extracción de {ruta_pdf} superó el tiempo máximo")
+        signal.signal(signal.SIGALRM, _expirar)
+        signal.alarm(max(1, math.ceil(restante)))
+    try:
+        with open(ruta_pdf, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            textos = [(page.extract_text() or "") for page in pdf_reader.pages[inicio:fin]]
+            return textos, len(pdf_reader.pages)
+    finally:
+        if usar_alarma:
+            signal.alarm(0)
+
+
+def _leer_textos_paginas(ruta_pdf: str, inicio: int = 0, fin: int = None) -> List[str]:
+    """Texto de cada página [inicio, fin) de un PDF según PyPDF2 ("" si la página no tiene texto)"""
+    with open(ruta_pdf, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(page.extract_text() or "") for page in pdf_reader.pages[inicio:fin]]
+
+
+def _tarea_ocr_pagina(ruta_pdf: str, pagina: int, dpi: int, lang: str = 'spa') -> str:
+    """Renderiza una sola página (base 1) a la resolución indicada y le aplica OCR"""
+    from pdf2image import convert_from_path
+
+    imagenes = convert_from_path(ruta_pdf, dpi=dpi, first_page=pagina, last_page=pagina)
+    try:
+        return "\n".join(pytesseract.image_to_string(imagen, lang=lang) for imagen in imagenes)
+    finally:
+        for imagen in imagenes:
+            imagen.close()
+
+
 class Funciones:
     @staticmethod
     def crear_carpeta(ruta: str) -> bool:
@@ -136,39 +191,169 @@ class Funciones:
             Texto extraído del PDF
         """
         try:
-            texto = ""
-            with open(ruta_pdf, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    texto += page.extract_text() + "\n"
-            return texto.strip()
+            return "\n".join(_tarea_extraer_paginas(ruta_pdf)[0]).strip()
         except Exception as e:
             print(f"Error al extraer texto del PDF {ruta_pdf}: {e}")
             return ""
+
+    @staticmethod
+    def contar_paginas_pdf(ruta_pdf: str) -> int:
+        """Retorna el número de páginas de un PDF (0 si no se puede leer)"""
+        try:
+            with open(ruta_pdf, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            print(f"Error al contar páginas del PDF {ruta_pdf}: {e}")
+            return 0
+
+    @staticmethod
+    def extraer_paginas_pdf_pool(pool: ProcessPoolExecutor, ruta_pdf: str, timeout: int = 300,
+                                 paginas_por_tarea: int = 100) -> Optional[List[str]]:
+        """
+        Extrae el texto de cada página de un PDF usando un pool de procesos existente
+        (compartido entre hilos).
+
+        El primer bloque de páginas se extrae en el pool y de paso informa el total de
+        páginas, con el que se envían los bloques restantes; así el PDF no se abre en
+        el hilo que llama solo para contarlas.
+
+        Args:
+            pool: ProcessPoolExecutor donde se ejecutan los bloques de páginas
+            ruta_pdf: Ruta del archivo PDF
+            timeout: Segundos máximos para el archivo completo, sumando todos sus bloques (0 = sin límite)
+            paginas_por_tarea: Páginas por bloque
+
+        Returns:
+            Texto de cada página ("" en las páginas de bloques que fallaron), o None si
+            el PDF no se pudo abrir dentro del tiempo máximo
+        """
+        limite = time.time() + timeout if timeout else None
+        try:
+            paginas, total_paginas = pool.submit(_tarea_extraer_paginas, ruta_pdf, 0,
+                                                 paginas_por_tarea, limite).result()
+        except Exception as e:
+            print(f"Error al extraer texto del PDF {ruta_pdf}: {e}")
+            return None
+
+        bloques = [(inicio, min(inicio + paginas_por_tarea, total_paginas))
+                   for inicio in range(paginas_por_tarea, total_paginas, paginas_por_tarea)]
+        futuros = [pool.submit(_tarea_extraer_paginas, ruta_pdf, inicio, fin, limite) for inicio, fin in bloques]
+        for (inicio, fin), futuro in zip(bloques, futuros):
+            try:
+                paginas.extend(futuro.result()[0])
+            except Exception as e:
+                print(f"Error al extraer texto del PDF {ruta_pdf}: {e}")
+                paginas.extend([""] * (fin - inicio))
+        return paginas
+
+    @staticmethod
+    def extraer_texto_pdf_pool(pool: ProcessPoolExecutor, ruta_pdf: str, timeout: int = 300,
+                               paginas_por_tarea: int = 100) -> str:
+        """
+        Extrae el texto de un PDF usando un pool de procesos existente (ver extraer_paginas_pdf_pool)
+
+        Returns:
+            Texto extraído ("" en los bloques que fallaron)
+        """
+        paginas = Funciones.extraer_paginas_pdf_pool(pool, ruta_pdf, timeout, paginas_por_tarea)
+        return "\n".join(paginas or []).strip()
     
     @staticmethod
-    def extraer_texto_pdf_ocr(ruta_pdf: str) -> str:
+    def contexto_procesos():
+        """
+        Contexto de multiprocessing para procesos que se crean con otros hilos corriendo
+        (pools del pipeline de ingesta, nlp.pipe con n_process > 1)
+
+        Usa 'forkserver' ('spawn' donde no existe): con fork, el proceso nuevo hereda
+        locks tomados por otros hilos (pools de spaCy/torch, SQLite) y puede bloquearse.
+        El servidor precarga este módulo, así cada proceso no lo vuelve a importar.
+        """
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            contexto = multiprocessing.get_context('forkserver')
+            contexto.set_forkserver_preload([__name__])
+            return contexto
+        return multiprocessing.get_context('spawn')
+
+    @staticmethod
+    def workers_ocr(dpi: int = 200, max_workers: int = None, memoria_max_mb: int = 2048) -> int:
+        """
+        Procesos de OCR que caben en `memoria_max_mb`, con páginas renderizadas a `dpi`
+
+        Args:
+            dpi: Resolución de renderizado de cada página
+            max_workers: Número máximo de procesos (por defecto, número de núcleos)
+            memoria_max_mb: Memoria aproximada disponible para todas las páginas en proceso
+
+        Returns:
+            Número de procesos (al menos 1)
+        """
+        # Memoria estimada por página: imagen RGB tamaño carta a `dpi` x4 (margen para tesseract)
+        mb_por_pagina = (8.5 * dpi) * (11 * dpi) * 3 * 4 / (1024 * 1024)
+        return max(1, min(max_workers or os.cpu_count() or 1, int(memoria_max_mb // mb_por_pagina)))
+
+    @staticmethod
+    def extraer_texto_pdf_ocr(ruta_pdf: str, dpi: int = 200, max_workers: int = None,
+                              memoria_max_mb: int = 2048, min_caracteres_pagina: int = 20,
+                              lang: str = 'spa', pool: ProcessPoolExecutor = None,
+                              textos: List[str] = None) -> str:
         """
         Extrae texto de un PDF usando OCR (útil para PDFs escaneados)
+
+        Solo se aplica OCR a las páginas donde PyPDF2 no obtuvo texto útil. Cada página
+        se renderiza por separado (first_page/last_page) y las páginas se reparten en
+        un pool de procesos, limitado para no superar `memoria_max_mb`.
+
+        Si varios hilos hacen OCR a la vez, deben compartir un mismo `pool` (creado con
+        `workers_ocr` procesos): así el límite de memoria vale para todos juntos.
         
         Args:
             ruta_pdf: Ruta del archivo PDF
+            dpi: Resolución de renderizado de cada página
+            max_workers: Número máximo de procesos de OCR (por defecto, número de núcleos)
+            memoria_max_mb: Memoria aproximada disponible para todas las páginas en proceso
+            min_caracteres_pagina: Páginas con menos caracteres que esto se pasan por OCR
+            lang: Idioma de tesseract
+            pool: Pool de procesos compartido (si no se indica, se crea uno para este PDF)
+            textos: Texto de cada página ya extraído (p. ej. con extraer_paginas_pdf_pool);
+                    si se indica, el PDF no se vuelve a leer en este hilo
             
         Returns:
             Texto extraído usando OCR
         """
         try:
-            from pdf2image import convert_from_path
-            
-            # Convertir PDF a imágenes
-            images = convert_from_path(ruta_pdf)
-            
-            texto = ""
-            for i, image in enumerate(images):
-                # Aplicar OCR a cada página
-                texto += pytesseract.image_to_string(image, lang='spa') + "\n"
-            
-            return texto.strip()
+            if textos is not None:
+                textos = list(textos)
+            else:
+                try:
+                    textos = _leer_textos_paginas(ruta_pdf)
+                except Exception:
+                    textos = [""] * Funciones.contar_paginas_pdf(ruta_pdf)
+
+            paginas_ocr = [i for i, t in enumerate(textos) if len(t.strip()) < min_caracteres_pagina]
+            if not paginas_ocr:
+                return "\n".join(textos).strip()
+
+            propio = pool is None
+            if propio:
+                workers = min(Funciones.workers_ocr(dpi, max_workers, memoria_max_mb), len(paginas_ocr))
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=Funciones.contexto_procesos())
+                print(f" → OCR de {len(paginas_ocr)}/{len(textos)} páginas ({dpi} dpi, {workers} procesos)")
+            else:
+                print(f" → OCR de {len(paginas_ocr)}/{len(textos)} páginas ({dpi} dpi, pool compartido)")
+
+            try:
+                futuros = {pool.submit(_tarea_ocr_pagina, ruta_pdf, i + 1, dpi, lang): i for i in paginas_ocr}
+                for futuro in as_completed(futuros):
+                    i = futuros[futuro]
+                    try:
+                        textos[i] = futuro.result()
+                    except Exception as e:
+                        print(f"Error de OCR en la página {i + 1} del PDF {ruta_pdf}: {e}")
+            finally:
+                if propio:
+                    pool.shutdown(wait=True)
+
+            return "\n".join(textos).strip()
         except Exception as e:
             print(f"Error al extraer texto con OCR del PDF {ruta_pdf}: {e}")
             return ""
@@ -0,0 +1,475 @@
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Callable, Iterable
+
+from .funciones import Funciones
+
+# Marca de fin que cada etapa envía a la siguiente cuando terminan todos sus hilos
+_FIN = object()
+
+
+class PipelineIngesta:
+    """
+    Pipeline productor/consumidor para ingerir documentos normativos en Elastic.
+
+    Cada etapa tiene sus propios hilos y se comunica con la siguiente por una cola
+    acotada, de modo que los primeros documentos llegan a Elastic mientras los
+    siguientes PDF todavía se están extrayendo:
+
+        hash → filtro de duplicados → extracción de texto → PLN → indexación
+
+    Lo ya indexado no se pierde si el proceso falla más adelante, y los textos y
+    resultados de PLN quedan en las cachés en disco.
+    """
+
+    def __init__(self, elastic, index: str, pln, cache_textos=None, cache_pln=None,
+                 workers_hash: int = 4, workers_extraccion: int = None, workers_pln: int = 1,
+                 tamano_cola: int = 64, lote_filtro: int = 200, lote_pln: int = 32,
+                 batch_size_pln: int = 8, n_process_pln: int = 1,
+                 timeout_pdf: int = 300, ocr_dpi: int = 200, ocr_workers: int = None,
+                 ocr_memoria_mb: int = 2048, chunk_docs: int = 200, chunk_mb: int = 20,
+                 progreso: Callable[[str, Dict], None] = None):
+        """
+        Configura el pipeline
+
+        Args:
+            elastic: Instancia de ElasticSearch
+            index: Índice destino
+            pln: Instancia de PLN con los modelos cargados
+            cache_textos: CacheDisco de textos extraídos (opcional)
+            cache_pln: CacheDisco de resultados de PLN (opcional)
+            workers_hash: Hilos que calculan hashes
+            workers_extraccion: Hilos (y procesos) de extracción de texto (por defecto, núcleos)
+            workers_pln: Hilos que ejecutan PLN (cada uno usa nlp.pipe con n_process_pln)
+            tamano_cola: Elementos máximos en cada cola entre etapas
+            lote_filtro: Hashes por consulta de duplicados a Elastic
+            lote_pln: Textos máximos por llamada a procesar_lote
+            batch_size_pln / n_process_pln: Parámetros de nlp.pipe
+            timeout_pdf: Segundos máximos para extraer el texto de un PDF (todos sus bloques)
+            ocr_dpi / ocr_workers / ocr_memoria_mb: Parámetros del OCR; un solo pool de OCR,
+                dimensionado con ocr_memoria_mb, lo comparten todos los hilos de extracción
+            chunk_docs / chunk_mb: Tamaño máximo de cada petición bulk
+            progreso: Función llamada con (etapa, estadísticas) cada vez que avanza una etapa
+        """
+        self.elastic = elastic
+        self.index = index
+        self.pln = pln
+        self.cache_textos = cache_textos
+        self.cache_pln = cache_pln
+        self.workers_hash = max(1, workers_hash)
+        self.workers_extraccion = max(1, workers_extraccion or os.cpu_count() or 1)
+        self.workers_pln = max(1, workers_pln)
+        self.tamano_cola = tamano_cola
+        self.lote_filtro = lote_filtro
+        self.lote_pln = lote_pln
+        self.batch_size_pln = batch_size_pln
+        self.n_process_pln = n_process_pln
+        self.timeout_pdf = timeout_pdf
+        self.ocr_dpi = ocr_dpi
+        self.ocr_workers = ocr_workers
+        self.ocr_memoria_mb = ocr_memoria_mb
+        self.chunk_docs = chunk_docs
+        self.chunk_mb = chunk_mb
+        self.progreso = progreso
+
+        self.cancelado = threading.Event()
+        self._lock = threading.Lock()
+        self._hashes_vistos = set()
+        self._pool_pdf = None
+        self._pool_ocr = None
+        self._documentos_terminados = False
+        self.estadisticas = {
+            'archivos': 0,
+            'hasheados': 0,
+            'duplicados': 0,
+            'extraidos': 0,
+            'textos_cache': 0,
+            'sin_texto': 0,
+            'procesados_pln': 0,
+            'pln_cache': 0,
+            'indexados': 0,
+            'duplicados_elastic': 0,
+            'fallidos': 0,
+            'errores_pln': 0,
+            'errores_filtro': 0,
+            'errores_etapas': 0
+        }
+
+    # ---------------------------
+    # Ejecución
+    # ---------------------------
+    def ejecutar(self, archivos: List[Dict]) -> Dict:
+        """
+        Ejecuta el pipeline completo sobre una lista de archivos ({'ruta', 'nombre', 'extension'})
+
+        Returns:
+            Diccionario con el resultado de la indexación y las estadísticas por etapa
+        """
+        inicio = time.perf_counter()
+        self.estadisticas['archivos'] = len(archivos)
+
+        cola_archivos = queue.Queue(self.tamano_cola)
+        cola_hasheados = queue.Queue(self.tamano_cola)
+        cola_nuevos = queue.Queue(self.tamano_cola)
+        cola_textos = queue.Queue(self.tamano_cola)
+        cola_documentos = queue.Queue(self.tamano_cola)
+
+        # Los pools arrancan sus procesos en el primer submit, desde hilos de las etapas: sin fork
+        contexto = Funciones.contexto_procesos()
+        self._pool_pdf = ProcessPoolExecutor(max_workers=self.workers_extraccion, mp_context=contexto)
+        # Un solo pool de OCR para todos los hilos: el presupuesto de memoria es del pipeline, no de cada PDF
+        self._pool_ocr = ProcessPoolExecutor(max_workers=Funciones.workers_ocr(self.ocr_dpi, self.ocr_workers,
+                                                                               self.ocr_memoria_mb),
+                                             mp_context=contexto)
+        try:
+            hilos = []
+            hilos += self._lanzar_etapa('hash', self.workers_hash, cola_archivos, cola_hasheados,
+                                        1, self._etapa_hash)
+            hilos += self._lanzar_etapa('filtro', 1, cola_hasheados, cola_nuevos,
+                                        self.workers_extraccion, self._etapa_filtro,
+                                        lote=self.lote_filtro, espera=0.5)
+            hilos += self._lanzar_etapa('extraccion', self.workers_extraccion, cola_nuevos, cola_textos,
+                                        self.workers_pln, self._etapa_extraccion)
+            hilos += self._lanzar_etapa('pln', self.workers_pln, cola_textos, cola_documentos,
+                                        1, self._etapa_pln, lote=self.lote_pln, espera=2.0)
+
+            alimentador = threading.Thread(target=self._alimentar, args=(archivos, cola_archivos),
+                                           name='ingesta-entrada', daemon=True)
+            alimentador.start()
+
+            # Indexación en este hilo, consumiendo los documentos a medida que llegan
+            resultado = self.elastic.indexar_streaming(
+                self.index, self._consumir(cola_documentos),
+                campo_id='hash_archivo', op_type='create',
+                chunk_size=self.chunk_docs,
+                max_chunk_bytes=self.chunk_mb * 1024 * 1024,
+                progreso=self._progreso_indexacion
+            )
+
+            # Si el indexador se detuvo antes de tiempo, cancelar y vaciar la cola para liberar las etapas
+            if not self._documentos_terminados:
+                self.cancelar()
+                for _ in self._consumir(cola_documentos):
+                    pass
+
+            alimentador.join()
+            for hilo in hilos:
+                hilo.join()
+        finally:
+            self._pool_pdf.shutdown(wait=True, cancel_futures=True)
+            self._pool_pdf = None
+            self._pool_ocr.shutdown(wait=True, cancel_futures=True)
+            self._pool_ocr = None
+
+        resultado['cancelado'] = self.cancelado.is_set()
+        resultado['segundos'] = round(time.perf_counter() - inicio, 1)
+        resultado['etapas'] = dict(self.estadisticas)
+        print("[INGESTA] Resultado:", {k: v for k, v in resultado.items() if k != 'errores'})
+        return resultado
+
+    def cancelar(self):
+        """Pide detener el pipeline: las etapas dejan de procesar y vacían sus colas"""
+        self.cancelado.set()
+
+    def _alimentar(self, archivos: Iterable[Dict], cola: queue.Queue):
+        """Pone los archivos en la cola de entrada y la marca de fin"""
+        for archivo in archivos:
+            if self.cancelado.is_set():
+                break
+            cola.put(archivo)
+        for _ in range(self.workers_hash):
+            cola.put(_FIN)
+
+    def _consumir(self, cola: queue.Queue):
+        """Generador de documentos para el indexador, hasta recibir la marca de fin"""
+        while True:
+            item = cola.get()
+            if item is _FIN:
+                self._documentos_terminados = True
+                return
+            if not self.cancelado.is_set():
+                yield item
+
+    def _lanzar_etapa(self, nombre: str, n_workers: int, entrada: queue.Queue, salida: queue.Queue,
+                      n_workers_siguiente: int, procesar: Callable[[List], Iterable],
+                      lote: int = 1, espera: float = None) -> List[threading.Thread]:
+        """
+        Lanza los hilos de una etapa.
+
+        Cada hilo toma elementos de `entrada` (hasta `lote` por vez, o los que haya tras
+        `espera` segundos sin recibir más), llama a `procesar(lista)` y pone en `salida`
+        lo que este genere. Cuando termina el último hilo de la etapa, envía una marca
+        de fin por cada hilo de la etapa siguiente.
+        """
+        restantes = [n_workers]
+
+        def trabajador():
+            pendientes = []
+            fin = False
+            try:
+                while not fin:
+                    try:
+                        item = entrada.get(timeout=espera if pendientes else None)
+                    except queue.Empty:
+                        item = None
+
+                    if item is _FIN:
+                        fin = True
+                    elif item is not None:
+                        pendientes.append(item)
+
+                    if pendientes and (fin or item is None or len(pendientes) >= lote):
+                        if not self.cancelado.is_set():
+                            try:
+                                for resultado in procesar(pendientes):
+                                    salida.put(resultado)
+                            except Exception as e:
+                                self._contar('errores_etapas')
+                                print(f"[INGESTA] Error en etapa '{nombre}': {e}")
+                        pendientes = []
+            finally:
+                with self._lock:
+                    restantes[0] -= 1
+                    ultimo = restantes[0] == 0
+                if ultimo:
+                    for _ in range(n_workers_siguiente):
+                        salida.put(_FIN)
+
+        hilos = [threading.Thread(target=trabajador, name=f"ingesta-{nombre}-{i}", daemon=True)
+                 for i in range(n_workers)]
+        for hilo in hilos:
+            hilo.start()
+        return hilos
+
+    # ---------------------------
+    # Etapas
+    # ---------------------------
+    def _etapa_hash(self, archivos: List[Dict]):
+        """Calcula el hash SHA-256 de cada archivo existente"""
+        for archivo in archivos:
+            ruta = archivo.get('ruta')
+            if not ruta or not os.path.exists(ruta):
+                print(f"   ✖ Archivo no encontrado: {ruta}")
+                continue
+
+            hash_archivo = Funciones.calcular_hash_archivo(ruta)
+            if not hash_archivo:
+                print(f"Error calculando hash del archivo {ruta}. Se omite.")
+                continue
+
+            archivo['hash_archivo'] = hash_archivo
+            self._contar('hasheados')
+            yield archivo
+
+    def _etapa_filtro(self, archivos: List[Dict]):
+        """Descarta en bloque los archivos cuyo hash ya está indexado (o repetido en esta carga)"""
+        try:
+            existentes = self.elastic.existen_hashes([a['hash_archivo'] for a in archivos], self.index)
+        except Exception as e:
+            # Se siguen procesando (el bulk con op 'create' e _id = hash rechaza los ya indexados),
+            # pero el error queda contado en lugar de pasar por "ningún duplicado"
+            self._contar('errores_filtro')
+            print(f"[INGESTA] Error verificando hashes en Elasticsearch ({len(archivos)} archivos sin filtrar): {e}")
+            existentes = set()
+        for archivo in archivos:
+            hash_archivo = archivo['hash_archivo']
+            with self._lock:
+                repetido = hash_archivo in self._hashes_vistos
+                self._hashes_vistos.add(hash_archivo)
+            if repetido or hash_archivo in existentes:
+                print(f"Documento ya indexado (hash duplicado): {archivo['ruta']}")
+                self._contar('duplicados')
+                continue
+            yield archivo
+
+    def _etapa_extraccion(self, archivos: List[Dict]):
+        """Obtiene el texto de cada archivo desde la caché o extrayéndolo"""
+        for archivo in archivos:
+            texto = self.cache_textos.obtener(archivo['hash_archivo']) if self.cache_textos else None
+            if texto is not None:
+                self._contar('textos_cache')
+            else:
+                print(f"--- Extrayendo texto: {archivo.get('ruta')} ---")
+                texto = self._extraer_texto(archivo)
+                if not texto or len(texto.strip()) < 50:        # si no se extrajo texto suficiente, omitir
+                    self._contar('sin_texto')
+                    continue
+                if self.cache_textos:
+                    self.cache_textos.guardar(archivo['hash_archivo'], texto)
+
+            self._contar('extraidos')
+            yield archivo, texto
+
+    def _etapa_pln(self, lote: List):
+        """Procesa con PLN un lote de (archivo, texto), reutilizando la caché de resultados"""
+        sin_resultado = []
+        for archivo, texto in lote:
+            guardado = self.cache_pln.obtener(self._clave_pln(archivo)) if self.cache_pln else None
+            if guardado is None:
+                sin_resultado.append((archivo, texto))
+                continue
+            self._contar('pln_cache')
+            documento = self._documento_seguro(archivo, texto, json.loads(guardado))
+            if documento:
+                yield documento
+
+        if not sin_resultado:
+            return
+
+        print(f"\n--- Procesando con PLN lote de {len(sin_resultado)} archivos ---")
+        try:
+            procesados = list(zip(sin_resultado, self.pln.procesar_lote([texto for _, texto in sin_resultado],
+                                                                        batch_size=self.batch_size_pln,
+                                                                        n_process=self.n_process_pln)))
+        except Exception as e:
+            # Un documento problemático no debe hacer perder el lote: repetir uno por uno
+            print(f"[INGESTA] Error en lote de PLN ({e}). Reprocesando {len(sin_resultado)} archivos uno por uno")
+            procesados = self._pln_uno_por_uno(sin_resultado)
+
+        for (archivo, texto), resultado_pln in procesados:
+            if self.cache_pln:
+                self.cache_pln.guardar(self._clave_pln(archivo), json.dumps(resultado_pln, ensure_ascii=False))
+            self._contar('procesados_pln')
+            documento = self._documento_seguro(archivo, texto, resultado_pln)
+            if documento:
+                yield documento
+
+    # ---------------------------
+    # Auxiliares
+    # ---------------------------
+    def _extraer_texto(self, archivo: Dict) -> str:
+        """Extrae el texto de un archivo PDF (con OCR si hace falta) o TXT"""
+        ruta = archivo.get('ruta')
+        extension = archivo.get('extension', '').lower()
+
+        texto = ""
+        if extension == 'pdf':
+            # Intentar extracción normal
+            paginas = Funciones.extraer_paginas_pdf_pool(self._pool_pdf, ruta, timeout=self.timeout_pdf)
+            texto = "\n".join(paginas or []).strip()
+            print(f" → Texto extraído (longitud {len(texto)} caracteres): OK")
+
+            # Si no se extrajo texto, intentar con OCR sobre las páginas ya leídas (un PDF que no
+            # se pudo abrir dentro de timeout_pdf no se vuelve a leer aquí, sin tiempo máximo)
+            if paginas is not None and len(texto) < 100:
+                try:
+                    texto = Funciones.extraer_texto_pdf_ocr(ruta, dpi=self.ocr_dpi, pool=self._pool_ocr,
+                                                            textos=paginas)
+                    print(f" → Texto extraído con OCR (longitud {len(texto)} caracteres): OK")
+                except:
+                    pass
+
+        elif extension == 'txt':
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    texto = f.read()
+            except:
+                try:
+                    with open(ruta, 'r', encoding='latin-1') as f:
+                        texto = f.read()
+                except:
+                    pass
+
+        return texto
+
+    def _clave_pln(self, archivo: Dict) -> str:
+        """Clave de la caché de PLN de un archivo"""
+        return self.pln.clave_resultado(archivo['hash_archivo'], incluir_metadatos=True)
+
+    def _pln_uno_por_uno(self, lote: List):
+        """Procesa con PLN cada (archivo, texto) por separado, omitiendo solo los que fallan"""
+        for archivo, texto in lote:
+            try:
+                resultado_pln = self.pln.procesar_lote([texto], batch_size=self.batch_size_pln, n_process=1)[0]
+            except Exception as e:
+                self._contar('errores_pln')
+                print(f"Error de PLN en {archivo.get('nombre')}: {e}")
+                continue
+            yield (archivo, texto), resultado_pln
+
+    def _documento_seguro(self, archivo: Dict, texto: str, resultado_pln: Dict):
+        """crear_documento_norma sin propagar errores (retorna None si falla)"""
+        try:
+            return self.crear_documento_norma(archivo, texto, resultado_pln)
+        except Exception as e:
+            print(f"Error al procesar {archivo.get('nombre')}: {e}")
+            return None
+
+    def crear_documento_norma(self, archivo: Dict, texto: str, resultado_pln: Dict) -> Dict:
+        """Construye el documento a indexar en Elastic a partir del resultado de PLN"""
+        print("   → Resumen generado (longitud {} caracteres)".format(len(resultado_pln.get('resumen', ''))))
+
+        temas_pln = resultado_pln.get("temas", [])
+
+        # Convertir lista de tuplas → lista de objetos
+        temas_convertidos = [
+            {"palabra": palabra, "relevancia": float(relevancia)}
+            for palabra, relevancia in temas_pln
+        ]
+
+        # Metadatos normativos (calculados en el mismo análisis spaCy del lote)
+        meta = resultado_pln.get("metadatos") or self.pln.extraer_metadatos_norma(texto)
+
+        #print("fecha encontrada (raw):", meta.get("fecha_documento"))
+        fecha_normalizada = self.pln.normalizar_fecha(meta.get("fecha_documento"))
+        #print("fecha normalizada:", fecha_normalizada)
+
+        # Crear documento
+        return {
+            "tipo_norma": meta.get("tipo_norma"),
+            "numero_norma": meta.get("numero_norma"),
+            "anio_norma": meta.get("anio_norma"),
+            "entidad_emisora": meta.get("entidad_emisora"),
+            "fecha_documento": fecha_normalizada,
+            "titulo_norma": meta.get("titulo_norma"),
+            'texto': texto[:2_000_000],  # limitar tamaño para Elastic
+            'resumen': resultado_pln.get('resumen', ''),
+            'entidades': resultado_pln.get('entidades', {}),
+            'temas': temas_convertidos,
+            'ruta': archivo.get('ruta'),
+            'nombre_archivo': archivo.get('nombre', ''),
+            'hash_archivo': archivo.get('hash_archivo'),
+            'fecha_carga': datetime.now().isoformat()
+        }
+
+    def avance(self, estadisticas: Dict = None) -> Dict[str, tuple]:
+        """
+        Avance de cada etapa como (procesados, total).
+
+        El total de cada etapa es lo que le puede llegar con lo que se sabe hasta
+        ahora (los archivos menos los descartados antes), así que se ajusta a
+        medida que avanzan las etapas anteriores.
+        """
+        e = estadisticas or self.estadisticas
+        nuevos = e['archivos'] - e['duplicados']
+        con_texto = nuevos - e['sin_texto']
+        return {
+            'hash': (e['hasheados'], e['archivos']),
+            'extraccion': (e['extraidos'] + e['sin_texto'], nuevos),
+            'pln': (e['procesados_pln'] + e['pln_cache'] + e['errores_pln'], con_texto),
+            'indexacion': (e['indexados'] + e['duplicados_elastic'] + e['fallidos'], con_texto - e['errores_pln'])
+        }
+
+    def _contar(self, clave: str, n: int = 1):
+        """Incrementa un contador de estadísticas y notifica el progreso"""
+        with self._lock:
+            self.estadisticas[clave] += n
+            estadisticas = dict(self.estadisticas)
+        if self.progreso:
+            self.progreso(clave, estadisticas)
+
+    def _progreso_indexacion(self, resultado: Dict):
+        """Copia los contadores del indexador a las estadísticas del pipeline"""
+        with self._lock:
+            self.estadisticas['indexados'] = resultado['indexados']
+            self.estadisticas['duplicados_elastic'] = resultado['duplicados']
+            self.estadisticas['fallidos'] = resultado['fallidos']
+            estadisticas = dict(self.estadisticas)
+        print(f"[INDEXACIÓN] {resultado}")
+        if self.progreso:
+            self.progreso('indexados', estadisticas)
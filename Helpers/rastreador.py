@@ -0,0 +1,492 @@
+import os
+import time
+import asyncio
+import sqlite3
+from collections import deque
+from urllib.parse import urlparse
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from playwright.async_api import async_playwright
+
+from .enlaces import recolectar_enlaces_async
+
+# procesar(url, profundidad, enlaces recolectados) -> (URLs a seguir, resultados encontrados)
+Procesador = Callable[[str, int, Dict], Tuple[Iterable[str], Iterable[str]]]
+
+
+class PuntoControlRastreo:
+    """
+    Estado persistente (SQLite) de un rastreo: URLs vistas, frontera pendiente y
+    resultados encontrados, para reanudarlo tras una caída o un reinicio.
+
+    Cada rastreo se identifica con un nombre (por ejemplo su URL inicial), así que
+    varios rastreos pueden compartir el mismo archivo.
+    """
+
+    def __init__(self, ruta_db: str, rastreo: str):
+        """
+        Inicializa (o abre) el punto de control
+
+        Args:
+            ruta_db: Ruta del archivo SQLite
+            rastreo: Identificador del rastreo
+        """
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta_db = ruta_db
+        self.rastreo = rastreo
+        self.conn = sqlite3.connect(ruta_db, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rastreos (
+                rastreo TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                rastreo TEXT NOT NULL,
+                normalizada TEXT NOT NULL,
+                url TEXT NOT NULL,
+                profundidad INTEGER NOT NULL,
+                visitada INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (rastreo, normalizada)
+            );
+            CREATE TABLE IF NOT EXISTS resultados (
+                rastreo TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (rastreo, url)
+            );
+        """)
+        self.conn.commit()
+
+    def cargar(self) -> Optional[Dict]:
+        """
+        Retorna el estado guardado de un rastreo sin terminar, o None si no hay
+
+        Returns:
+            {'pendientes': [(url, profundidad)], 'vistos': set, 'resultados': [url]}
+        """
+        fila = self.conn.execute("SELECT estado FROM rastreos WHERE rastreo = ?", (self.rastreo,)).fetchone()
+        if not fila or fila[0] != 'en_curso':
+            return None
+        pendientes = self.conn.execute(
+            "SELECT url, profundidad FROM urls WHERE rastreo = ? AND visitada = 0 ORDER BY profundidad, rowid",
+            (self.rastreo,)
+        ).fetchall()
+        vistos = {f[0] for f in self.conn.execute("SELECT normalizada FROM urls WHERE rastreo = ?", (self.rastreo,))}
+        resultados = [f[0] for f in self.conn.execute(
+            "SELECT url FROM resultados WHERE rastreo = ? ORDER BY rowid", (self.rastreo,))]
+        return {'pendientes': [tuple(p) for p in pendientes], 'vistos': vistos, 'resultados': resultados}
+
+    def reiniciar(self):
+        """Borra el estado guardado y empieza el rastreo de cero"""
+        ahora = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM urls WHERE rastreo = ?", (self.rastreo,))
+            self.conn.execute("DELETE FROM resultados WHERE rastreo = ?", (self.rastreo,))
+            self.conn.execute("INSERT OR REPLACE INTO rastreos (rastreo, estado, creado, actualizado) "
+                              "VALUES (?, 'en_curso', ?, ?)", (self.rastreo, ahora, ahora))
+
+    def guardar(self, nuevas: List[Tuple[str, str, int]], visitadas: List[str], resultados: List[str]):
+        """
+        Guarda en una sola transacción las URLs encoladas, las visitadas y los resultados
+
+        Args:
+            nuevas: (normalizada, url, profundidad) de las URLs agregadas a la frontera
+            visitadas: URLs normalizadas ya visitadas
+            resultados: Resultados encontrados
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO urls (rastreo, normalizada, url, profundidad) VALUES (?, ?, ?, ?)",
+                [(self.rastreo, n, u, p) for n, u, p in nuevas]
+            )
+            self.conn.executemany("UPDATE urls SET visitada = 1 WHERE rastreo = ? AND normalizada = ?",
+                                  [(self.rastreo, n) for n in visitadas])
+            self.conn.executemany("INSERT OR IGNORE INTO resultados (rastreo, url) VALUES (?, ?)",
+                                  [(self.rastreo, r) for r in resultados])
+            self.conn.execute("UPDATE rastreos SET actualizado = ? WHERE rastreo = ?", (time.time(), self.rastreo))
+
+    def finalizar(self):
+        """Marca el rastreo como completado (ya no se reanuda)"""
+        with self.conn:
+            self.conn.execute("UPDATE rastreos SET estado = 'completado', actualizado = ? WHERE rastreo = ?",
+                              (time.time(), self.rastreo))
+
+    def close(self):
+        """Cierra la conexión"""
+        self.conn.close()
+
+
+class RegistroEnlaces:
+    """
+    Conjunto persistente (SQLite) de los enlaces ya procesados de una fuente, para
+    rastreos incrementales que solo reportan lo nuevo.
+
+    Un enlace se confirma después de procesarlo (descargarlo, indexarlo...), no al
+    encontrarlo: si algo falla antes, se vuelve a reportar en la siguiente ejecución.
+    """
+
+    def __init__(self, ruta_db: str, fuente: str):
+        """
+        Inicializa (o abre) el registro
+
+        Args:
+            ruta_db: Ruta del archivo SQLite
+            fuente: Identificador de la fuente (por ejemplo la URL del listado)
+        """
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta_db = ruta_db
+        self.fuente = fuente
+        self.conn = sqlite3.connect(ruta_db, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS enlaces_vistos (
+                fuente TEXT NOT NULL,
+                url TEXT NOT NULL,
+                visto REAL NOT NULL,
+                PRIMARY KEY (fuente, url)
+            )
+        """)
+        self.conn.commit()
+
+    def conocidos(self) -> set:
+        """URLs ya confirmadas de la fuente"""
+        return {f[0] for f in self.conn.execute("SELECT url FROM enlaces_vistos WHERE fuente = ?", (self.fuente,))}
+
+    def confirmar(self, urls: Iterable[str]):
+        """Registra URLs como procesadas"""
+        ahora = time.time()
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO enlaces_vistos (fuente, url, visto) VALUES (?, ?, ?)",
+                                  [(self.fuente, u, ahora) for u in urls])
+
+    def close(self):
+        """Cierra la conexión"""
+        self.conn.close()
+
+
+class RastreadorBFS:
+    """
+    Motor de rastreo en anchura (BFS) con varias páginas de Playwright en paralelo.
+
+    - La frontera es una `deque` de (url, profundidad): se toma por la izquierda y
+      se agrega por la derecha, así que se visita nivel por nivel.
+    - `n_trabajadores` tareas asíncronas, cada una con su propia página, toman URLs
+      de la frontera mientras haya trabajo.
+    - Entre dos peticiones al mismo dominio pasan al menos `espera_dominio` segundos.
+    - Se detiene al agotar la frontera o el presupuesto de páginas (`max_paginas`);
+      no se encolan enlaces más profundos que `max_profundidad`.
+
+    - Con un `lector_html`, cada página se intenta primero con un GET plano; el
+      navegador solo se abre (y solo entonces se lanza Chromium) para las páginas
+      cuyo HTML estático no trae el selector esperado.
+
+    - Una página que falla vuelve al final de la frontera hasta `max_reintentos`
+      veces; si sigue fallando no se marca como visitada, así que con punto de
+      control el rastreo queda abierto y se reintenta al reanudar.
+
+    - Con un `punto_control`, el estado se guarda cada `intervalo_guardado` segundos
+      y un rastreo interrumpido (o cortado por `max_paginas`) se reanuda donde quedó.
+
+    Lo que se hace con los enlaces de cada página lo decide la función `procesar`
+    del llamador, que retorna las URLs que se deben seguir y los resultados
+    encontrados (que se acumulan en `resultados`).
+    """
+
+    def __init__(self, n_trabajadores: int = 4, max_profundidad: int = 5, max_paginas: Optional[int] = None,
+                 espera_dominio: float = 1.0, timeout_pagina: int = 30_000, headless: bool = True,
+                 bloqueo=None, selector_enlaces: str = "a[href]", selector_contenedor: Optional[str] = None,
+                 lector_html=None, selector_esperado: Optional[str] = None,
+                 punto_control: Optional[PuntoControlRastreo] = None, intervalo_guardado: float = 30.0,
+                 max_reintentos: int = 2):
+        """
+        Configura el rastreo
+
+        Args:
+            n_trabajadores: Páginas de Playwright cargando en paralelo
+            max_profundidad: Profundidad máxima desde la URL inicial
+            max_paginas: Máximo de páginas visitadas (None = sin límite)
+            espera_dominio: Segundos mínimos entre peticiones a un mismo dominio
+            timeout_pagina: Milisegundos máximos de carga de cada página
+            headless: Navegador sin interfaz
+            bloqueo: BloqueoRecursos opcional (modo ligero)
+            selector_enlaces: Selector CSS de los enlaces a recolectar
+            selector_contenedor: Selector CSS opcional del contenedor de interés
+            lector_html: LectorHTML opcional para la vía rápida sin navegador
+            selector_esperado: Selector que debe traer el HTML estático para no usar el navegador
+            punto_control: PuntoControlRastreo opcional para guardar y reanudar el rastreo
+            intervalo_guardado: Segundos entre guardados del punto de control
+            max_reintentos: Veces que se vuelve a encolar una página que falló
+        """
+        self.n_trabajadores = max(1, n_trabajadores)
+        self.max_profundidad = max_profundidad
+        self.max_paginas = max_paginas
+        self.espera_dominio = espera_dominio
+        self.timeout_pagina = timeout_pagina
+        self.headless = headless
+        self.bloqueo = bloqueo
+        self.selector_enlaces = selector_enlaces
+        self.selector_contenedor = selector_contenedor
+        self.lector_html = lector_html
+        self.selector_esperado = selector_esperado
+        self.punto_control = punto_control
+        self.intervalo_guardado = intervalo_guardado
+        self.max_reintentos = max_reintentos
+
+        self.frontera = deque()
+        self.vistos = set()
+        self.resultados: List[str] = []
+        self._resultados_vistos = set()
+        self._fallos: Dict[str, int] = {}
+        self._por_guardar = {'nuevas': [], 'visitadas': [], 'resultados': []}
+        self._ultimo_guardado = time.monotonic()
+        self.estadisticas = {'visitadas': 0, 'errores': 0, 'reintentos': 0, 'fallidas': 0, 'encoladas': 0,
+                             'fuera_de_profundidad': 0, 'estaticas': 0, 'con_navegador': 0}
+
+    @staticmethod
+    def normalizar_url(url: str) -> str:
+        """Normaliza la URL eliminando fragmentos (#) y la barra final, para comparar visitados"""
+        return url.split('#')[0].rstrip('/')
+
+    # ---------------------------
+    # Frontera
+    # ---------------------------
+    def agregar(self, url: str, profundidad: int) -> bool:
+        """Encola una URL si no se ha visto y no supera la profundidad máxima"""
+        if profundidad > self.max_profundidad:
+            self.estadisticas['fuera_de_profundidad'] += 1
+            return False
+        normalizada = self.normalizar_url(url)
+        if normalizada in self.vistos:
+            return False
+        self.vistos.add(normalizada)
+        self.frontera.append((url, profundidad))
+        if self.punto_control:
+            self._por_guardar['nuevas'].append((normalizada, url, profundidad))
+        self.estadisticas['encoladas'] += 1
+        return True
+
+    def _presupuesto_agotado(self) -> bool:
+        return self.max_paginas is not None and self.estadisticas['visitadas'] >= self.max_paginas
+
+    async def _siguiente(self):
+        """Toma la siguiente URL de la frontera; None cuando ya no queda trabajo"""
+        async with self._condicion:
+            while not self.frontera and self._en_proceso > 0 and not self._presupuesto_agotado():
+                await self._condicion.wait()
+            if not self.frontera or self._presupuesto_agotado():
+                self._condicion.notify_all()
+                return None
+            self._en_proceso += 1
+            self.estadisticas['visitadas'] += 1
+            return self.frontera.popleft()
+
+    async def _terminar(self, url: str, profundidad: int, siguientes: Iterable[str], resultados: Iterable[str]):
+        """Encola los enlaces a seguir de una página visitada, guarda sus resultados y despierta a los trabajadores"""
+        async with self._condicion:
+            for siguiente in siguientes:
+                self.agregar(siguiente, profundidad + 1)
+            for resultado in resultados:
+                if resultado not in self._resultados_vistos:
+                    self._resultados_vistos.add(resultado)
+                    self.resultados.append(resultado)
+                    if self.punto_control:
+                        self._por_guardar['resultados'].append(resultado)
+            if self.punto_control:
+                self._por_guardar['visitadas'].append(self.normalizar_url(url))
+                if time.monotonic() - self._ultimo_guardado >= self.intervalo_guardado:
+                    self._guardar()
+            self._en_proceso -= 1
+            self._condicion.notify_all()
+
+    async def _fallar(self, url: str, profundidad: int):
+        """Vuelve a encolar una página que falló o, agotados los reintentos, la deja sin visitar"""
+        async with self._condicion:
+            normalizada = self.normalizar_url(url)
+            self._fallos[normalizada] = self._fallos.get(normalizada, 0) + 1
+            if self._fallos[normalizada] <= self.max_reintentos:
+                self.frontera.append((url, profundidad))
+                self.estadisticas['reintentos'] += 1
+            else:
+                # Sigue con visitada = 0 en el punto de control: se reintenta al reanudar
+                self.estadisticas['fallidas'] += 1
+                print(f"[ERROR] {url} falló {self._fallos[normalizada]} veces; se deja sin visitar")
+            self._en_proceso -= 1
+            self._condicion.notify_all()
+
+    # ---------------------------
+    # Punto de control
+    # ---------------------------
+    def _guardar(self):
+        """Escribe en el punto de control lo acumulado desde el último guardado"""
+        por_guardar = self._por_guardar
+        if not any(por_guardar.values()):
+            return
+        try:
+            self.punto_control.guardar(por_guardar['nuevas'], por_guardar['visitadas'], por_guardar['resultados'])
+            self._por_guardar = {'nuevas': [], 'visitadas': [], 'resultados': []}
+            self._ultimo_guardado = time.monotonic()
+        except Exception as e:
+            print(f"[RASTREO] Error al guardar el punto de control: {e}")
+
+    def _restaurar(self, urls_iniciales: Iterable[str], reanudar: bool) -> bool:
+        """Carga el estado guardado si hay un rastreo sin terminar; si no, empieza de cero"""
+        estado = self.punto_control.cargar() if reanudar else None
+        if estado is None:
+            self.punto_control.reiniciar()
+            for url in urls_iniciales:
+                self.agregar(url, 0)
+            return False
+
+        self.frontera.extend(estado['pendientes'])
+        self.vistos.update(estado['vistos'])
+        self.resultados.extend(estado['resultados'])
+        self._resultados_vistos.update(estado['resultados'])
+        print(f"[RASTREO] Reanudando: {len(estado['vistos']) - len(estado['pendientes'])} páginas visitadas, "
+              f"{len(estado['pendientes'])} pendientes, {len(estado['resultados'])} resultados")
+        return True
+
+    # ---------------------------
+    # Cortesía por dominio
+    # ---------------------------
+    async def _esperar_turno(self, url: str):
+        """Espera hasta que se pueda hacer otra petición al dominio de `url`"""
+        dominio = urlparse(url).netloc.lower()
+        if dominio not in self._locks_dominio:
+            self._locks_dominio[dominio] = asyncio.Lock()
+        async with self._locks_dominio[dominio]:
+            espera = self._proxima_peticion.get(dominio, 0) - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            self._proxima_peticion[dominio] = time.monotonic() + self.espera_dominio
+
+    # ---------------------------
+    # Navegador (se lanza solo si hace falta)
+    # ---------------------------
+    async def _contexto(self):
+        """Contexto compartido del navegador; lanza Chromium la primera vez que se pide"""
+        async with self._lock_navegador:
+            if self._context is None:
+                self._browser = await self._play.chromium.launch(headless=self.headless)
+                self._context = await self._browser.new_context()
+                if self.bloqueo:
+                    await self.bloqueo.aplicar_async(self._context)
+            return self._context
+
+    # ---------------------------
+    # Visita de páginas
+    # ---------------------------
+    async def obtener_enlaces(self, url: str, pagina: Callable[[], Awaitable]) -> Dict:
+        """
+        Obtiene los enlaces de `url`: primero con HTML estático (si hay `lector_html`)
+        y, si no basta, cargándola en el navegador
+
+        Args:
+            url: Página a visitar
+            pagina: Corrutina que entrega la página de Playwright del trabajador
+
+        Returns:
+            {'url': url final, 'contenedor': bool, 'enlaces': [{'href', 'en_contenedor'}]}
+        """
+        # Sin selector esperado no hay cómo confiar en el HTML estático: directo al navegador
+        if self.lector_html and (self.selector_esperado or self.selector_contenedor):
+            await self._esperar_turno(url)
+            recolectados = await asyncio.to_thread(self.lector_html.leer, url, self.selector_enlaces,
+                                                   self.selector_contenedor, self.selector_esperado)
+            if recolectados is not None:
+                self.estadisticas['estaticas'] += 1
+                return recolectados
+
+        page = await pagina()
+        await self._esperar_turno(url)
+        await page.goto(url, timeout=self.timeout_pagina, wait_until='domcontentloaded')
+        recolectados = await recolectar_enlaces_async(page, self.selector_enlaces, self.selector_contenedor)
+        recolectados['url'] = url
+        self.estadisticas['con_navegador'] += 1
+        return recolectados
+
+    async def _trabajador(self, procesar: Procesador):
+        """Toma URLs de la frontera hasta que no quede trabajo"""
+        paginas = []
+
+        async def pagina():
+            if not paginas:
+                paginas.append(await (await self._contexto()).new_page())
+            return paginas[0]
+
+        try:
+            while True:
+                item = await self._siguiente()
+                if item is None:
+                    return
+                url, profundidad = item
+                try:
+                    recolectados = await self.obtener_enlaces(url, pagina)
+                    print(f"[{profundidad}/{self.max_profundidad}] Visitando: {url}")
+                    siguientes, resultados = procesar(url, profundidad, recolectados)
+                except Exception as e:
+                    self.estadisticas['errores'] += 1
+                    print(f"[ERROR] Fallo en {url}: {e}")
+                    await self._fallar(url, profundidad)
+                    continue
+                # Si el rastreo se interrumpe, la página no se marca como visitada y se repite al reanudar
+                await self._terminar(url, profundidad, siguientes, resultados)
+        finally:
+            for page in paginas:
+                await page.close()
+
+    async def recorrer_async(self, urls_iniciales: Iterable[str], procesar: Procesador,
+                             reanudar: bool = True) -> Dict:
+        """
+        Recorre el sitio desde `urls_iniciales`
+
+        Args:
+            urls_iniciales: URLs de profundidad 0
+            procesar: Función (url, profundidad, enlaces recolectados) -> (URLs absolutas a seguir, resultados)
+            reanudar: Con punto de control, continuar el rastreo sin terminar en lugar de empezar de cero
+
+        Returns:
+            Estadísticas del rastreo (los resultados quedan en `resultados`)
+        """
+        inicio = time.perf_counter()
+        self._condicion = asyncio.Condition()
+        self._en_proceso = 0
+        self._locks_dominio: Dict[str, asyncio.Lock] = {}
+        self._proxima_peticion: Dict[str, float] = {}
+        self._lock_navegador = asyncio.Lock()
+        self._browser = None
+        self._context = None
+        if self.punto_control:
+            self.estadisticas['reanudado'] = self._restaurar(urls_iniciales, reanudar)
+        else:
+            for url in urls_iniciales:
+                self.agregar(url, 0)
+
+        async with async_playwright() as play:
+            self._play = play
+            try:
+                await asyncio.gather(*(self._trabajador(procesar) for _ in range(self.n_trabajadores)))
+            finally:
+                if self._browser:
+                    await self._browser.close()
+                if self.punto_control:
+                    self._guardar()
+
+        # Un rastreo cortado por `max_paginas` o con páginas fallidas queda en curso para reanudarlo después
+        if self.punto_control and not self.frontera and not self.estadisticas['fallidas']:
+            self.punto_control.finalizar()
+
+        self.estadisticas['pendientes'] = len(self.frontera)
+        self.estadisticas['segundos'] = round(time.perf_counter() - inicio, 1)
+        return dict(self.estadisticas)
+
+    def recorrer(self, urls_iniciales: Iterable[str], procesar: Procesador, reanudar: bool = True) -> Dict:
+        """Versión síncrona de `recorrer_async`"""
+        return asyncio.run(self.recorrer_async(urls_iniciales, procesar, reanudar))
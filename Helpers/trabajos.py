@@ -0,0 +1,576 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Callable, Tuple, Iterator
+
+
+class TrabajoCancelado(Exception):
+    """Se lanza dentro de un trabajo cuando el usuario pidió cancelarlo"""
+
+
+class ContextoTrabajo:
+    """
+    Lo que recibe la función de un trabajo: sus parámetros, una forma de reportar
+    el progreso y de saber si fue cancelado.
+
+    Además del último evento, el progreso guarda el avance de cada etapa
+    (procesados / total) con su velocidad media y el tiempo estimado restante.
+
+    Las escrituras de progreso y las consultas de cancelación a SQLite se espacian
+    (`intervalo_progreso`, `intervalo_cancelacion`) para no frenar el trabajo.
+    """
+
+    def __init__(self, gestor: 'GestorTrabajos', job_id: str, parametros: Dict,
+                 intervalo_progreso: float = 0.5, intervalo_cancelacion: float = 1.0):
+        self.gestor = gestor
+        self.id = job_id
+        self.parametros = parametros
+        self.intervalo_progreso = intervalo_progreso
+        self.intervalo_cancelacion = intervalo_cancelacion
+        self.ultimo_progreso = None
+        self.etapas: Dict[str, Dict] = {}
+        self._inicio_etapas: Dict[str, float] = {}
+        self._escrito = 0.0
+        self._consultado = 0.0
+        self._cancelado = False
+        self._lock = threading.Lock()
+
+    def progreso(self, etapa: str, datos: Dict = None, forzar: bool = False,
+                 avance: Dict[str, Tuple[int, Optional[int]]] = None):
+        """
+        Registra el avance del trabajo (seguro entre hilos)
+
+        Args:
+            etapa: Etapa que generó el evento (ej: 'descarga', 'hash', 'indexacion')
+            datos: Contadores del evento
+            forzar: Escribir aunque no haya pasado `intervalo_progreso`
+            avance: Etapa -> (procesados, total) para calcular velocidad y ETA de cada una
+                    (total puede ser None si aún no se conoce)
+        """
+        with self._lock:
+            ahora = time.time()
+            for nombre, (procesados, total) in (avance or {}).items():
+                self._actualizar_etapa(nombre, procesados, total, ahora)
+
+            eta = [e['eta_segundos'] for e in self.etapas.values() if e['eta_segundos'] is not None]
+            self.ultimo_progreso = {
+                'etapa': etapa,
+                'datos': dict(datos or {}),
+                'etapas': {nombre: dict(e) for nombre, e in self.etapas.items()},
+                'eta_segundos': max(eta) if eta else None,
+                'actualizado': ahora
+            }
+            marca = time.monotonic()
+            if not forzar and marca - self._escrito < self.intervalo_progreso:
+                return
+            self._escrito = marca
+            progreso = self.ultimo_progreso
+        self.gestor.actualizar_progreso(self.id, progreso)
+
+    def _actualizar_etapa(self, nombre: str, procesados: int, total: Optional[int], ahora: float):
+        """Actualiza los contadores, la velocidad (elementos/s desde el primero) y el ETA de una etapa"""
+        if procesados and nombre not in self._inicio_etapas:
+            self._inicio_etapas[nombre] = ahora
+        inicio = self._inicio_etapas.get(nombre, ahora)
+        segundos = ahora - inicio
+
+        por_segundo = procesados / segundos if procesados and segundos > 0 else None
+        eta = None
+        if por_segundo and total is not None:
+            eta = round(max(total - procesados, 0) / por_segundo, 1)
+
+        self.etapas[nombre] = {
+            'procesados': procesados,
+            'total': total,
+            'por_segundo': round(por_segundo, 2) if por_segundo else None,
+            'eta_segundos': eta,
+            'segundos': round(segundos, 1)
+        }
+
+    def cancelado(self) -> bool:
+        """True si se pidió cancelar el trabajo"""
+        if self._cancelado:
+            return True
+        ahora = time.monotonic()
+        if ahora - self._consultado >= self.intervalo_cancelacion:
+            self._consultado = ahora
+            self._cancelado = self.gestor.cancelacion_pedida(self.id)
+        return self._cancelado
+
+    def verificar_cancelacion(self):
+        """Lanza TrabajoCancelado si se pidió cancelar el trabajo"""
+        if self.cancelado():
+            raise TrabajoCancelado(self.id)
+
+
+class GestorTrabajos:
+    """
+    Cola de trabajos en segundo plano guardada en SQLite.
+
+    Las rutas encolan un trabajo y responden de inmediato con su id; procesos
+    worker toman los trabajos pendientes, reportan su progreso en la misma base y
+    guardan el resultado (o el error). Un trabajo en curso se cancela marcándolo,
+    y la función del trabajo lo detecta con `ContextoTrabajo.cancelado()`.
+
+    Estados: pendiente → ejecutando → completado | error | cancelado
+    """
+
+    ESTADOS_FINALES = ('completado', 'error', 'cancelado')
+
+    def __init__(self, ruta_db: str):
+        """
+        Inicializa (o abre) la base de trabajos
+
+        Args:
+            ruta_db: Ruta del archivo SQLite
+        """
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self.ruta_db = ruta_db
+        self.funciones: Dict[str, Callable[[Dict, ContextoTrabajo], Dict]] = {}
+        self._procesos = []
+        self._detener = None
+        self._estado_worker: Optional[Callable[[], Dict]] = None
+        self._estado_publicado = 0.0
+        self.intervalo_estado = 10.0
+
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    parametros TEXT NOT NULL,
+                    progreso TEXT,
+                    resultado TEXT,
+                    error TEXT,
+                    usuario TEXT,
+                    pid INTEGER,
+                    cancelar INTEGER NOT NULL DEFAULT 0,
+                    creado REAL NOT NULL,
+                    iniciado REAL,
+                    finalizado REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado)")
+            # Estado que publica cada proceso worker (modelos cargados, cachés), para consultarlo desde la web
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    pid INTEGER PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    actualizado REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Abre una conexión nueva por operación (así sirve entre hilos y procesos) y la cierra al salir"""
+        conn = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---------------------------
+    # API para las rutas
+    # ---------------------------
+    def registrar(self, tipo: str, funcion: Callable[[Dict, ContextoTrabajo], Dict]):
+        """
+        Registra la función que ejecuta los trabajos de un tipo
+
+        Args:
+            tipo: Nombre del tipo de trabajo (ej: 'webscraping')
+            funcion: Recibe (parametros, contexto) y retorna el resultado (serializable a JSON)
+        """
+        self.funciones[tipo] = funcion
+
+    def encolar(self, tipo: str, parametros: Dict, usuario: str = None) -> str:
+        """
+        Crea un trabajo pendiente
+
+        Returns:
+            Id del trabajo
+        """
+        if tipo not in self.funciones:
+            raise ValueError(f"Tipo de trabajo no registrado: {tipo}")
+
+        job_id = uuid.uuid4().hex
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO trabajos (id, tipo, estado, parametros, usuario, creado) VALUES (?, ?, 'pendiente', ?, ?, ?)",
+                (job_id, tipo, json.dumps(parametros, ensure_ascii=False), usuario, time.time())
+            )
+        return job_id
+
+    def obtener(self, job_id: str, incluir_resultado: bool = False) -> Optional[Dict]:
+        """Retorna el estado de un trabajo (y su resultado si se pide), o None si no existe"""
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT * FROM trabajos WHERE id = ?", (job_id,)).fetchone()
+        return self._a_dict(fila, incluir_resultado) if fila else None
+
+    def listar(self, limite: int = 20, usuario: str = None) -> List[Dict]:
+        """Lista los trabajos más recientes (sin resultado)"""
+        consulta = "SELECT * FROM trabajos"
+        args = []
+        if usuario:
+            consulta += " WHERE usuario = ?"
+            args.append(usuario)
+        consulta += " ORDER BY creado DESC LIMIT ?"
+        args.append(limite)
+        with self._conectar() as conn:
+            filas = conn.execute(consulta, args).fetchall()
+        return [self._a_dict(fila) for fila in filas]
+
+    def cancelar(self, job_id: str) -> bool:
+        """
+        Cancela un trabajo: si está pendiente no llega a ejecutarse, si está en curso
+        se le pide detenerse
+
+        Returns:
+            True si el trabajo existía y no había terminado
+        """
+        with self._conectar() as conn:
+            cur = conn.execute(
+                "UPDATE trabajos SET estado = 'cancelado', cancelar = 1, finalizado = ? WHERE id = ? AND estado = 'pendiente'",
+                (time.time(), job_id)
+            )
+            if cur.rowcount:
+                return True
+            cur = conn.execute(
+                "UPDATE trabajos SET cancelar = 1 WHERE id = ? AND estado = 'ejecutando'", (job_id,)
+            )
+            return cur.rowcount > 0
+
+    def eventos(self, job_id: str, intervalo: float = 1.0, latido: float = 15.0,
+                duracion_max: Optional[float] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Generador de eventos de progreso de un trabajo, hasta que termina (o hasta
+        `duracion_max`; al reconectarse, el cliente recibe de nuevo el estado actual)
+
+        Eventos (nombre, datos):
+            'estado':   el trabajo cambió de estado
+            'etapa':    avanzó una etapa (procesados, total, por_segundo, eta_segundos)
+            'progreso': último evento del trabajo y ETA global, cuando hay cambios
+            'latido':   sin cambios en `latido` segundos (mantiene viva la conexión)
+            'fin':      estado final y error; después el generador termina
+
+        Args:
+            job_id: Id del trabajo
+            intervalo: Segundos entre consultas a la base
+            latido: Segundos sin eventos tras los que se emite un 'latido'
+            duracion_max: Segundos máximos del generador (None = hasta que termine el trabajo)
+        """
+        estado_anterior = None
+        etapas_anteriores: Dict[str, Tuple] = {}
+        actualizado_anterior = None
+        ultimo_evento = time.monotonic()
+        limite = ultimo_evento + duracion_max if duracion_max else None
+
+        while True:
+            trabajo = self.obtener(job_id)
+            if trabajo is None:
+                yield 'fin', {'estado': None, 'error': 'Trabajo no encontrado'}
+                return
+
+            emitidos = []
+            if trabajo['estado'] != estado_anterior:
+                estado_anterior = trabajo['estado']
+                emitidos.append(('estado', {'estado': trabajo['estado'], 'cancelacion_pedida': trabajo['cancelacion_pedida']}))
+
+            progreso = trabajo['progreso'] or {}
+            for nombre, etapa in (progreso.get('etapas') or {}).items():
+                firma = (etapa['procesados'], etapa['total'])
+                if etapas_anteriores.get(nombre) != firma:
+                    etapas_anteriores[nombre] = firma
+                    emitidos.append(('etapa', dict(etapa, etapa=nombre)))
+
+            if progreso and progreso.get('actualizado') != actualizado_anterior:
+                actualizado_anterior = progreso.get('actualizado')
+                emitidos.append(('progreso', {k: progreso.get(k) for k in ('etapa', 'datos', 'eta_segundos', 'actualizado')}))
+
+            if trabajo['estado'] in self.ESTADOS_FINALES:
+                emitidos.append(('fin', {'estado': trabajo['estado'], 'error': trabajo['error'],
+                                         'tiene_resultado': trabajo['tiene_resultado']}))
+
+            ahora = time.monotonic()
+            if emitidos:
+                ultimo_evento = ahora
+            elif ahora - ultimo_evento >= latido:
+                ultimo_evento = ahora
+                emitidos.append(('latido', {'estado': trabajo['estado']}))
+
+            for evento in emitidos:
+                yield evento
+                if evento[0] == 'fin':
+                    return
+
+            if limite and time.monotonic() >= limite:
+                return
+            time.sleep(intervalo)
+
+    def estados_workers(self) -> List[Dict]:
+        """
+        Último estado publicado por cada proceso worker vivo (ver `iniciar_workers(estado=...)`)
+
+        Returns:
+            Lista de {'pid', 'actualizado', ...estado}; los registros de procesos
+            que ya no existen se eliminan
+        """
+        with self._conectar() as conn:
+            filas = conn.execute("SELECT pid, estado, actualizado FROM workers ORDER BY pid").fetchall()
+            muertos = [(fila['pid'],) for fila in filas if not self._proceso_vivo(fila['pid'])]
+            if muertos:
+                conn.executemany("DELETE FROM workers WHERE pid = ?", muertos)
+        muertos = {pid for pid, in muertos}
+        return [{'pid': fila['pid'], 'actualizado': fila['actualizado'], **json.loads(fila['estado'])}
+                for fila in filas if fila['pid'] not in muertos]
+
+    def _a_dict(self, fila: sqlite3.Row, incluir_resultado: bool = False) -> Dict:
+        """Convierte una fila de la tabla en diccionario"""
+        trabajo = {
+            'id': fila['id'],
+            'tipo': fila['tipo'],
+            'estado': fila['estado'],
+            'progreso': json.loads(fila['progreso']) if fila['progreso'] else None,
+            'error': fila['error'],
+            'usuario': fila['usuario'],
+            'cancelacion_pedida': bool(fila['cancelar']),
+            'creado': fila['creado'],
+            'iniciado': fila['iniciado'],
+            'finalizado': fila['finalizado'],
+            'tiene_resultado': fila['resultado'] is not None
+        }
+        if incluir_resultado:
+            trabajo['resultado'] = json.loads(fila['resultado']) if fila['resultado'] else None
+        return trabajo
+
+    # ---------------------------
+    # API para los workers
+    # ---------------------------
+    def actualizar_progreso(self, job_id: str, progreso: Dict):
+        """Guarda el progreso de un trabajo en curso"""
+        try:
+            with self._conectar() as conn:
+                conn.execute("UPDATE trabajos SET progreso = ? WHERE id = ?",
+                             (json.dumps(progreso, ensure_ascii=False, default=str), job_id))
+        except Exception as e:
+            print(f"Error guardando progreso del trabajo {job_id}: {e}")
+        # Durante trabajos largos el estado del worker también se refresca (cada `intervalo_estado`)
+        self.publicar_estado_worker()
+
+    def publicar_estado_worker(self, forzar: bool = False):
+        """Guarda el estado de este proceso worker (si tiene función de estado), como mucho cada `intervalo_estado` s"""
+        if self._estado_worker is None:
+            return
+        ahora = time.time()
+        if not forzar and ahora - self._estado_publicado < self.intervalo_estado:
+            return
+        self._estado_publicado = ahora
+        try:
+            estado = json.dumps(self._estado_worker(), ensure_ascii=False, default=str)
+            with self._conectar() as conn:
+                conn.execute("INSERT OR REPLACE INTO workers (pid, estado, actualizado) VALUES (?, ?, ?)",
+                             (os.getpid(), estado, ahora))
+        except Exception as e:
+            print(f"Error publicando el estado del worker {os.getpid()}: {e}")
+
+    def _retirar_estado_worker(self):
+        """Elimina el estado publicado por este proceso"""
+        try:
+            with self._conectar() as conn:
+                conn.execute("DELETE FROM workers WHERE pid = ?", (os.getpid(),))
+        except Exception as e:
+            print(f"Error eliminando el estado del worker {os.getpid()}: {e}")
+
+    def cancelacion_pedida(self, job_id: str) -> bool:
+        """True si se marcó el trabajo para cancelar"""
+        try:
+            with self._conectar() as conn:
+                fila = conn.execute("SELECT cancelar FROM trabajos WHERE id = ?", (job_id,)).fetchone()
+            return bool(fila and fila['cancelar'])
+        except Exception as e:
+            print(f"Error consultando cancelación del trabajo {job_id}: {e}")
+            return False
+
+    def _reclamar(self) -> Optional[sqlite3.Row]:
+        """Toma el trabajo pendiente más antiguo y lo marca como 'ejecutando' por este proceso"""
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                fila = conn.execute(
+                    "SELECT * FROM trabajos WHERE estado = 'pendiente' ORDER BY creado LIMIT 1"
+                ).fetchone()
+                if fila:
+                    conn.execute("UPDATE trabajos SET estado = 'ejecutando', pid = ?, iniciado = ? WHERE id = ?",
+                                 (os.getpid(), time.time(), fila['id']))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return fila
+
+    def _finalizar(self, job_id: str, estado: str, resultado: Dict = None, error: str = None,
+                   progreso: Dict = None):
+        """Guarda el estado final de un trabajo"""
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, finalizado = ?, "
+                "progreso = COALESCE(?, progreso) WHERE id = ?",
+                (estado,
+                 json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None,
+                 error, time.time(),
+                 json.dumps(progreso, ensure_ascii=False, default=str) if progreso else None,
+                 job_id)
+            )
+
+    def recuperar_huerfanos(self) -> int:
+        """
+        Marca como error los trabajos 'ejecutando' cuyo proceso ya no existe
+        (worker detenido o reiniciado a mitad de un trabajo)
+
+        Returns:
+            Número de trabajos marcados
+        """
+        with self._conectar() as conn:
+            filas = conn.execute("SELECT id, pid FROM trabajos WHERE estado = 'ejecutando'").fetchall()
+        huerfanos = [fila['id'] for fila in filas if not self._proceso_vivo(fila['pid'])]
+        for job_id in huerfanos:
+            self._finalizar(job_id, 'error', error='El worker se detuvo antes de terminar el trabajo')
+        return len(huerfanos)
+
+    @staticmethod
+    def _proceso_vivo(pid: Optional[int]) -> bool:
+        """True si existe un proceso con ese pid en esta máquina"""
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def ejecutar_siguiente(self) -> bool:
+        """
+        Ejecuta el siguiente trabajo pendiente, si hay
+
+        Returns:
+            True si se ejecutó un trabajo
+        """
+        fila = self._reclamar()
+        if fila is None:
+            return False
+
+        job_id, tipo = fila['id'], fila['tipo']
+        contexto = ContextoTrabajo(self, job_id, json.loads(fila['parametros']))
+        print(f"[TRABAJOS] Iniciando {tipo} {job_id} (pid {os.getpid()})")
+        try:
+            funcion = self.funciones.get(tipo)
+            if funcion is None:
+                raise ValueError(f"Tipo de trabajo no registrado: {tipo}")
+            resultado = funcion(contexto.parametros, contexto)
+            estado = 'cancelado' if contexto.cancelado() else 'completado'
+            self._finalizar(job_id, estado, resultado=resultado, progreso=contexto.ultimo_progreso)
+        except TrabajoCancelado:
+            self._finalizar(job_id, 'cancelado', progreso=contexto.ultimo_progreso)
+            estado = 'cancelado'
+        except Exception as e:
+            traceback.print_exc()
+            self._finalizar(job_id, 'error', error=str(e) or e.__class__.__name__,
+                            progreso=contexto.ultimo_progreso)
+            estado = 'error'
+        print(f"[TRABAJOS] {tipo} {job_id}: {estado}")
+        return True
+
+    def bucle_worker(self, intervalo: float = 1.0, detener=None, pid_padre: int = None):
+        """
+        Ejecuta trabajos indefinidamente
+
+        Args:
+            intervalo: Segundos de espera cuando no hay trabajos pendientes
+            detener: Evento que termina el bucle
+            pid_padre: Si se indica, el bucle termina cuando ese proceso desaparece
+        """
+        self.recuperar_huerfanos()
+        print(f"[TRABAJOS] Worker {os.getpid()} esperando trabajos en {self.ruta_db}")
+        self.publicar_estado_worker(forzar=True)
+        try:
+            while not (detener and detener.is_set()):
+                if pid_padre and os.getppid() != pid_padre:
+                    break
+                try:
+                    ejecuto = self.ejecutar_siguiente()
+                except Exception as e:
+                    print(f"[TRABAJOS] Error en el worker {os.getpid()}: {e}")
+                    ejecuto = False
+                if ejecuto:
+                    self.publicar_estado_worker(forzar=True)
+                elif detener:
+                    detener.wait(intervalo)
+                else:
+                    time.sleep(intervalo)
+        finally:
+            if self._estado_worker is not None:
+                self._retirar_estado_worker()
+
+    def iniciar_workers(self, n: int = 1, inicializar: Callable[[], None] = None,
+                        estado: Callable[[], Dict] = None) -> List:
+        """
+        Lanza `n` procesos worker (fork del proceso actual, que ya tiene registradas
+        las funciones de los trabajos y, si se precargaron, los modelos)
+
+        Args:
+            n: Número de procesos
+            inicializar: Función que se ejecuta en cada worker antes del bucle
+                         (ej: reabrir conexiones que no deben compartirse entre procesos)
+            estado: Función que retorna el estado del worker (modelos, cachés); cada worker
+                    lo publica al arrancar, tras cada trabajo y durante los trabajos, y se
+                    consulta con `estados_workers`
+
+        Returns:
+            Lista de procesos lanzados
+        """
+        ctx = multiprocessing.get_context('fork')
+        if self._detener is None:
+            self._detener = ctx.Event()
+            atexit.register(self.detener_workers)
+
+        pid_padre = os.getpid()
+        for i in range(n):
+            # No son daemon: los trabajos lanzan sus propios procesos (extracción de PDF, OCR)
+            proceso = ctx.Process(target=self._arrancar_worker, args=(inicializar, pid_padre, estado),
+                                  name=f'worker-trabajos-{i}')
+            proceso.start()
+            self._procesos.append(proceso)
+        return list(self._procesos)
+
+    def _arrancar_worker(self, inicializar: Callable[[], None], pid_padre: int,
+                         estado: Callable[[], Dict] = None):
+        """Punto de entrada de un proceso worker"""
+        self._estado_worker = estado
+        if inicializar:
+            inicializar()
+        self.bucle_worker(detener=self._detener, pid_padre=pid_padre)
+
+    def detener_workers(self, timeout: float = 5.0):
+        """Detiene los workers lanzados por este proceso (esperan a terminar el trabajo en curso hasta `timeout`)"""
+        if self._detener is None:
+            return
+        self._detener.set()
+        for proceso in self._procesos:
+            proceso.join(timeout)
+            if proceso.is_alive():
+                proceso.terminate()
+        self._procesos = []
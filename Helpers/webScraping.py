@@ -4,15 +4,35 @@ from werkzeug.utils import secure_filename
 from urllib.parse import urljoin, urlparse
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from typing import List, Dict, Optional
-import requests
 from Helpers import Funciones
+from Helpers.descargas import DescargadorPDF
+from Helpers.bloqueoRecursos import BloqueoRecursos
+from Helpers.enlaces import recolectar_enlaces, hrefs, LectorHTML, FiltroEnlaces
+from Helpers.rastreador import RastreadorBFS, PuntoControlRastreo, RegistroEnlaces
 
 class WebScraping:
     """
     Web Scraping dinámico con Playwright y descargas con Requests.
     """
 
-    def __init__(self, base_url: str, headless=True):
+    def __init__(self, base_url: str, headless=True, modo_ligero=True,
+                 recursos_bloqueados=BloqueoRecursos.TIPOS_PESADOS, bloquear_scripts_terceros=True,
+                 dominios_permitidos=(), via_estatica=True, timeout_estatico=15,
+                 palabras_pdf=None, excluir_pdf=()):
+        """
+        Args:
+            base_url: URL inicial del sitio
+            headless: Navegador sin interfaz
+            modo_ligero: No descargar imágenes, multimedia, fuentes, CSS ni scripts de terceros
+            recursos_bloqueados: Tipos de recurso que se bloquean en modo ligero
+            bloquear_scripts_terceros: En modo ligero, bloquear scripts de otros dominios
+            dominios_permitidos: Dominios de terceros cuyos scripts sí se cargan
+            via_estatica: Leer primero el HTML con un GET plano y usar el navegador solo si no basta
+            timeout_estatico: Segundos máximos del GET de la vía estática
+            palabras_pdf: Palabras de las que la URL de un archivo debe contener al menos una
+                          (None = PDF_KEYWORDS_FILTER)
+            excluir_pdf: Palabras que descartan la URL de un archivo
+        """
         self.base_url = base_url.rstrip("/") + "/"
         self.domain = urlparse(self.base_url).netloc
         self.dynamic_folder_name = secure_filename(self.domain).replace('.', '_')
@@ -22,12 +42,21 @@ class WebScraping:
         self.context = None
         self.page = None
         self.headless = headless
+        self.bloqueo = None
+        if modo_ligero:
+            self.bloqueo = BloqueoRecursos(self.base_url, tipos=recursos_bloqueados,
+                                           bloquear_scripts_terceros=bloquear_scripts_terceros,
+                                           dominios_permitidos=dominios_permitidos)
+        self.lector_html = LectorHTML(timeout=timeout_estatico) if via_estatica else None
 
         # Archivos que se pueden descargar, extensible si se necesita
         self.DOWNLOAD_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.zip', 'txt', '.rtf')
         self.PDF_KEYWORDS_FILTER = ['Normatividad', 'Leyes', 'Decretos', 'Resoluciones', 'Conpes', 
                                     'Actos', 'Reglamentos', 'Circulares', 'Instructivos', 'Manuales',
                                     'Guías', 'Acuerdos', 'Contratos', 'Convenios']
+        if palabras_pdf is not None:
+            self.PDF_KEYWORDS_FILTER = list(palabras_pdf)
+        self.filtro_pdf = FiltroEnlaces(incluir=self.PDF_KEYWORDS_FILTER, excluir=excluir_pdf)
 
     # INICIAR PLAYWRIGHT (una sola vez)
     def _start(self):
@@ -36,6 +65,8 @@ class WebScraping:
             self.playwright = sync_playwright().start()
             self.browser = self.playwright.chromium.launch(headless=self.headless)
             self.context = self.browser.new_context(accept_downloads=True)
+            if self.bloqueo:
+                self.bloqueo.aplicar(self.context)
             self.page = self.context.new_page()
 
     # DETENER PLAYWRIGHT (una sola vez)
@@ -52,132 +83,102 @@ class WebScraping:
 
     def _normalizar_url(self, url: str):
         """Normaliza la URL eliminando fragmentos (#) para la comparación en el set de visitados."""
-        return url.split('#')[0].rstrip('/')
+        return RastreadorBFS.normalizar_url(url)
     
-    def _find_in_page_or_iframe(self, selector: str):
-        """
-        Busca un selector en la página principal. Si no aparece, lo busca en los iframes.
-        Retorna: (locator, frame)
-        """
-        # Buscar en página principal
-        loc = self.page.locator(selector)
-        if loc.count() > 0:
-            return loc, None
-
-        # Buscar en iframes
-        for frame in self.page.frames:
-            try:
-                loc_iframe = frame.locator(selector)
-                if loc_iframe.count() > 0:
-                    return loc_iframe, frame
-            except:
-                pass
-
-        return None, None
-
     def recorrer_dominio_recursivamente(
         self,
         initial_path: str,
         max_profundidad: int = 5,
         pdf_keywords: Optional[List[str]] = None,
-        selector_contenedor: Optional[str] = None
+        selector_contenedor: Optional[str] = None,
+        selector_esperado: Optional[str] = None,
+        n_paginas: int = 4,
+        max_paginas: Optional[int] = None,
+        espera_dominio: float = 1.0,
+        punto_control: Optional[str] = None,
+        reanudar: bool = True
     ) -> List[str]:
+        """
+        Recorre el dominio en anchura (BFS) con varias páginas en paralelo y
+        recolecta los enlaces de descarga relevantes
 
-        self._start()
-
+        Args:
+            initial_path: Ruta (o URL) desde la que empieza el rastreo
+            max_profundidad: Profundidad máxima de enlaces internos a seguir
+            pdf_keywords: Palabras que debe contener la URL de un archivo para incluirlo
+                          (None = el filtro del scraper, con sus exclusiones)
+            selector_contenedor: Selector CSS del contenedor cuyos enlaces se siguen
+            selector_esperado: Selector que debe traer el HTML estático de una página para
+                               leerla sin navegador (por defecto el contenedor o, sin él,
+                               enlaces con extensión de descarga)
+            n_paginas: Páginas de Playwright cargando en paralelo
+            max_paginas: Máximo de páginas visitadas (None = sin límite)
+            espera_dominio: Segundos mínimos entre peticiones al mismo dominio
+            punto_control: Ruta de un SQLite donde se guarda el estado del rastreo (None = solo en memoria)
+            reanudar: Con punto de control, continuar el rastreo sin terminar de esta URL inicial
+
+        Returns:
+            Lista de URLs de descarga encontradas
+        """
         start_url = urljoin(self.base_url, initial_path)
-        queue = [(start_url, 0)]
-        visited = {self._normalizar_url(start_url)}
-        pdf_links = set()
 
-        if pdf_keywords is None:
-            pdf_keywords = self.PDF_KEYWORDS_FILTER
+        filtro_pdf = self.filtro_pdf if pdf_keywords is None else FiltroEnlaces(pdf_keywords)
+        if selector_esperado is None:
+            selector_esperado = selector_contenedor or ", ".join(
+                f"a[href$='{extension}' i]" for extension in self.DOWNLOAD_EXTENSIONS)
 
-        print(f"[RASTREO] Iniciando BFS en {start_url} (Máx Prof: {max_profundidad})")
+        print(f"[RASTREO] Iniciando BFS en {start_url} (Máx Prof: {max_profundidad}, páginas en paralelo: {n_paginas})")
         print(f"[RASTREO] Selector usado: {selector_contenedor}")
 
-        while queue:
-            current_url, depth = queue.pop(0)
-            if depth > max_profundidad:
-                continue
+        def procesar(current_url: str, depth: int, recolectados: Dict):
+            usar_contenedor = bool(selector_contenedor) and recolectados['contenedor']
+            if selector_contenedor and not usar_contenedor:
+                print(f"[WARN] Selector '{selector_contenedor}' no encontrado en {current_url}. Usando página completa.")
 
-            try:
-                self.page.goto(current_url, timeout=30_000, wait_until='domcontentloaded')
-                print(f"[{depth}/{max_profundidad}] Visitando: {current_url}")
+            siguientes, pdf_links = [], []
+            for enlace in recolectados['enlaces']:
+                if usar_contenedor and not enlace['en_contenedor']:
+                    continue
 
-                # ======================================================
-                # 1. Seleccionar contenedor (página o iframe)
-                # ======================================================
-                if selector_contenedor:
-                    contenedor, frame = self._find_in_page_or_iframe(selector_contenedor)
+                full_url = urljoin(current_url, enlace['href'])
+                url_minusculas = full_url.lower()
+                is_internal = urlparse(full_url).netloc == self.domain
+                is_download_link = url_minusculas.endswith(self.DOWNLOAD_EXTENSIONS)
 
-                    if contenedor is None:
-                        print(f"[WARN] Selector '{selector_contenedor}' no encontrado en {current_url}. Usando página completa.")
-                        enlaces_elementos = self.page.locator("a[href]").all()
+                # PDFs: aplicar filtros
+                if is_download_link:
+                    is_relevant = filtro_pdf.es_relevante(url_minusculas, normalizada=True)
+
+                    if is_relevant:
+                        pdf_links.append(full_url)
+                        print(f"   -> [PDF ENCONTRADO] {full_url}")
                     else:
-                        if frame is None:
-                            enlaces_elementos = contenedor.locator("a[href]").all()
-                        else:
-                            enlaces_elementos = frame.locator(selector_contenedor + " a[href]").all()
+                        print(f"   -> [PDF IGNORADO] {full_url}")
 
-                else:
-                    enlaces_elementos = self.page.locator("a[href]").all()
-
-                # ======================================================
-                # 2. Procesar enlaces del contenedor
-                # ======================================================
-                for element in enlaces_elementos:
-                    href = element.get_attribute("href")
-                    if not href:
+                # Enlaces internos: se siguen solo si provienen del contenedor;
+                # el rastreador descarta los ya vistos y los demasiado profundos
+                elif is_internal:
+                    if selector_contenedor and not enlace['en_contenedor']:
                         continue
-
-                    full_url = urljoin(current_url, href)
-                    normalized_url = self._normalizar_url(full_url)
-
-                    is_internal = urlparse(full_url).netloc == self.domain
-                    is_download_link = full_url.lower().endswith(self.DOWNLOAD_EXTENSIONS)
-
-                    # -----------------------------------------
-                    # 2.1 PDFs: aplicar filtros
-                    # -----------------------------------------
-                    if is_download_link:
-                        is_relevant = any(k.lower() in full_url.lower() for k in pdf_keywords)
-
-                        if is_relevant:
-                            if full_url not in pdf_links:
-                                pdf_links.add(full_url)
-                                print(f"   -> [PDF ENCONTRADO] {full_url}")
-                        else:
-                            print(f"   -> [PDF IGNORADO] {full_url}")
-
-                    # -----------------------------------------
-                    # 2.2 Enlaces internos → BFS SEMILIMITADO
-                    # Solo se siguen si provienen del contenedor
-                    # -----------------------------------------
-                    elif is_internal and normalized_url not in visited:
-
-                        if selector_contenedor:
-                            try:
-                                inside = element.evaluate(
-                                    "this.closest(arguments[0]) !== null",
-                                    selector_contenedor
-                                )
-                            except:
-                                inside = False
-
-                            if not inside:
-                                continue
-
-                        # Agregar al BFS
-                        visited.add(normalized_url)
-                        queue.append((full_url, depth + 1))
-
-            except Exception as e:
-                print(f"[ERROR] Fallo en {current_url}: {e}")
-                continue
-
-        self._stop()
-        print(f"[RASTREO FINALIZADO] Se encontraron {len(pdf_links)} enlaces de descarga.")
+                    siguientes.append(full_url)
+            return siguientes, pdf_links
+
+        control = PuntoControlRastreo(punto_control, start_url) if punto_control else None
+        rastreador = RastreadorBFS(n_trabajadores=n_paginas, max_profundidad=max_profundidad,
+                                   max_paginas=max_paginas, espera_dominio=espera_dominio,
+                                   headless=self.headless, bloqueo=self.bloqueo,
+                                   selector_contenedor=selector_contenedor, lector_html=self.lector_html,
+                                   selector_esperado=selector_esperado, punto_control=control)
+        try:
+            stats = rastreador.recorrer([start_url], procesar, reanudar=reanudar)
+        finally:
+            if control:
+                control.close()
+        pdf_links = rastreador.resultados
+
+        print(f"[RASTREO FINALIZADO] Se encontraron {len(pdf_links)} enlaces de descarga. "
+              f"Páginas visitadas: {stats['visitadas']} ({stats['estaticas']} sin navegador), "
+              f"errores: {stats['errores']}, pendientes: {stats['pendientes']} ({stats['segundos']}s)")
         return list(pdf_links)
 
     # FUNCIÓN DE DESCARGA RÁPIDA (con requests)
@@ -185,11 +186,16 @@ class WebScraping:
         """
         Descarga archivos PDF de forma rápida usando la librería requests.
         Implementa verificación de Content-Type e idempotencia.
+
+        Cada archivo se escribe en un `.part` (que se reanuda con Range si la conexión
+        se corta) y solo toma su nombre final cuando está completo, así que un archivo
+        existente con ese nombre siempre es una descarga terminada.
         """
         Funciones.crear_carpeta(carpeta_destino)
         descargados, errores, saltados = 0, 0, 0
         total_enlaces = len(enlaces)
-        
+        descargador = DescargadorPDF(max_workers=1, reintentos=2, timeout_lectura=15, rechazar_html=True)
+
         print(f"[DESCARGA RÁPIDA] Iniciando descarga de {total_enlaces} archivos en {carpeta_destino}...")
 
         for i, url in enumerate(enlaces, 1):
@@ -203,44 +209,22 @@ class WebScraping:
 
             print(f"[{i}/{total_enlaces}] Procesando {url}")
             
-            # 2. IDEMPOTENCIA: Saltar si el archivo ya existe localmente
+            # 2. IDEMPOTENCIA: Saltar si el archivo ya existe localmente (solo existe si se completó)
             if os.path.exists(ruta_destino):
                 saltados += 1
                 print(f"   -> [SALTADO] Ya existe: {nombre_archivo}")
                 continue
 
-            try:
-                # 3. Descarga con requests
-                with requests.get(url, stream=True, timeout=15) as r:
-                    r.raise_for_status() # Lanza excepción para códigos 4xx/5xx
-
-                    # 4. VERIFICACIÓN DE CONTENT-TYPE (Evita descargar HTML de error/404)
-                    content_type = r.headers.get('Content-Type', '').lower()
-                    if 'application/pdf' not in content_type and not nombre_archivo.lower().endswith('.pdf'):
-                         # Permitir otros tipos de descarga si no son HTML
-                        if 'text/html' in content_type:
-                            raise ValueError(f"URL no es PDF o archivo esperado (Content-Type: {content_type})")
-                        
-                    # 5. Guardar el archivo en modo binario
-                    with open(ruta_destino, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    
-                    descargados += 1
-                    print(f"   -> [DESCARGADO] Guardado como: {nombre_archivo}")
-
-            except requests.exceptions.Timeout:
-                errores += 1
-                print(f"   -> [ERROR TIMEOUT] Tiempo de espera agotado para {url}")
-            except requests.exceptions.RequestException as e:
-                errores += 1
-                print(f"   -> [ERROR HTTP] Error en la solicitud {url}: {e}")
-            except ValueError as e:
-                errores += 1
-                print(f"   -> [ERROR CONTENIDO] {e} en {url}")
-            except Exception as e:
+            # 3. Descarga con reintentos, reanudando el .part si quedó uno de un intento anterior
+            resultado = descargador.descargar(url, ruta_destino)
+            if resultado['ok']:
+                descargados += 1
+                print(f"   -> [DESCARGADO] Guardado como: {nombre_archivo}")
+            else:
                 errores += 1
-                print(f"   -> [ERROR GENÉRICO] Fallo al descargar {url}: {e}")
+                print(f"   -> [ERROR] {resultado['error']} en {url}")
+
+        descargador.close()
 
         return {
             "descargados": descargados,
@@ -251,15 +235,40 @@ class WebScraping:
 
     # FUNCIÓN DE RASTREO CON PAGINACIÓN (para búsquedas específicas)
 
-    def obtener_enlaces_con_paginacion(self, initial_path, selector_pagina='a[title="Siguiente"]', max_links=2000):
+    def obtener_enlaces_con_paginacion(self, initial_path, selector_pagina='a[title="Siguiente"]', max_links=2000,
+                                       registro_vistos: Optional[str] = None, max_paginas_sin_nuevos: int = 2):
         """
         Extrae enlaces de una página con paginación, usando Playwright.
+
+        En modo incremental (con `registro_vistos`) solo retorna los enlaces que no
+        están confirmados en el registro, y deja de paginar tras
+        `max_paginas_sin_nuevos` páginas seguidas sin enlaces nuevos: en una
+        actualización periódica basta con cargar las primeras páginas del listado.
+
+        Este método no escribe en el registro: el llamador debe llamar a
+        `confirmar_enlaces` con los enlaces que sí descargó/indexó. Los que fallen
+        (o si el proceso se cae antes) se vuelven a retornar en la siguiente ejecución.
+
+        Args:
+            initial_path: Ruta (o URL) de la primera página del listado
+            selector_pagina: Selector del enlace a la página siguiente
+            max_links: Máximo de enlaces a recolectar
+            registro_vistos: Ruta de un SQLite con los enlaces ya vistos (None = modo completo)
+            max_paginas_sin_nuevos: Páginas seguidas sin enlaces nuevos antes de parar (modo incremental)
+
+        Returns:
+            Lista de enlaces (en modo incremental, solo los nuevos)
         """
         self._start()
         enlaces = set()
         current_url = urljoin(self.base_url, initial_path)
 
-        print(f"[PAGINACIÓN] Iniciando extracción de enlaces desde: {current_url}")
+        registro = RegistroEnlaces(registro_vistos, current_url) if registro_vistos else None
+        conocidos = registro.conocidos() if registro else set()
+        paginas_sin_nuevos = 0
+
+        print(f"[PAGINACIÓN] Iniciando extracción de enlaces desde: {current_url}"
+              + (f" (incremental, {len(conocidos)} enlaces conocidos)" if registro else ""))
 
         while True:
             try:
@@ -269,20 +278,19 @@ class WebScraping:
                 # Esperar a que los elementos de enlace (PDFs) estén presentes
                 self.page.wait_for_selector('a[href$=".pdf"]', timeout=5000)
 
-                # Extraer enlaces
-                elementos_enlace = self.page.locator('a[href$=".pdf"]').all() # Solo busca enlaces que terminen en .pdf
+                # Extraer enlaces (una sola llamada al navegador)
+                encontrados = hrefs(recolectar_enlaces(self.page, 'a[href$=".pdf"]')) # Solo busca enlaces que terminen en .pdf
                 
                 nuevos_enlaces_encontrados = 0
-                for link_element in elementos_enlace:
-                    href = link_element.get_attribute("href")
+                for href in encontrados:
                     if href:
                         full_url = urljoin(current_url, href)
                         
                         # Aplicar filtro de palabras clave 
-                        is_relevant = any(k.lower() in full_url.lower() for k in self.PDF_KEYWORDS_FILTER)
+                        is_relevant = self.filtro_pdf.es_relevante(full_url)
                         
                         if is_relevant:
-                            if full_url not in enlaces:
+                            if full_url not in enlaces and full_url not in conocidos:
                                 enlaces.add(full_url)
                                 nuevos_enlaces_encontrados += 1
 
@@ -293,6 +301,13 @@ class WebScraping:
                     print(f"[LÍMITE ALCANZADO] Deteniendo rastreo por max_links={max_links}")
                     break
 
+                # Criterio de parada incremental: el resto del listado ya se conoce
+                if registro:
+                    paginas_sin_nuevos = 0 if nuevos_enlaces_encontrados else paginas_sin_nuevos + 1
+                    if paginas_sin_nuevos >= max_paginas_sin_nuevos:
+                        print(f"[INCREMENTAL] {paginas_sin_nuevos} páginas seguidas sin enlaces nuevos. Deteniendo.")
+                        break
+
                 # Navegar a la siguiente página
                 siguiente_enlace = self.page.locator(selector_pagina)
                 if siguiente_enlace.is_visible():
@@ -314,8 +329,27 @@ class WebScraping:
                 break
 
         self._stop()
+        if registro:
+            registro.close()
+            print(f"[INCREMENTAL] Enlaces nuevos: {len(enlaces)}")
         return list(enlaces)
 
+    def confirmar_enlaces(self, initial_path, enlaces: List[str], registro_vistos: str):
+        """
+        Marca como conocidos los enlaces ya procesados de un listado, para que
+        `obtener_enlaces_con_paginacion` incremental no los vuelva a retornar
+
+        Args:
+            initial_path: Misma ruta (o URL) usada en obtener_enlaces_con_paginacion
+            enlaces: Enlaces procesados con éxito
+            registro_vistos: Ruta del SQLite de enlaces vistos
+        """
+        registro = RegistroEnlaces(registro_vistos, urljoin(self.base_url, initial_path))
+        try:
+            registro.confirmar(enlaces)
+        finally:
+            registro.close()
+
 
 
 
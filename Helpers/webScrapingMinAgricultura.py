@@ -1,14 +1,43 @@
 import os
 import time
-import requests
+import asyncio
+from .descargas import DescargadorPDF
+from .bloqueoRecursos import BloqueoRecursos
+from .enlaces import recolectar_enlaces, recolectar_enlaces_async, hrefs, LectorHTML, FiltroEnlaces
 from urllib.parse import urljoin
 from playwright.sync_api import sync_playwright, TimeoutError
+from playwright.async_api import async_playwright, TimeoutError as AsyncTimeoutError
 
 class WebScrapingMinAgricultura:
 
-    def __init__(self, base_url, headless=True):
+    def __init__(self, base_url, headless=True, modo_ligero=True,
+                 recursos_bloqueados=BloqueoRecursos.TIPOS_PESADOS, bloquear_scripts_terceros=True,
+                 dominios_permitidos=(), via_estatica=True, timeout_estatico=30,
+                 incluir_enlaces=("/Normatividad/",), excluir_enlaces=()):
+        """
+        Args:
+            base_url: URL del sitio del MinAgricultura
+            headless: Navegador sin interfaz
+            modo_ligero: No descargar imágenes, multimedia, fuentes, CSS ni scripts de terceros
+            recursos_bloqueados: Tipos de recurso que se bloquean en modo ligero
+            bloquear_scripts_terceros: En modo ligero, bloquear scripts de otros dominios
+            dominios_permitidos: Dominios de terceros cuyos scripts sí se cargan
+            via_estatica: Leer primero el HTML con un GET plano y usar el navegador solo si
+                          el selector de la categoría no está en el HTML estático
+            timeout_estatico: Segundos máximos del GET de la vía estática
+            incluir_enlaces: Textos de los que la URL de un PDF debe contener al menos uno
+                             (por defecto, la sección de Normatividad)
+            excluir_enlaces: Textos que descartan la URL de un PDF
+        """
         self.base_url = base_url.rstrip("/") + "/"
         self.headless = headless
+        self.bloqueo = None
+        if modo_ligero:
+            self.bloqueo = BloqueoRecursos(self.base_url, tipos=recursos_bloqueados,
+                                           bloquear_scripts_terceros=bloquear_scripts_terceros,
+                                           dominios_permitidos=dominios_permitidos)
+        self.lector_html = LectorHTML(timeout=timeout_estatico) if via_estatica else None
+        self.filtro_enlaces = FiltroEnlaces(incluir=incluir_enlaces, excluir=excluir_enlaces)
 
         # Categorías reales en el sitio del MinAgricultura
         self.categorias = {
@@ -26,6 +55,8 @@ class WebScrapingMinAgricultura:
         self.play = sync_playwright().start()
         self.browser = self.play.chromium.launch(headless=self.headless)
         self.context = self.browser.new_context()
+        if self.bloqueo:
+            self.bloqueo.aplicar(self.context)
         self.page = self.context.new_page()
 
     # ---------------------------
@@ -36,6 +67,51 @@ class WebScrapingMinAgricultura:
         self.browser.close()
         self.play.stop()
 
+    # --------------------------------------------
+    # URL, selector y filtro de cada categoría
+    # --------------------------------------------
+    def _url_categoria(self, tipo_id):
+        if tipo_id == 5:
+            return f"{self.base_url}SitePages/NormativaJurisprudencia.aspx"
+        return f"{self.base_url}SitePages/buscador-general-normas.aspx?t={tipo_id}"
+
+    def _selector_categoria(self, tipo_id):
+        if tipo_id in [1, 2, 3, 4]:                         # Categorías 1 a 4
+            return "div.export a[href$='.pdf']"
+        if tipo_id == 5:
+            return "td.ms-vb a[href$='.pdf'], td.ms-vb a[href*='.pdf']"   # Categoría 5 (Jurisprudencia)
+        return None
+
+    def _filtrar_enlaces(self, url, hrefs):
+        enlaces = []
+        for href in hrefs:
+            print(" → HREF encontrado: ", href)
+            if not href:                            # Si no hay href, saltar
+                continue
+            pdf_url = urljoin(url, href)            # Construir URL absoluta
+            if not self.filtro_enlaces.es_relevante(pdf_url):   # Filtrar enlaces según las reglas de inclusión/exclusión
+                print("   [Descartado por filtro]", pdf_url)
+                continue
+            print("   [AGREGADO]", pdf_url)
+            enlaces.append(pdf_url)                 # Añadir enlace a la lista
+        return enlaces
+
+    # --------------------------------------------
+    # Vía rápida: enlaces de una categoría desde el HTML estático
+    # --------------------------------------------
+    def _leer_categoria_estatica(self, tipo_id):
+        """Hrefs de la categoría leídos sin navegador, o None si el selector no está en el HTML estático"""
+        if not self.lector_html:
+            return None
+        selector = self._selector_categoria(tipo_id)
+        resultado = self.lector_html.leer(self._url_categoria(tipo_id), selector, selector_esperado=selector)
+        if resultado is None:
+            print(f" → Categoría {tipo_id}: el HTML estático no trae '{selector}', se usa el navegador.")
+            return None
+        encontrados = hrefs(resultado)
+        print(f" → Categoría {tipo_id}: PDF encontrados sin navegador: {len(encontrados)}")
+        return encontrados
+
     # --------------------------------------------
     # Extraer enlaces PDF de una categoría del MinAgricultura
     # --------------------------------------------
@@ -43,14 +119,16 @@ class WebScrapingMinAgricultura:
         if tipo_id not in self.categorias:
             print(f" ❌ ERROR: Categoría inválida: {tipo_id}")
             return []
-        if tipo_id == 5:
-            url = f"{self.base_url}SitePages/NormativaJurisprudencia.aspx"
-        else:
-            url = f"{self.base_url}SitePages/buscador-general-normas.aspx?t={tipo_id}"
+        url = self._url_categoria(tipo_id)
 
         print(f"\n=== CATEGORÍA {tipo_id} ===")
         print(f"Visitando: {url}")
 
+        # Vía rápida: HTML estático, sin navegador
+        estatico = self._leer_categoria_estatica(tipo_id)
+        if estatico is not None:
+            return self._filtrar_enlaces(url, estatico)
+
         # Bloque de navegación con manejo de errores
         try:
             print(" → Intentando cargar la página...", url)
@@ -61,11 +139,8 @@ class WebScrapingMinAgricultura:
             raise e  # <-- Propaga el error real
 
         # Bloque de espera del contenido dinámico
-        if tipo_id in [1, 2, 3, 4]:                         # Categorías 1 a 4
-            selector = "div.export a[href$='.pdf']"
-        elif tipo_id == 5:
-            selector = "td.ms-vb a[href$='.pdf'], td.ms-vb a[href*='.pdf']"   # Categoría 5 (Jurisprudencia)
-        else:
+        selector = self._selector_categoria(tipo_id)
+        if not selector:
             print(f"⚠ Tipo_id {tipo_id} no soportado.")
             return []
         try:
@@ -74,45 +149,130 @@ class WebScrapingMinAgricultura:
         except TimeoutError as e:
             print(f" ⚠ Selector no apareció: {selector} — continuando igual…")
 
-        enlaces = []
-        links = self.page.locator(selector).all()   # Obtener todos los enlaces que coinciden con el selector
+        # Obtener todos los enlaces que coinciden con el selector (una sola llamada al navegador)
+        encontrados = hrefs(recolectar_enlaces(self.page, selector))
 
         # Conteo de enlaces encontrados para depuración
-        total = len(links)
-        print(f" → PDF en div.export encontrados: {total}")
-        
-        for link in links:
-            href = link.get_attribute("href")
-            print(" → HREF encontrado: ", href)
-            if not href:                            # Si no hay href, saltar
-                continue
-            pdf_url = urljoin(url, href)            # Construir URL absoluta
-            if "/Normatividad/" not in pdf_url:     # Filtrar enlaces que no pertenezcan a la sección de Normatividad
-                print("   [Descartado por filtro 'Normatividad']", pdf_url)
-                continue
-            print("   [AGREGADO]", pdf_url)
-            enlaces.append(urljoin(url, href))       # Añadir enlace a la lista
+        print(f" → PDF en div.export encontrados: {len(encontrados)}")
 
-        return enlaces
+        return self._filtrar_enlaces(url, encontrados)
+
+    # --------------------------------------------
+    # Extraer enlaces de una categoría (API asíncrona, en su propio contexto)
+    # --------------------------------------------
+    async def _extraer_enlaces_categoria_async(self, navegador, tipo_id, semaforo):
+        async with semaforo:                        # Limitar las categorías abiertas a la vez
+            url = self._url_categoria(tipo_id)
+            selector = self._selector_categoria(tipo_id)
+            print(f"\n=== CATEGORÍA {tipo_id} === Visitando: {url}")
+
+            # Vía rápida: HTML estático, sin navegador
+            estatico = await asyncio.to_thread(self._leer_categoria_estatica, tipo_id)
+            if estatico is not None:
+                return self._filtrar_enlaces(url, estatico)
+
+            browser = await navegador()
+            context = await browser.new_context()
+            if self.bloqueo:
+                await self.bloqueo.aplicar_async(context)
+            try:
+                page = await context.new_page()
+                try:
+                    await page.goto(url, timeout=60000, wait_until="load")
+                    print(f" → Categoría {tipo_id}: página cargada correctamente.")
+                except Exception as e:
+                    print(f" ❌ ERROR en goto() categoría {tipo_id}:", e)
+                    raise e  # <-- Propaga el error real
+
+                try:
+                    await page.wait_for_selector(selector, timeout=30000)
+                except AsyncTimeoutError:
+                    print(f" ⚠ Categoría {tipo_id}: selector no apareció: {selector} — continuando igual…")
+
+                encontrados = hrefs(await recolectar_enlaces_async(page, selector))
+                print(f" → Categoría {tipo_id}: PDF encontrados: {len(encontrados)}")
+            finally:
+                await context.close()
+
+        return self._filtrar_enlaces(url, encontrados)
+
+    async def _extraer_categoria_segura_async(self, navegador, tipo_id, semaforo, fallidas):
+        # Una categoría que falla se registra y no descarta los enlaces de las demás
+        try:
+            return await self._extraer_enlaces_categoria_async(navegador, tipo_id, semaforo)
+        except Exception as e:
+            print(f" ❌ ERROR: Categoría {tipo_id} falló, se continúa con las demás: {e}")
+            fallidas.append(tipo_id)
+            return []
+
+    async def _extraer_categorias_async(self, max_concurrencia, progreso=None):
+        semaforo = asyncio.Semaphore(max(1, max_concurrencia))
+        async with async_playwright() as play:
+            browser = None
+            lock_navegador = asyncio.Lock()
+
+            async def navegador():
+                # Chromium se lanza solo si alguna categoría no se pudo leer sin él
+                nonlocal browser
+                async with lock_navegador:
+                    if browser is None:
+                        browser = await play.chromium.launch(headless=self.headless)
+                return browser
+
+            fallidas = []
+            tareas = [asyncio.create_task(self._extraer_categoria_segura_async(navegador, tipo_id, semaforo, fallidas))
+                      for tipo_id in self.categorias.keys()]
+            try:
+                enlaces = []
+                procesadas = 0
+                for tarea in asyncio.as_completed(tareas):
+                    enlaces.extend(await tarea)
+                    procesadas += 1
+                    if progreso:
+                        try:
+                            progreso({"procesadas": procesadas, "total": len(tareas), "enlaces": len(enlaces)})
+                        except Exception as e:
+                            print(f" ⚠ Progreso interrumpió la extracción ({e}); "
+                                  f"se retornan los {len(enlaces)} enlaces ya recolectados")
+                            break
+                if fallidas:
+                    print(" ⚠ Categorías con error:", sorted(fallidas))
+                return enlaces
+            finally:
+                # Cancelar y esperar las categorías pendientes antes de cerrar el navegador
+                for tarea in tareas:
+                    tarea.cancel()
+                await asyncio.gather(*tareas, return_exceptions=True)
+                if browser:
+                    await browser.close()
+                if self.lector_html:
+                    print(" → Categorías sin navegador:", self.lector_html.estadisticas())
+                if self.bloqueo:
+                    print(" → Peticiones en modo ligero:", self.bloqueo.estadisticas())
 
     # --------------------------------------------
     # Extraer enlaces de todas las categorías
     # --------------------------------------------
-    def extraer_todos_los_enlaces(self):
-        self.start()
-        enlaces = []
+    def extraer_todos_los_enlaces(self, max_concurrencia=3, progreso=None):
+        """
+        Extrae los enlaces PDF de todas las categorías, visitando hasta `max_concurrencia`
+        a la vez (un contexto de navegador por categoría)
+
+        Args:
+            max_concurrencia: Categorías cargadas en paralelo
+            progreso: Función opcional llamada al terminar cada categoría con
+                      {'procesadas', 'total', 'enlaces'}; si lanza una excepción, las
+                      categorías pendientes se cancelan y se retornan los enlaces ya recolectados
 
-        
-        # Iterar sobre todas las categorías
-        for tipo_id in self.categorias.keys():
-            encontrados = self._extraer_enlaces_categoria(tipo_id)
-            enlaces.extend(encontrados)
-        
+        Returns:
+            Lista de enlaces sin duplicados; una categoría que falla se registra y se omite
+        """
+        enlaces = asyncio.run(self._extraer_categorias_async(max_concurrencia, progreso))
 
         # Una sola categoría (para pruebas)
+        #self.start()
         #enlaces = self._extraer_enlaces_categoria(5)
-
-        self.stop()
+        #self.stop()
 
         # eliminar duplicados
         enlaces = list(set(enlaces))
@@ -120,69 +280,56 @@ class WebScrapingMinAgricultura:
         return enlaces
 
     # --------------------------------------------
-    # Descargar archivos PDF con requests
+    # Descargar archivos PDF en paralelo (sesión HTTP compartida)
     # --------------------------------------------
-    def descargar_archivos(self, enlaces, upload_dir):
+    def descargar_archivos(self, enlaces, upload_dir, progreso=None, max_workers=8, max_por_host=4, reintentos=4,
+                           manifiesto=None):
+        """
+        Descarga los PDF de `enlaces` en `upload_dir`, varios a la vez
+
+        Args:
+            enlaces: Lista de URLs
+            upload_dir: Carpeta destino
+            progreso: Función opcional llamada al inicio, tras cada archivo y al final con
+                      {'procesados', 'total', 'descargados', 'errores'}; si lanza una
+                      excepción, la descarga se detiene
+            max_workers: Descargas simultáneas
+            max_por_host: Descargas simultáneas contra el mismo servidor
+            reintentos: Reintentos por archivo (errores de red, HTTP 429/5xx, archivo truncado)
+            manifiesto: ManifiestoDescargas opcional; los archivos ya descargados se piden de
+                        forma condicional y se omiten si no cambiaron
+
+        Returns:
+            {'total', 'descargados', 'sin_cambios', 'errores', 'archivos'}, donde 'archivos'
+            son las rutas de todos los archivos válidos en disco (descargados o sin cambios)
+        """
         total = len(enlaces)
-        descargados = 0
-        errores = 0
 
         print("\n===== INICIANDO DESCARGAS =====")
-        print(f"Total de enlaces a procesar: {total}\n")
+        print(f"Total de enlaces a procesar: {total} ({max_workers} en paralelo, {max_por_host} por host)\n")
 
-        for i, url in enumerate(enlaces, start=1):
-            try:
-                nombre_archivo = url.split("/")[-1].replace("%20", "_")
-                ruta_destino = os.path.join(upload_dir, nombre_archivo)
-
-                print(f"[Descargando archivo {i} / {total}]: {url}")
-                print(f" → Guardar como: {nombre_archivo}")
-                
-                # --- DESCARGA ROBUSTA CON STREAM ---
-                with requests.get(url, stream=True, timeout=180) as r:
-                    if r.status_code != 200:
-                        print(f"   ✖ ERROR HTTP {r.status_code}")
-                        errores += 1
-                        continue
-
-                    with open(ruta_destino, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=1024 * 32):
-                            if chunk:
-                                f.write(chunk)
-
-                # --- VALIDAR TAMAÑO ---
-                tamaño = os.path.getsize(ruta_destino)
-                if tamaño < 5000:
-                    print(f"   ✖ Archivo demasiado pequeño ({tamaño} bytes). Posible descarga incompleta.")
-                    errores += 1
-                    continue
-
-                # --- VALIDAR EOF MARKER ---
-                with open(ruta_destino, "rb") as f:
-                    f.seek(-2048, os.SEEK_END)   # Leer últimos 2KB
-                    final = f.read()
-
-                if b"%%EOF" not in final:
-                    print("   ✖ Archivo sin marcador EOF → descarga truncada.")
-                    errores += 1
-                    continue
-
-                # --- OK ---
-                print(f"   ✔ DESCARGADO ({tamaño} bytes)")
-                descargados += 1                
-
-            except Exception as e:
-                print(f"   ✖ ERROR EXCEPCIÓN: {e}")
-                errores += 1
+        descargador = DescargadorPDF(max_workers=max_workers, max_por_host=max_por_host, reintentos=reintentos,
+                                     manifiesto=manifiesto)
+        try:
+            resultado = descargador.descargar_todos(enlaces, upload_dir, progreso=progreso)
+        finally:
+            descargador.close()
+
+        descargados = resultado["descargados"]
+        sin_cambios = resultado["sin_cambios"]
+        errores = resultado["errores"]
 
         print("\n===== DESCARGAS FINALIZADAS =====")
         print(f"Total: {total}")
         print(f"Descargados: {descargados}")
+        print(f"Sin cambios: {sin_cambios}")
         print(f"Errores: {errores}")
 
         # devolver conteos al backend
         return {
             "total": total,
             "descargados": descargados,
-            "errores": errores
+            "sin_cambios": sin_cambios,
+            "errores": errores,
+            "archivos": [a['ruta'] for a in resultado["archivos"] if a['ok']]
         }
\ No newline at end of file
@@ -1,9 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for,jsonify, session, flash
+from flask import Flask, render_template, request, redirect, url_for,jsonify, session, flash, Response, stream_with_context
 from dotenv import load_dotenv
 import os
+import json
+import multiprocessing
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from Helpers import MongoDB, ElasticSearch, Funciones, WebScrapingMinAgricultura, PLN
+from Helpers import MongoDB, ElasticSearch, Funciones, WebScrapingMinAgricultura, PLN, RegistroModelos, CacheDisco, PipelineIngesta, GestorTrabajos, ContextoTrabajo, ManifiestoDescargas
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -27,6 +29,70 @@ ELASTIC_INDEX_DEFAULT   = os.getenv('ELASTIC_INDEX_DEFAULT', 'index_minagricultu
 #Carpeta de descargas
 UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'static/uploads')
 
+# Precargar modelos de PLN al importar la app (con `gunicorn --preload` se comparten entre workers)
+PLN_PRECARGAR = os.getenv('PLN_PRECARGAR', 'false').lower() == 'true'
+
+# Procesamiento PLN por lotes: documentos por lote, tamaño de lote de spaCy y procesos (-1 = todos los núcleos)
+PLN_LOTE = int(os.getenv('PLN_LOTE', '32'))
+PLN_BATCH_SIZE = int(os.getenv('PLN_BATCH_SIZE', '8'))
+PLN_N_PROCESS = int(os.getenv('PLN_N_PROCESS', '1'))
+
+# Extracción de texto de PDF en paralelo: procesos (vacío = núcleos) y segundos máximos por archivo
+PDF_WORKERS = int(os.getenv('PDF_WORKERS')) if os.getenv('PDF_WORKERS') else None
+PDF_TIMEOUT = int(os.getenv('PDF_TIMEOUT', '300'))
+
+# OCR de páginas escaneadas: resolución, procesos (vacío = núcleos) y memoria máxima en MB
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))
+OCR_WORKERS = int(os.getenv('OCR_WORKERS')) if os.getenv('OCR_WORKERS') else None
+OCR_MEMORIA_MB = int(os.getenv('OCR_MEMORIA_MB', '2048'))
+
+# Cachés en disco (SQLite) de resultados intermedios, por hash del archivo
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+CACHE_TEXTOS_MB = int(os.getenv('CACHE_TEXTOS_MB', '1024'))
+CACHE_PLN_MB = int(os.getenv('CACHE_PLN_MB', '512'))
+
+# Indexación en streaming: documentos y MB máximos por petición bulk
+ELASTIC_CHUNK_DOCS = int(os.getenv('ELASTIC_CHUNK_DOCS', '200'))
+ELASTIC_CHUNK_MB = int(os.getenv('ELASTIC_CHUNK_MB', '20'))
+
+# Pipeline de ingesta: hilos de hash y de PLN, y tamaño de las colas entre etapas
+# (la extracción usa PDF_WORKERS hilos/procesos)
+INGESTA_WORKERS_HASH = int(os.getenv('INGESTA_WORKERS_HASH', '4'))
+INGESTA_WORKERS_PLN = int(os.getenv('INGESTA_WORKERS_PLN', '1'))
+INGESTA_TAMANO_COLA = int(os.getenv('INGESTA_TAMANO_COLA', '64'))
+
+# Descubrimiento de enlaces: categorías del MinAgricultura cargadas en paralelo con Playwright
+SCRAPING_CONCURRENCIA = int(os.getenv('SCRAPING_CONCURRENCIA', '3'))
+
+# Modo ligero de Playwright: bloquear imágenes, multimedia, fuentes y CSS (y scripts de otros dominios,
+# salvo los de SCRAPING_DOMINIOS_PERMITIDOS, separados por coma)
+SCRAPING_MODO_LIGERO = os.getenv('SCRAPING_MODO_LIGERO', 'true').lower() == 'true'
+SCRAPING_BLOQUEAR_SCRIPTS_TERCEROS = os.getenv('SCRAPING_BLOQUEAR_SCRIPTS_TERCEROS', 'true').lower() == 'true'
+SCRAPING_DOMINIOS_PERMITIDOS = [d.strip() for d in os.getenv('SCRAPING_DOMINIOS_PERMITIDOS', '').split(',') if d.strip()]
+
+# Vía estática: leer primero el HTML con un GET plano y abrir el navegador solo si no trae los enlaces esperados
+SCRAPING_VIA_ESTATICA = os.getenv('SCRAPING_VIA_ESTATICA', 'true').lower() == 'true'
+
+# Filtro de enlaces PDF: la URL debe contener alguno de SCRAPING_FILTRO_INCLUIR y ninguno de
+# SCRAPING_FILTRO_EXCLUIR (textos separados por coma, sin distinguir mayúsculas)
+SCRAPING_FILTRO_INCLUIR = [t.strip() for t in os.getenv('SCRAPING_FILTRO_INCLUIR', '/Normatividad/').split(',') if t.strip()]
+SCRAPING_FILTRO_EXCLUIR = [t.strip() for t in os.getenv('SCRAPING_FILTRO_EXCLUIR', '').split(',') if t.strip()]
+
+# Descarga de PDF: descargas simultáneas en total y por servidor, y reintentos por archivo
+DESCARGAS_WORKERS = int(os.getenv('DESCARGAS_WORKERS', '8'))
+DESCARGAS_POR_HOST = int(os.getenv('DESCARGAS_POR_HOST', '4'))
+DESCARGAS_REINTENTOS = int(os.getenv('DESCARGAS_REINTENTOS', '4'))
+
+# Manifiesto de descargas (URL, ETag, Last-Modified, tamaño, sha256): solo se transfieren los PDF nuevos o modificados
+DESCARGAS_MANIFIESTO = os.getenv('DESCARGAS_MANIFIESTO', os.path.join(CACHE_DIR, 'descargas.sqlite'))
+
+# Trabajos en segundo plano (scraping e ingesta): base SQLite y procesos worker que lanza `python app.py`.
+# Importar el módulo (gunicorn, recargador de Flask) no lanza workers: en ese caso se ejecuta aparte `python worker.py`
+TRABAJOS_DB = os.getenv('TRABAJOS_DB', os.path.join(CACHE_DIR, 'trabajos.sqlite'))
+TRABAJOS_WORKERS = int(os.getenv('TRABAJOS_WORKERS', '1'))
+# Duración máxima de cada conexión SSE de progreso: luego el navegador se reconecta y libera el worker web
+TRABAJOS_SSE_DURACION_MAX = float(os.getenv('TRABAJOS_SSE_DURACION_MAX', '30'))
+
 # Versión de la aplicación
 VERSION_APP = "2.0.0"
 CREATOR_APP = "JuanCDG"
@@ -35,6 +101,15 @@ CREATOR_APP = "JuanCDG"
 mongo = MongoDB(MONGO_URI, MONGO_DB)
 elastic = ElasticSearch(ELASTIC_CLOUD_URL, ELASTIC_API_KEY)
 
+# Las cachés abren su conexión SQLite en el primer uso, una por proceso (también en los workers)
+cache_textos = CacheDisco(os.path.join(CACHE_DIR, 'textos.sqlite'), max_mb=CACHE_TEXTOS_MB)
+cache_pln = CacheDisco(os.path.join(CACHE_DIR, 'pln.sqlite'), max_mb=CACHE_PLN_MB)
+
+gestor_trabajos = GestorTrabajos(TRABAJOS_DB)
+
+if PLN_PRECARGAR:
+    PLN(cargar_modelos=True)
+
 # ==================== RUTAS ====================
 @app.route('/')
 def landing():
@@ -479,9 +554,9 @@ def procesar_zip_elastic():
         if not index:
             return jsonify({'success': False, 'error': 'Índice no especificado'}), 400
         
-        # Guardar archivo ZIP temporalmente
+        # Guardar archivo ZIP temporalmente (en su propia carpeta: no debe borrar los PDF descargados)
         filename = secure_filename(file.filename)
-        carpeta_upload = 'static/uploads'
+        carpeta_upload = os.path.join(UPLOAD_DIR, 'zip')
         Funciones.crear_carpeta(carpeta_upload)
         Funciones.borrar_contenido_carpeta(carpeta_upload)
         
@@ -507,9 +582,170 @@ def procesar_zip_elastic():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     
+def crear_pipeline_ingesta(index: str, pln: PLN, progreso=None) -> PipelineIngesta:
+    """Crea el pipeline de ingesta (hash → filtro → extracción → PLN → indexación) con la configuración del entorno"""
+    return PipelineIngesta(
+        elastic, index, pln,
+        cache_textos=cache_textos,
+        cache_pln=cache_pln,
+        workers_hash=INGESTA_WORKERS_HASH,
+        workers_extraccion=PDF_WORKERS,
+        workers_pln=INGESTA_WORKERS_PLN,
+        tamano_cola=INGESTA_TAMANO_COLA,
+        lote_pln=PLN_LOTE,
+        batch_size_pln=PLN_BATCH_SIZE,
+        n_process_pln=PLN_N_PROCESS,
+        timeout_pdf=PDF_TIMEOUT,
+        ocr_dpi=OCR_DPI,
+        ocr_workers=OCR_WORKERS,
+        ocr_memoria_mb=OCR_MEMORIA_MB,
+        chunk_docs=ELASTIC_CHUNK_DOCS,
+        chunk_mb=ELASTIC_CHUNK_MB,
+        progreso=progreso
+    )
+
+def trabajo_cargar_documentos(parametros: dict, trabajo: ContextoTrabajo) -> dict:
+    """Trabajo en segundo plano: carga a Elastic los archivos seleccionados (JSON del ZIP o PDF con PLN)"""
+    archivos = parametros['archivos']
+    index = parametros['index']
+    metodo = parametros.get('metodo', 'zip')
+
+    print("\n===== CARGAR DOCUMENTOS ELASTIC =====")
+    print("Archivos recibidos:", len(archivos))
+    print("Índice seleccionado:", index)
+
+    documentos = []
+
+    if metodo == 'zip':
+        # Cargar archivos JSON directamente
+        for i, archivo in enumerate(archivos, start=1):
+            trabajo.verificar_cancelacion()
+            ruta = archivo.get('ruta')
+            print(f"Procesando archivo JSON: {ruta}")
+            if ruta and os.path.exists(ruta):
+                doc = Funciones.leer_json(ruta)
+                if doc:
+                    documentos.append(doc)
+            trabajo.progreso('lectura', {'procesados': i, 'total': len(archivos)},
+                             avance={'lectura': (i, len(archivos))})
+
+    elif metodo == 'webscraping':
+        # Procesar archivos con PLN en el pipeline por etapas:
+        # hash → filtro de duplicados → extracción → PLN → indexación (en paralelo, colas acotadas)
+        pln = PLN(cargar_modelos=True)     # los modelos se cargan una sola vez por proceso
+        pipeline = crear_pipeline_ingesta(index, pln)
+
+        def progreso(etapa, estadisticas):
+            trabajo.progreso(etapa, estadisticas, avance=pipeline.avance(estadisticas))
+            if trabajo.cancelado():
+                pipeline.cancelar()
+
+        pipeline.progreso = progreso
+        resultado = pipeline.ejecutar(archivos)
+        pln.close()
+
+        if not resultado['success']:
+            raise RuntimeError(resultado.get('error') or 'Error indexando documentos')
+
+        return {
+            'success': True,
+            'indexados': resultado['indexados'],
+            'duplicados': resultado['duplicados'] + resultado['etapas']['duplicados'],
+            'errores': resultado['fallidos'],
+            'etapas': resultado['etapas']
+        }
+
+    # Si no hay documentos a insertar en elastic, terminar sin error
+    if not documentos:
+        print("No hay documentos nuevos para procesar (todos duplicados).")
+        return {'success': True, 'indexados': 0, 'duplicados': 0, 'errores': 0}
+
+    # Indexar documentos en Elastic (en streaming, por bloques de ELASTIC_CHUNK_MB)
+    resultado = elastic.indexar_streaming(index, documentos,
+                                          chunk_size=ELASTIC_CHUNK_DOCS,
+                                          max_chunk_bytes=ELASTIC_CHUNK_MB * 1024 * 1024,
+                                          progreso=lambda r: trabajo.progreso(
+                                              'indexados', r, avance={'indexacion': (r['procesados'], len(documentos))}))
+    print("Resultado de indexación:", resultado)
+
+    if not resultado['success']:
+        raise RuntimeError(resultado.get('error') or 'Error indexando documentos')
+
+    return {
+        'success': resultado['success'],
+        'indexados': resultado['indexados'],
+        'duplicados': resultado['duplicados'],
+        'errores': resultado['fallidos']
+    }
+
+def trabajo_webscraping(parametros: dict, trabajo: ContextoTrabajo) -> dict:
+    """Trabajo en segundo plano: web scraping dinámico y descarga de PDFs"""
+    # 1. Crear scraper
+    scraper = WebScrapingMinAgricultura(parametros['url'],
+                                        modo_ligero=SCRAPING_MODO_LIGERO,
+                                        bloquear_scripts_terceros=SCRAPING_BLOQUEAR_SCRIPTS_TERCEROS,
+                                        dominios_permitidos=SCRAPING_DOMINIOS_PERMITIDOS,
+                                        via_estatica=SCRAPING_VIA_ESTATICA,
+                                        incluir_enlaces=SCRAPING_FILTRO_INCLUIR,
+                                        excluir_enlaces=SCRAPING_FILTRO_EXCLUIR)
+
+    # 2. Crear si no existe carpeta uploads (no se limpia: el manifiesto indica qué archivos siguen vigentes)
+    Funciones.crear_carpeta(UPLOAD_DIR)
+
+    # 3. EXTRAER ENLACES (categorías en paralelo)
+    def progreso_enlaces(datos):
+        trabajo.progreso('enlaces', datos, avance={'enlaces': (datos['procesadas'], datos['total'])})
+        trabajo.verificar_cancelacion()
+
+    trabajo.progreso('enlaces', {}, forzar=True)
+    enlaces = scraper.extraer_todos_los_enlaces(max_concurrencia=SCRAPING_CONCURRENCIA, progreso=progreso_enlaces)
+    trabajo.verificar_cancelacion()
+
+    # 4. DESCARGAR ARCHIVOS en paralelo (la cancelación detiene las descargas en curso)
+    def progreso(datos):
+        trabajo.progreso('descarga', datos, avance={'descarga': (datos['procesados'], datos['total'])})
+        trabajo.verificar_cancelacion()
+
+    manifiesto = ManifiestoDescargas(DESCARGAS_MANIFIESTO)
+    try:
+        resultado_descarga = scraper.descargar_archivos(enlaces, UPLOAD_DIR, progreso=progreso,
+                                                        max_workers=DESCARGAS_WORKERS,
+                                                        max_por_host=DESCARGAS_POR_HOST,
+                                                        reintentos=DESCARGAS_REINTENTOS,
+                                                        manifiesto=manifiesto)
+    finally:
+        manifiesto.close()
+
+    # 5. ARCHIVOS A INGERIR: todos los vigentes, también los sin cambios (su ingesta anterior pudo
+    #    fallar o cancelarse); la ingesta descarta por hash los que ya están en el índice
+    archivos = []
+    for ruta in resultado_descarga['archivos']:
+        nombre = os.path.basename(ruta)
+        extension = os.path.splitext(nombre)[1].lower().replace('.', '')
+        if extension == 'pdf' and os.path.isfile(ruta):
+            archivos.append({'nombre': nombre, 'ruta': ruta, 'extension': extension,
+                             'tamaño': os.path.getsize(ruta)})
+
+    return {
+        "success": True,
+        "archivos": archivos,
+        "mensaje": (f"Se descargaron {resultado_descarga['descargados']} archivos nuevos o modificados; "
+                    f"{resultado_descarga['sin_cambios']} sin cambios ({len(archivos)} archivos para cargar; "
+                    f"los ya indexados se omiten)"),
+        "stats": {
+            "total_enlaces": resultado_descarga["total"],
+            "descargados": resultado_descarga["descargados"],
+            "sin_cambios": resultado_descarga["sin_cambios"],
+            "errores": resultado_descarga["errores"]
+        }
+    }
+
+gestor_trabajos.registrar('cargar_documentos', trabajo_cargar_documentos)
+gestor_trabajos.registrar('webscraping', trabajo_webscraping)
+
 @app.route('/cargar-documentos-elastic', methods=['POST'])
 def cargar_documentos_elastic():
-    """API para cargar documentos a ElasticSearch"""
+    """API para cargar documentos a ElasticSearch (encola el trabajo y responde con su id)"""
     try:
         if not session.get('logged_in'):
             return jsonify({'success': False, 'error': 'No autorizado'}), 401
@@ -523,165 +759,13 @@ def cargar_documentos_elastic():
         index = data.get('index')
         metodo = data.get('metodo', 'zip')
 
-        print("\n===== CARGAR DOCUMENTOS ELASTIC =====")
-        print("Archivos recibidos:", len(archivos))
-        print("Índice seleccionado:", index)
-        
         if not archivos or not index:
             return jsonify({'success': False, 'error': 'Archivos e índice son requeridos'}), 400
-        
-        documentos = []
-        
-        if metodo == 'zip':
-            # Cargar archivos JSON directamente
-            for archivo in archivos:
-                ruta = archivo.get('ruta')
-                print(f"Procesando archivo JSON: {ruta}")
-                if ruta and os.path.exists(ruta):
-                    doc = Funciones.leer_json(ruta)
-                    print(doc)
-                    if doc:
-                        documentos.append(doc)
-        
-        elif metodo == 'webscraping':
-            # Procesar archivos con PLN
-            
-            # 1. Filtrar archivos nuevos (no duplicados)
-            archivos_filtrados = []
-            
-            for archivo in archivos:
-                # verificar que el archivo exista
-                ruta = archivo.get('ruta')
-                print(f"--- Verificando archivo: {ruta}")
-                if not ruta or not os.path.exists(ruta):
-                    print(f"   ✖ Archivo no encontrado: {ruta}")
-                    continue
-
-                # Calcular hash del archivo PDF
-                hash_archivo = Funciones.calcular_hash_archivo(ruta)
-                if not hash_archivo:
-                    print(f"Error calculando hash del archivo {ruta}. Se omite.")
-                    continue
-
-                # Validar si el hash ya existe en Elastic
-                if elastic.existe_hash(hash_archivo, index):
-                    print(f"Documento ya indexado (hash duplicado): {ruta}")
-                    continue
-                archivo['hash_archivo'] = hash_archivo                  # agregar hash al diccionario del archivo
-                archivos_filtrados.append(archivo)       
-                
-            # Si no hay archivos nuevos, retornar
-            if not archivos_filtrados:
-                print("No hay archivos nuevos para procesar.")
-                return jsonify({'success': True, 'indexados': 0, 'errores': 0})
-            
-            # Cargar PLN (LENTO)
-            pln = PLN(cargar_modelos=True)
-
-            total_archivos = len(archivos_filtrados)
-            print(f"\nTotal de archivos a procesar con PLN: {total_archivos}")
-
-            for i, archivo in enumerate(archivos_filtrados, start=1):
-                # ----- Extracción de texto -----
-                ruta = archivo.get('ruta')
-                hash_archivo = archivo.get('hash_archivo')
-                print(f"\n--- Procesando archivo [{i} / {total_archivos}]: {ruta} ---")
-                # Extraer texto según tipo de archivo
-                extension = archivo.get('extension', '').lower()
-
-                texto = ""
-                if extension == 'pdf':
-                    # Intentar extracción normal
-                    texto = Funciones.extraer_texto_pdf(ruta)
-                    print(f" → Texto extraído (longitud {len(texto)} caracteres): OK") 
-                    
-                    # Si no se extrajo texto, intentar con OCR
-                    if not texto or len(texto.strip()) < 100:
-                        try:
-                            texto = Funciones.extraer_texto_pdf_ocr(ruta)
-                            print(f" → Texto extraído con OCR (longitud {len(texto)} caracteres): OK")
-                        except:
-                            pass
-                
-                elif extension == 'txt':
-                    try:
-                        with open(ruta, 'r', encoding='utf-8') as f:
-                            texto = f.read()
-                    except:
-                        try:
-                            with open(ruta, 'r', encoding='latin-1') as f:
-                                texto = f.read()
-                        except:
-                            pass
-                
-                if not texto or len(texto.strip()) < 50:        # si no se extrajo texto suficiente, omitir
-                    continue
-                
-                # ------ Procesar con PLN -------
-                try:
-                    # Procesar con PLN usando chunks
-                    print(" → Procesando texto con PLN (método chunks)...")
-                    resultado_pln = pln.procesar_texto_largo(texto)
-                    print("   → Resumen generado (longitud {} caracteres)".format(len(resultado_pln.get('resumen', ''))))
-
-                    temas_pln = resultado_pln.get("temas", [])
-
-                    # Convertir lista de tuplas → lista de objetos
-                    temas_convertidos = [
-                        {"palabra": palabra, "relevancia": float(relevancia)}
-                        for palabra, relevancia in temas_pln
-                    ]
-
-                    # Extraer metadatos normativos
-                    meta = pln.extraer_metadatos_norma(texto)
-
-                    #print("fecha encontrada (raw):", meta.get("fecha_documento"))
-                    fecha_normalizada = pln.normalizar_fecha(meta.get("fecha_documento"))
-                    #print("fecha normalizada:", fecha_normalizada)
-
-                    # Crear documento
-                    documento = {
-                        "tipo_norma": meta.get("tipo_norma"),
-                        "numero_norma": meta.get("numero_norma"),
-                        "anio_norma": meta.get("anio_norma"),
-                        "entidad_emisora": meta.get("entidad_emisora"),
-                        "fecha_documento": fecha_normalizada,
-                        "titulo_norma": meta.get("titulo_norma"),    
-                        'texto': texto[:2_000_000],  # limitar tamaño para Elastic
-                        'resumen': resultado_pln.get('resumen', ''),
-                        'entidades': resultado_pln.get('entidades', {}),
-                        'temas': temas_convertidos,
-                        'ruta': ruta,
-                        'nombre_archivo': archivo.get('nombre', ''),
-                        'hash_archivo': hash_archivo,
-                        'fecha_carga': datetime.now().isoformat()
-                    }
 
-                    documentos.append(documento)      
-                                 
-                
-                except Exception as e:
-                    print(f"Error al procesar {archivo.get('nombre')}: {e}")
-                    continue
-            
-            pln.close()
-        
-        # Si no hay documentos a insertar en elastic, terminar sin error
-        if not documentos:
-            #return jsonify({'success': False, 'error': 'No se pudieron procesar documentos'}), 400
-            print("No hay documentos nuevos para procesar (todos duplicados).")
-            return jsonify({"success": True, "indexados": 0, "duplicados": 0}), 200
-        
-        # Indexar documentos en Elastic
-        print(f"\nTotal de documentos a indexar: {len(documentos)}")
-        resultado = elastic.indexar_bulk(index, documentos)
-        print("Resultado de indexación:", resultado)
-        
-        return jsonify({
-            'success': resultado['success'],
-            'indexados': resultado['indexados'],
-            'errores': resultado['fallidos']
-        })
+        job_id = gestor_trabajos.encolar('cargar_documentos',
+                                         {'archivos': archivos, 'index': index, 'metodo': metodo},
+                                         usuario=session.get('usuario'))
+        return jsonify({'success': True, 'job_id': job_id}), 202
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -689,7 +773,7 @@ def cargar_documentos_elastic():
 @app.route('/procesar-webscraping-elastic', methods=['POST'])
 def procesar_webscraping_elastic():
     """
-    Inicia el proceso de web scraping dinámico y descarga de PDFs.
+    Inicia el proceso de web scraping dinámico y descarga de PDFs (encola el trabajo y responde con su id).
     """
     # Validación de sesión
     if not session.get('logged_in'):
@@ -705,38 +789,128 @@ def procesar_webscraping_elastic():
         if not base_url:
             return jsonify({"success": False, "message": "Debe ingresar una URL válida"}), 400
 
-        # 1. Crear scraper
-        scraper = WebScrapingMinAgricultura(base_url)
+        job_id = gestor_trabajos.encolar('webscraping', {'url': base_url}, usuario=session.get('usuario'))
+        return jsonify({'success': True, 'job_id': job_id}), 202
 
-        # 2. Crear si no existe carpeta uploads y limpiar su contenido
-        Funciones.crear_carpeta(UPLOAD_DIR)
-        Funciones.borrar_contenido_carpeta(UPLOAD_DIR)
+    except Exception as e:
+        print("ERROR SCRAPING:", e)
+        return jsonify({"success": False, "message": str(e)}), 500
 
-        # 3. EXTRAER ENLACES
-        enlaces = scraper.extraer_todos_los_enlaces()
+#--------------rutas de trabajos en segundo plano - inicio-------------
+@app.route('/estado-trabajo/<job_id>')
+def estado_trabajo(job_id):
+    """API con el estado y el progreso de un trabajo"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
 
-        # 4. DESCARGAR ARCHIVOS
-        resultado_descarga = scraper.descargar_archivos(enlaces, UPLOAD_DIR)
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
 
-        # 5. LISTAR ARCHIVOS DESCARGADOS
-        archivos = Funciones.listar_archivos_carpeta(UPLOAD_DIR, ['pdf'])
+    trabajo = gestor_trabajos.obtener(job_id)
+    if not trabajo:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
 
-        return jsonify({
-            "success": True,
-            "archivos": archivos,
-            "mensaje": f"Se descargaron {len(archivos)} archivos",
-            "stats": {
-                "total_enlaces": resultado_descarga["total"],
-                "descargados": resultado_descarga["descargados"],
-                "errores": resultado_descarga["errores"]
-            }
-        })
+    return jsonify({'success': True, 'trabajo': trabajo})
 
-    except Exception as e:
-        print("ERROR SCRAPING:", e)
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "message": str(e) if str(e) else "Error en Playwright (ver consola)"}), 500
+@app.route('/eventos-trabajo/<job_id>')
+def eventos_trabajo(job_id):
+    """
+    Stream (Server-Sent Events) del progreso de un trabajo: avance por etapa
+    (descarga, hash, extracción, PLN, indexación) con velocidad y ETA, y evento
+    'fin' al terminar. Cada conexión dura como máximo TRABAJOS_SSE_DURACION_MAX
+    segundos y el navegador se reconecta (`retry`), para no ocupar un worker web
+    durante toda la ingesta. La página usa por defecto consultas a /estado-trabajo.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
+
+    if not gestor_trabajos.obtener(job_id):
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+
+    intervalo = min(max(request.args.get('intervalo', 1.0, type=float), 0.2), 10.0)
+
+    def generar():
+        yield f"retry: {int(intervalo * 1000) + 1000}\n\n"
+        for evento, datos in gestor_trabajos.eventos(job_id, intervalo=intervalo,
+                                                     duracion_max=TRABAJOS_SSE_DURACION_MAX):
+            yield f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+    return Response(stream_with_context(generar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/resultado-trabajo/<job_id>')
+def resultado_trabajo(job_id):
+    """API con el resultado de un trabajo terminado"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
+
+    trabajo = gestor_trabajos.obtener(job_id, incluir_resultado=True)
+    if not trabajo:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+
+    if trabajo['estado'] not in GestorTrabajos.ESTADOS_FINALES:
+        return jsonify({'success': False, 'error': f"El trabajo aún no termina ({trabajo['estado']})"}), 409
+
+    return jsonify({'success': True, 'trabajo': trabajo})
+
+@app.route('/cancelar-trabajo/<job_id>', methods=['POST'])
+def cancelar_trabajo(job_id):
+    """API para cancelar un trabajo pendiente o en curso"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
+
+    if not gestor_trabajos.cancelar(job_id):
+        return jsonify({'success': False, 'error': 'El trabajo no existe o ya terminó'}), 404
+
+    return jsonify({'success': True, 'mensaje': 'Cancelación solicitada'})
+
+@app.route('/listar-trabajos')
+def listar_trabajos():
+    """API con los trabajos más recientes"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
+
+    limite = request.args.get('limite', 20, type=int)
+    return jsonify({'success': True, 'trabajos': gestor_trabajos.listar(limite)})
+#--------------rutas de trabajos en segundo plano - fin-------------
+
+@app.route('/estado-modelos-pln')
+def estado_modelos_pln():
+    """
+    API que reporta los modelos de PLN cargados (tiempo de carga y memoria) y las cachés.
+
+    Los trabajos corren en los procesos worker, así que su estado se lee de lo que cada
+    worker publica en la base de trabajos; 'web' es el estado de este proceso.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    permisos = session.get('permisos', {})
+    if not permisos.get('admin_data_elastic'):
+        return jsonify({'success': False, 'error': 'No tiene permisos para cargar datos'}), 403
+
+    return jsonify({
+        'success': True,
+        'workers': gestor_trabajos.estados_workers(),
+        'web': {'pid': os.getpid(), **estado_proceso()}
+    })
 
 #--------------rutas de elasitcsearch - fin-------------
 
@@ -750,11 +924,31 @@ def admin():
     return render_template('admin.html', usuario=session.get('usuario'), permisos=session.get('permisos'))
 
 
+# ==================== TRABAJOS EN SEGUNDO PLANO ====================
+def estado_proceso():
+    """Modelos de PLN cargados y estadísticas de las cachés de este proceso"""
+    return {
+        'modelos': RegistroModelos.estadisticas(),
+        'caches': {'textos': cache_textos.estadisticas(), 'pln': cache_pln.estadisticas()}
+    }
+
+def inicializar_worker():
+    """Reabre en cada proceso worker el cliente de Elastic, que no debe compartirse tras el fork"""
+    global elastic
+    elastic = ElasticSearch(ELASTIC_CLOUD_URL, ELASTIC_API_KEY)
+    # nlp.pipe(n_process > 1) crea sus procesos con el método por defecto y lo hace con los hilos
+    # del pipeline corriendo: en los workers, que ese método no sea fork
+    multiprocessing.set_start_method(Funciones.contexto_procesos().get_start_method(), force=True)
 
 # ==================== MAIN ====================
 if __name__ == '__main__':
     # Crear carpetas necesarias
     Funciones.crear_carpeta('static/uploads')
+
+    # Workers de trabajos: solo en el proceso principal; el hijo del recargador (WERKZEUG_RUN_MAIN)
+    # vuelve a ejecutar este bloque y no debe lanzar otros que lean la misma cola
+    if TRABAJOS_WORKERS > 0 and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        gestor_trabajos.iniciar_workers(TRABAJOS_WORKERS, inicializar=inicializar_worker, estado=estado_proceso)
     
     # Verificar conexiones
     print("\n" + "="*50)
@@ -0,0 +1,22 @@
+"""
+Worker de trabajos en segundo plano (web scraping e ingesta a Elastic).
+
+Uso:
+    python worker.py [n_procesos]
+
+Necesario cuando la app corre con gunicorn (o cualquier servidor que la importe):
+importar app.py no lanza workers, así que los trabajos los ejecuta solo este proceso.
+"""
+import sys
+
+import app
+
+if __name__ == '__main__':
+    n_procesos = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    procesos = app.gestor_trabajos.iniciar_workers(n_procesos, inicializar=app.inicializar_worker,
+                                                    estado=app.estado_proceso)
+    try:
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        print("Deteniendo workers...")